@@ -1,11 +1,18 @@
 import streamlit as st
 
+from leakage.prewarm import start_prewarm
+
 # ---------------- PAGE CONFIG ----------------
 st.set_page_config(
     page_title="Profit Leakage Detection System",
     layout="wide"
 )
 
+# Load the dataset and draw the analysis pages' default views in the
+# background while this page is read (a no-op when app/serve.py already
+# did at boot)
+start_prewarm()
+
 # ---------------- TITLE ----------------
 st.markdown(
     """
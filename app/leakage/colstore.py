@@ -0,0 +1,144 @@
+"""Memory-mapped column files shared by every server process on a host.
+
+The cleaned dataset is exported once per dataset version to a directory
+of ``.npy`` files, one per column. Numeric and date columns are stored as
+their NumPy arrays, categorical columns as their integer codes with the
+categories listed in ``_meta.json``. Each process maps the files
+read-only and wraps them in a DataFrame without copying, so all replicas
+read one physical copy from the OS page cache and a new worker skips
+Parquet decoding as well as CSV parsing.
+
+The arrays of the indexes built over the data (the slider range index's
+sorted orders, the id lookups' CSR maps) are exported beside the columns
+and mapped the same way, so a new worker sorts nothing either.
+
+Version directories are never modified once written: an export is built
+in a temporary directory and renamed into place, and a process that
+still maps an older version keeps its files alive after they are pruned.
+Pruning leaves every export superseded within a grace period, for
+processes that have not switched yet.
+"""
+
+import json
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+META_FILE = "_meta.json"
+
+# Older exports kept next to the current one, for processes still mapping them.
+KEEP_VERSIONS = 1
+
+
+def export_columns(frame, directory, indexes=None):
+    """Write ``frame`` as column files into ``directory``.
+
+    ``indexes`` maps index names to their arrays by name, written beside
+    the columns for :func:`open_indexes`. The files are written to a
+    sibling temporary directory first and renamed into place. When
+    another process finished the same export first, its directory is
+    kept and this one is discarded.
+    """
+    directory = Path(directory)
+    tmp = directory.with_name(f".{directory.name}.{uuid.uuid4().hex[:8]}")
+    tmp.mkdir(parents=True)
+    columns = []
+    try:
+        for i, col in enumerate(frame.columns):
+            values = frame[col]
+            entry = {"name": col, "file": f"{i:03d}.npy"}
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                entry["categories"] = values.cat.categories.tolist()
+                array = values.array.codes
+            else:
+                array = values.to_numpy()
+            np.save(tmp / entry["file"], np.ascontiguousarray(array))
+            columns.append(entry)
+        files = {}
+        for index, arrays in (indexes or {}).items():
+            files[index] = {}
+            for name, array in arrays.items():
+                file = f"{index}.{name}.npy"
+                np.save(tmp / file, np.ascontiguousarray(array))
+                files[index][name] = file
+        (tmp / META_FILE).write_text(json.dumps({
+            "rows": len(frame), "columns": columns, "indexes": files,
+        }))
+        try:
+            tmp.rename(directory)
+        except OSError:
+            if not (directory / META_FILE).exists():
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return directory
+
+
+def open_columns(directory):
+    """Map the column files in ``directory`` as a read-only DataFrame.
+
+    No column is copied: numeric columns are views of the mapped files and
+    categorical columns are built on their mapped codes. Like any shared
+    frame, the result must be treated as read-only.
+    """
+    directory = Path(directory)
+    meta = json.loads((directory / META_FILE).read_text())
+    data = {}
+    for entry in meta["columns"]:
+        # A plain ndarray view, so the memmap subclass does not leak into
+        # pandas results.
+        array = np.asarray(np.load(directory / entry["file"], mmap_mode="r"))
+        if "categories" in entry:
+            array = pd.Series(pd.Categorical.from_codes(
+                array, entry["categories"], validate=False
+            ), copy=False)
+        data[entry["name"]] = array
+    return pd.DataFrame(data, copy=False)
+
+
+def open_indexes(directory):
+    """Map the index arrays exported in ``directory``, read-only.
+
+    Returns ``{index: {name: array}}`` as given to :func:`export_columns`,
+    empty for an export written without indexes.
+    """
+    directory = Path(directory)
+    meta = json.loads((directory / META_FILE).read_text())
+    return {
+        index: {
+            name: np.asarray(np.load(directory / file, mmap_mode="r"))
+            for name, file in files.items()
+        }
+        for index, files in meta.get("indexes", {}).items()
+    }
+
+
+def prune_versions(root, current, keep=KEEP_VERSIONS, grace=0.0):
+    """Delete old exports under ``root``, keeping ``current``.
+
+    Directories are ordered by mtime, and each older one counts as
+    superseded when the next newer one was written. Besides ``current``,
+    the ``keep`` newest others are kept, and so is every export
+    superseded less than ``grace`` seconds ago: a process that has not
+    polled since may still be reading it.
+    """
+    root = Path(root)
+    if not root.exists():
+        return
+    versions = sorted(
+        ((path.stat().st_mtime_ns, path) for path in root.iterdir()
+         if path.is_dir() and not path.name.startswith(".")),
+        reverse=True,
+    )
+    cutoff = time.time_ns() - int(grace * 1e9)
+    older = 0
+    for (superseded, _), (_, path) in zip(versions, versions[1:]):
+        if path.name == current:
+            continue
+        older += 1
+        if older > keep and superseded < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
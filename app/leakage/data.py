@@ -0,0 +1,334 @@
+"""Shared, process-wide access to the cleaned leakage dataset.
+
+Every page reads the data through :func:`load_snapshot` instead of parsing
+the CSV itself, so the server holds a single typed copy of the data. That
+copy is memory-mapped from column files (:mod:`leakage.colstore`), so
+replicas on the same host share it as well, together with the arrays of
+the range and id indexes built over it.
+
+A :class:`Snapshot` bundles the data of one dataset version with every
+index and aggregate built from it. A background thread (see
+:mod:`leakage.refresh`) loads the next snapshot when the dataset changes
+on disk and swaps it in atomically, so pages never see a mix of versions.
+"""
+
+import os
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+import streamlit as st
+
+from .colstore import export_columns, open_columns, open_indexes, prune_versions
+from .cube import CUBE_FILE, LeakageCube
+from .figcache import FigureCache
+from .filters import RangeIndex, intersect
+from .lookup import EntityIndex, EntitySearch
+from .refresh import DEFAULT_INTERVAL, SnapshotManager
+from .rollups import ENTITY_COLUMNS, ROLLUP_FILE, EntityRollup
+from .scan import DatasetScanner
+from .selection import FrameSelection, ScanSelection
+from .scoring import SCORE_COLUMNS, SCORES_FILE, SEGMENT_COLUMNS, SegmentScores
+from .schema import CLEANED_CSV, CLEANED_PARQUET, COLUMN_DIR, optimize_dtypes
+from .state import ResultCache, SelectionCache, predicate_key
+from .stats import STATS_FILE, STATS_TMP_FILE
+from .versions import current_version, retire_versions, version_path
+
+# "memory" holds the whole dataset in RAM; "scan" answers the page filters
+# from the Parquet partitions with pushdown (:mod:`leakage.scan`).
+BACKEND = os.environ.get("LEAKAGE_BACKEND", "memory").strip().lower()
+
+# Seconds between checks for a new dataset version; 0 turns refresh off.
+REFRESH_INTERVAL = float(
+    os.environ.get("LEAKAGE_REFRESH_SECONDS", DEFAULT_INTERVAL)
+)
+
+# Seconds a superseded dataset version and its column export are kept
+# after the next one appears, for processes that have not switched yet
+# (two polls plus a load). Defaults to four refresh intervals.
+RETIRE_GRACE = float(os.environ.get(
+    "LEAKAGE_RETIRE_SECONDS", 4 * max(REFRESH_INTERVAL, DEFAULT_INTERVAL)
+))
+
+
+def read_dataset(parquet_path=CLEANED_PARQUET, csv_path=CLEANED_CSV):
+    """Read the cleaned dataset from Parquet, converting the CSV if needed.
+
+    When only the legacy CSV exists it is parsed once, typed, and written
+    next to it as Parquet so the next cold start skips CSV parsing.
+    """
+    if parquet_path.exists():
+        return optimize_dtypes(pd.read_parquet(parquet_path))
+
+    df = optimize_dtypes(pd.read_csv(csv_path))
+    try:
+        df.to_parquet(parquet_path, index=False)
+    except OSError:
+        # Read-only deployments still work, they just keep paying the parse.
+        pass
+    return df
+
+
+def dataset_version(path=CLEANED_PARQUET):
+    """Identifier that changes whenever the on-disk dataset changes.
+
+    A dataset published by the pipeline is identified by the name of the
+    version its symlink points to (:mod:`leakage.versions`). Otherwise the
+    identifier is the latest modification time of its files.
+    """
+    version = current_version(path)
+    if version is not None:
+        return version
+    if not path.exists():
+        path = CLEANED_CSV
+    stamps = [path.stat().st_mtime_ns]
+    if path.is_dir():
+        for root, _, files in os.walk(path):
+            # The EDA statistics cache (and its temp file while it is
+            # written) is derived, not part of the data.
+            stamps.extend(
+                os.stat(os.path.join(root, f)).st_mtime_ns
+                for f in files if f not in (STATS_FILE, STATS_TMP_FILE)
+            )
+    return f"{max(stamps):x}"
+
+
+def build_indexes(frame):
+    """Arrays of the range index and of every id index over ``frame``."""
+    indexes = {"range": RangeIndex(frame).arrays()}
+    for col in ENTITY_COLUMNS:
+        indexes[col] = EntityIndex(frame[col].to_numpy()).arrays()
+    return indexes
+
+
+def map_dataset(parquet_path=CLEANED_PARQUET, csv_path=CLEANED_CSV,
+                column_dir=COLUMN_DIR, version=None):
+    """Map the current dataset version's column and index files.
+
+    The first process to see a new dataset version reads it once, builds
+    its indexes (:func:`build_indexes`) and exports both; every other
+    process maps the same files. When the export cannot be written
+    (read-only deployments) the frame and arrays built for it are
+    returned instead, unshared. ``version`` defaults to the dataset's
+    :func:`dataset_version`.
+
+    Returns ``(frame, indexes)``. ``indexes`` is empty for an export
+    written before indexes were exported with it.
+    """
+    if version is None:
+        version = dataset_version(parquet_path)
+    directory = column_dir / version
+    if not directory.exists():
+        df = read_dataset(parquet_path, csv_path)
+        indexes = build_indexes(df)
+        try:
+            export_columns(df, directory, indexes)
+        except OSError:
+            return df, indexes
+        prune_versions(column_dir, version, grace=RETIRE_GRACE)
+    return open_columns(directory), open_indexes(directory)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """The dataset of one version and everything derived from it.
+
+    ``data`` is the shared frame, or ``None`` with the scan backend, where
+    ``scanner`` answers the filters instead. ``range_index`` is the
+    scanner in that case, which serves slider bounds the same way, and
+    ``entity_indexes`` hold the id search only (:class:`EntitySearch`).
+    Snapshots are never modified; callers must treat the frame and every
+    index as read-only.
+    """
+
+    version: str
+    loaded_at: float
+    data: object
+    scanner: object
+    range_index: object
+    cube: LeakageCube
+    rollups: dict
+    entity_indexes: dict
+    segment_scores: SegmentScores
+    selections: SelectionCache
+
+    def select(self, ranges, columns, entities=None):
+        """The rows kept by a page's filters, as a selection.
+
+        ``ranges`` maps slider columns to inclusive bounds and ``entities``
+        id columns to selected ids. ``columns`` is the page's
+        ``PAGE_COLUMNS``: every column it shows, charts or flags on, and
+        all the scan backend reads. The selection's ``narrowed`` is false
+        when no filter applied, so the cube can answer its KPIs.
+
+        In memory the rows are resolved through the range and entity
+        indexes into a :class:`FrameSelection`, a slice of the shared
+        dataset. Resolved rows are kept in ``selections``, shared by every
+        session on this snapshot: a repeated filter set reuses its rows,
+        and a narrower one checks only its own predicates on the cached
+        rows it refines. With the scan backend the filters become one
+        Arrow predicate of a :class:`ScanSelection`, which reads no rows
+        until the page asks for them; ``selections`` keeps it, with its
+        row counts, per filter set and page columns.
+        """
+        entities = {col: ids for col, ids in (entities or {}).items() if ids}
+        if self.data is None:
+            key = predicate_key(self.scanner.normalize(ranges), entities)
+            cache_key = key + (tuple(columns),)
+            selection = self.selections.get(cache_key)
+            if selection is None:
+                selection = ScanSelection(
+                    self.scanner, self.scanner.predicate(ranges, entities),
+                    columns, narrowed=key != ((), ()),
+                )
+                self.selections.put(cache_key, selection)
+            return selection
+
+        key = predicate_key(self.range_index.normalize(ranges), entities)
+        if key == ((), ()):
+            return FrameSelection(self.data, narrowed=False)
+        rows = self.selections.get(key)
+        if rows is None:
+            rows = self._resolve(key)
+            self.selections.put(key, rows)
+        return FrameSelection(self.data.iloc[rows])
+
+    def _resolve(self, key):
+        """Sorted row positions selected by the predicate set ``key``."""
+        ranges, entities = key
+        closest = self.selections.closest(key)
+        if closest is None:
+            rows = self.range_index.select(
+                {col: (low, high) for col, low, high in ranges}
+            )
+            done = (ranges, ())
+        else:
+            done, rows = closest
+        # Predicates the cached rows were selected by hold already
+        rows = self.range_index.refine(
+            rows, [term for term in ranges if term not in done[0]]
+        )
+        for col, ids in entities:
+            if (col, ids) not in done[1]:
+                rows = intersect(rows, self.entity_indexes[col].rows(list(ids)))
+        return rows
+
+
+def build_snapshot(version, dataset_dir=CLEANED_PARQUET, backend=BACKEND,
+                   column_dir=COLUMN_DIR):
+    """Load ``dataset_dir`` and build every index and aggregate from it.
+
+    Aggregates the pipeline keeps beside the dataset (cube, rollups,
+    segment scores) are read from their side files; when one is missing
+    (e.g. a single-file dataset) it is built from the data.
+
+    A published dataset is read from the directory of ``version`` itself,
+    not through its symlink, so the snapshot (and a scanner that opens
+    files on every query) stays on that version when the pipeline
+    publishes the next one.
+    """
+    if current_version(dataset_dir) is not None:
+        dataset_dir = version_path(dataset_dir, version)
+    if backend == "scan":
+        df = None
+        scanner = DatasetScanner(dataset_dir)
+        range_index = scanner
+
+        def columns(cols):
+            return scanner.read({}, cols)
+
+        def entity_index(col):
+            return EntitySearch.from_batches(
+                frame[col].to_numpy() for frame in scanner.batches(None, [col])
+            )
+    else:
+        df, indexes = map_dataset(
+            dataset_dir, column_dir=column_dir, version=version
+        )
+        indexes = indexes or build_indexes(df)
+        scanner = None
+        range_index = RangeIndex.from_arrays(df, indexes["range"])
+
+        def columns(cols):
+            return df[cols]
+
+        def entity_index(col):
+            return EntityIndex.from_arrays(indexes[col])
+
+    def side_file(name, load, build):
+        path = dataset_dir / name
+        return load(path) if path.exists() else build()
+
+    def whole():
+        return read_dataset(dataset_dir) if df is None else df
+
+    cube = side_file(
+        CUBE_FILE, LeakageCube.load, lambda: LeakageCube.from_frame(whole())
+    )
+    rollups = {
+        key: side_file(
+            ROLLUP_FILE.format(key), lambda path: EntityRollup.load(path, key),
+            lambda: EntityRollup.from_frame(whole(), key),
+        )
+        for key in ENTITY_COLUMNS
+    }
+    segment_scores = side_file(
+        SCORES_FILE, SegmentScores.load,
+        lambda: SegmentScores.from_frame(
+            columns(SEGMENT_COLUMNS + SCORE_COLUMNS)
+        ),
+    )
+    entity_indexes = {col: entity_index(col) for col in ENTITY_COLUMNS}
+    return Snapshot(
+        version=version,
+        loaded_at=time.time(),
+        data=df,
+        scanner=scanner,
+        range_index=range_index,
+        cube=cube,
+        rollups=rollups,
+        entity_indexes=entity_indexes,
+        segment_scores=segment_scores,
+        selections=SelectionCache(),
+    )
+
+
+@st.cache_resource(show_spinner="Loading dataset...")
+def snapshot_manager():
+    """Return the process-wide snapshot manager, with its refresher running."""
+    return SnapshotManager(
+        build_snapshot, dataset_version, REFRESH_INTERVAL, retire_dataset
+    ).start()
+
+
+def retire_dataset(version, dataset_dir=CLEANED_PARQUET, grace=None):
+    """Delete published dataset versions older than the one just released.
+
+    Versions superseded within ``grace`` seconds (default
+    :data:`RETIRE_GRACE`) are kept for servers that have not switched yet.
+    """
+    if grace is None:
+        grace = RETIRE_GRACE
+    if current_version(dataset_dir) is not None:
+        retire_versions(dataset_dir, version, grace)
+
+
+def load_snapshot():
+    """Return the current dataset snapshot.
+
+    Pages call this once per rerun and read everything from the returned
+    object, so a refresh that lands mid-rerun never mixes versions.
+    """
+    return snapshot_manager().current
+
+
+@st.cache_resource
+def load_figure_cache():
+    """Return the process-wide rendered-chart cache."""
+    return FigureCache()
+
+
+@st.cache_resource
+def load_result_cache():
+    """Return the process-wide cache of results derived from filter sets."""
+    return ResultCache()
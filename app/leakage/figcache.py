@@ -0,0 +1,82 @@
+"""LRU cache of rendered chart images keyed on filter state.
+
+A chart is identified by ``(page, chart id, normalized filters, data
+version)``. Repeating a slider position, or many users opening the default
+view, returns the stored image bytes instead of re-running matplotlib.
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = int(os.environ.get("LEAKAGE_FIGURE_CACHE_MB", 64)) * 2**20
+DEFAULT_MAX_ENTRIES = 512
+
+
+class FigureCache:
+    """Thread-safe LRU of rendered figures, bounded by entries and bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            if len(image) > self.max_bytes:
+                return
+            self._entries[key] = image
+            self.nbytes += len(image)
+            while (self.nbytes > self.max_bytes
+                   or len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def render(self, key, draw, figsize=(6, 4), fmt="png", dpi=100):
+        """Return the image for ``key``, calling ``draw(ax)`` on a miss.
+
+        Figures are built on the object-oriented API rather than pyplot, so
+        nothing is registered in pyplot's global figure list, and each one
+        is cleared as soon as its bytes are written. matplotlib is imported
+        on the first miss only.
+        """
+        image = self.get(key)
+        if image is not None:
+            return image
+
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        try:
+            draw(fig.add_subplot())
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=fmt, dpi=dpi, bbox_inches="tight")
+            image = buffer.getvalue()
+        finally:
+            fig.clear()
+        self.put(key, image)
+        return image
@@ -0,0 +1,160 @@
+"""Sorted-column range index for the sidebar slider filters.
+
+Each indexed column keeps its values in sorted order together with the
+row positions that produced them (argsort, built once at load). A slider
+range then maps to a contiguous slice found with two binary searches, so
+resolving a filter costs time in the size of the result instead of
+allocating a boolean mask over the whole table.
+
+The sorted orders and values are exported with the mapped column files
+(:meth:`RangeIndex.arrays`), so every process but the first maps them
+instead of sorting (:meth:`RangeIndex.from_arrays`).
+"""
+
+import numpy as np
+
+# Numeric columns exposed as sliders on at least one page.
+SLIDER_COLUMNS = [
+    "quantity_sold",
+    "profit_margin_percent",
+    "discount_percent",
+    "revenue",
+    "inventory_level",
+    "holding_cost",
+    "supplier_delay_days",
+    "payment_delay_days",
+    "outstanding_amount",
+    "refund_amount",
+]
+
+
+def normalize_ranges(ranges, bounds):
+    """Canonical, hashable form of slider ``ranges``.
+
+    Ranges covering the whole column (per ``bounds(col)``) are dropped and
+    the rest sorted by column, so equivalent slider states produce the
+    same key.
+    """
+    active = []
+    for col, (low, high) in ranges.items():
+        col_min, col_max = bounds(col)
+        if low <= col_min and high >= col_max:
+            continue
+        active.append((col, low, high))
+    return tuple(sorted(active))
+
+
+def intersect(rows, positions):
+    """Narrow a :meth:`RangeIndex.select` result to sorted ``positions``.
+
+    ``rows`` may be ``None`` (all rows); the result is always sorted.
+    """
+    if rows is None:
+        return positions
+    return np.intersect1d(rows, positions, assume_unique=True)
+
+
+class RangeIndex:
+    """Sorted-position indexes over the numeric columns of a frame."""
+
+    def __init__(self, frame, columns=SLIDER_COLUMNS):
+        self.n_rows = len(frame)
+        position_dtype = np.int32 if self.n_rows < 2**31 else np.int64
+        self._values = {}
+        self._order = {}
+        self._sorted = {}
+        for col in columns:
+            values = frame[col].to_numpy()
+            order = np.argsort(values, kind="stable").astype(position_dtype)
+            self._values[col] = values
+            self._order[col] = order
+            self._sorted[col] = values[order]
+
+    def arrays(self):
+        """The sorted orders and values by name, for export."""
+        arrays = {}
+        for col in self._order:
+            arrays[f"{col}.order"] = self._order[col]
+            arrays[f"{col}.sorted"] = self._sorted[col]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, frame, arrays, columns=SLIDER_COLUMNS):
+        """Index over ``frame`` from the :meth:`arrays` built over it."""
+        index = cls.__new__(cls)
+        index.n_rows = len(frame)
+        index._values = {col: frame[col].to_numpy() for col in columns}
+        index._order = {col: arrays[f"{col}.order"] for col in columns}
+        index._sorted = {col: arrays[f"{col}.sorted"] for col in columns}
+        return index
+
+    def __len__(self):
+        return self.n_rows
+
+    def bounds(self, col):
+        """``(min, max)`` of a column as Python scalars, in O(1)."""
+        values = self._sorted[col]
+        return values[0].item(), values[-1].item()
+
+    def _cast(self, col, low, high):
+        """``low`` and ``high`` in the dtype of a floating column ``col``.
+
+        Slider columns are float32. ``searchsorted`` would compare a Python
+        float bound at float64, an element-wise mask at float32 (NEP 50),
+        so the two would disagree on boundary rows. Both compare in the
+        column's own dtype instead, like ``Series.between``.
+        """
+        dtype = self._sorted[col].dtype
+        if not np.issubdtype(dtype, np.floating):
+            return low, high
+        return np.asarray(low, dtype=dtype), np.asarray(high, dtype=dtype)
+
+    def _span(self, col, low, high):
+        values = self._sorted[col]
+        low, high = self._cast(col, low, high)
+        start = np.searchsorted(values, low, side="left")
+        stop = np.searchsorted(values, high, side="right")
+        return start, stop
+
+    def normalize(self, ranges):
+        """Canonical, hashable form of ``ranges`` (see :func:`normalize_ranges`)."""
+        return normalize_ranges(ranges, self.bounds)
+
+    def select(self, ranges):
+        """Row positions whose values fall inside every ``(low, high)`` range.
+
+        ``ranges`` maps column names to inclusive bounds. Ranges covering the
+        whole column are skipped, and ``None`` is returned when nothing is
+        left to filter, meaning "all rows". Otherwise the most selective
+        range is resolved through its index and the remaining ranges are
+        checked only on those candidate rows. Positions come back sorted, so
+        ``frame.iloc[rows]`` keeps the original row order.
+        """
+        active = []
+        for col, low, high in self.normalize(ranges):
+            start, stop = self._span(col, low, high)
+            active.append((stop - start, col, low, high, start, stop))
+        if not active:
+            return None
+
+        active.sort(key=lambda item: item[0])
+        _, col, _, _, start, stop = active[0]
+        rows = self.refine(
+            self._order[col][start:stop],
+            [(col, low, high) for _, col, low, high, _, _ in active[1:]],
+        )
+        return np.sort(rows)
+
+    def refine(self, rows, ranges):
+        """The positions in ``rows`` whose values fall inside every range.
+
+        ``ranges`` holds ``(col, low, high)`` triples, as returned by
+        :meth:`normalize`. The order of ``rows`` is kept.
+        """
+        for col, low, high in ranges:
+            if not len(rows):
+                break
+            values = self._values[col][rows]
+            low, high = self._cast(col, low, high)
+            rows = rows[(values >= low) & (values <= high)]
+        return rows
@@ -0,0 +1,118 @@
+"""Per-stage timing and memory instrumentation for page reruns.
+
+Pages wrap their expensive stages::
+
+    profile = Profiler("revenue_profit")
+    with profile.stage("filter", rows_in=len(df)) as stage:
+        filtered_df = ...
+        stage.rows_out = len(filtered_df)
+
+Every finished stage is emitted as one JSON line on the ``leakage.profile``
+logger (page, rerun id, stage, wall time, rows in/out, peak allocation)
+and kept on the profiler for the debug sidebar panel
+(:func:`leakage.widgets.profile_panel`).
+
+``LEAKAGE_PROFILE=1`` records wall time and rows; ``LEAKAGE_PROFILE=memory``
+also traces the peak allocation of each stage with :mod:`tracemalloc`,
+which slows allocation-heavy code noticeably. Peaks are process-wide, so
+they are only exact while one session reruns at a time, and stages must
+not be nested. Unset (the default), ``stage()`` returns one shared no-op
+context manager and nothing is timed, logged or kept.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from dataclasses import asdict, dataclass
+
+MODE = os.environ.get("LEAKAGE_PROFILE", "").strip().lower()
+ENABLED = MODE not in ("", "0", "off", "false")
+TRACE_MEMORY = MODE == "memory"
+
+logger = logging.getLogger("leakage.profile")
+if ENABLED and not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+@dataclass
+class Stage:
+    """Measurements of one stage of one rerun."""
+
+    name: str
+    rows_in: int = None
+    rows_out: int = None
+    seconds: float = 0.0
+    peak_bytes: int = None
+
+
+class _NullStage:
+    """Stand-in used while profiling is off; ignores everything."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Timer:
+    def __init__(self, profiler, record):
+        self.profiler = profiler
+        self.record = record
+
+    def __enter__(self):
+        if TRACE_MEMORY:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc):
+        self.record.seconds = time.perf_counter() - self._start
+        if TRACE_MEMORY:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.record.peak_bytes = max(0, peak - self._base)
+        self.profiler.finish(self.record)
+        return False
+
+
+class Profiler:
+    """Stage measurements of one page rerun."""
+
+    def __init__(self, page, enabled=ENABLED):
+        self.page = page
+        self.enabled = enabled
+        self.rerun = uuid.uuid4().hex[:12] if enabled else None
+        self.stages = []
+
+    def stage(self, name, rows_in=None):
+        """Context manager timing ``name``; set ``rows_out`` on what it yields."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Timer(self, Stage(name, rows_in))
+
+    def finish(self, record):
+        self.stages.append(record)
+        logger.info(json.dumps({
+            "page": self.page, "rerun": self.rerun, **asdict(record)
+        }))
+
+    @property
+    def total_seconds(self):
+        return sum(stage.seconds for stage in self.stages)
@@ -0,0 +1,139 @@
+"""Typeahead search and row lookup for customer and product ids.
+
+An :class:`EntityIndex` is built once per id column at load. Ids are kept
+as sorted decimal strings, so a typed prefix maps to a contiguous run
+found with two binary searches and only the first few matches are sent
+to the browser. Each id also maps to its row positions through a CSR
+layout (one offsets array into one positions array), so selecting a few
+customers gathers their rows directly instead of scanning the frame with
+``isin``.
+
+Every array of an :class:`EntityIndex` is exported with the mapped column
+files (:meth:`EntityIndex.arrays`), so other processes map the index
+instead of building it (:meth:`EntityIndex.from_arrays`).
+
+The scan backend has no row positions to map to: selected ids become a
+predicate of the scan instead. It only needs the search, an
+:class:`EntitySearch`, which :meth:`EntitySearch.from_batches` builds
+from the id column batch by batch, holding the distinct ids only.
+"""
+
+import numpy as np
+
+# Matches offered by the search box at a time.
+DEFAULT_LIMIT = 20
+
+
+class EntitySearch:
+    """Prefix search over the distinct ids of an integer id column.
+
+    ``ids`` are the distinct ids, sorted, and ``by_first`` the same ids in
+    order of first appearance in the data.
+    """
+
+    def __init__(self, ids, by_first):
+        self.ids = ids
+        self._by_first = by_first
+
+        # The longest decimal form of an integer sits at one of the extremes.
+        extremes = ids[[0, -1]] if len(ids) else []
+        width = max((len(str(i)) for i in extremes), default=1)
+        keys = ids.astype(f"S{width}")
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._key_ids = ids[order]
+
+    @classmethod
+    def from_batches(cls, batches):
+        """Search over the ids in ``batches``, arrays of the column in order."""
+        seen = None
+        first = []
+        for values in batches:
+            ids, at = np.unique(np.asarray(values), return_index=True)
+            if seen is not None:
+                new = ~np.isin(ids, seen, assume_unique=True)
+                ids, at = ids[new], at[new]
+                seen = np.union1d(seen, ids)
+            else:
+                seen = ids
+            first.append(ids[np.argsort(at, kind="stable")])
+        by_first = np.concatenate(first) if first else np.empty(0, np.int64)
+        return cls(np.sort(by_first), by_first)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def first(self, n):
+        """The first ``n`` ids in order of first appearance in the data."""
+        return self._by_first[:n].tolist()
+
+    def search(self, prefix, limit=DEFAULT_LIMIT):
+        """Up to ``limit`` ids whose decimal form starts with ``prefix``.
+
+        Matches come back in string order, so an exact hit comes first. An
+        empty prefix returns the first ids seen in the data.
+        """
+        prefix = prefix.strip().encode()
+        if not prefix:
+            return self.first(limit)
+        start = np.searchsorted(self._keys, prefix, side="left")
+        stop = np.searchsorted(self._keys, prefix + b"\xff", side="left")
+        return self._key_ids[start:min(stop, start + limit)].tolist()
+
+    def options(self, prefix, selected, limit=DEFAULT_LIMIT):
+        """Search matches plus the current selection, for a multiselect."""
+        chosen = set(selected)
+        return list(selected) + [
+            i for i in self.search(prefix, limit) if i not in chosen
+        ]
+
+
+class EntityIndex(EntitySearch):
+    """Prefix search and id -> row positions map over an integer id column."""
+
+    def __init__(self, values):
+        values = np.asarray(values)
+        position_dtype = np.int32 if len(values) < 2**31 else np.int64
+        positions = np.argsort(values, kind="stable").astype(position_dtype)
+        ordered = values[positions]
+        changes = ordered[1:] != ordered[:-1]
+        starts = np.flatnonzero(np.r_[len(ordered) > 0, changes])
+        ids = ordered[starts]
+        self._positions = positions
+        self._offsets = np.r_[starts, len(values)]
+        # The sort is stable, so each run starts at the id's first row.
+        super().__init__(ids, ids[np.argsort(positions[starts], kind="stable")])
+
+    # Attributes that make up the index, exported and mapped as they are.
+    ARRAYS = ("ids", "_by_first", "_keys", "_key_ids", "_positions", "_offsets")
+
+    def arrays(self):
+        """The index's arrays by name, for export."""
+        return {name.lstrip("_"): getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Index made of the :meth:`arrays` of one built before."""
+        index = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(index, name, arrays[name.lstrip("_")])
+        return index
+
+    @property
+    def counts(self):
+        """Number of rows of each id, in the order of ``ids``."""
+        return np.diff(self._offsets)
+
+    def rows(self, ids):
+        """Sorted row positions of every row belonging to one of ``ids``."""
+        ids = np.asarray(ids, dtype=self.ids.dtype)
+        slots = np.searchsorted(self.ids, ids)
+        found = slots < len(self.ids)
+        found[found] = self.ids[slots[found]] == ids[found]
+        slots = slots[found]
+        parts = [
+            self._positions[self._offsets[s]:self._offsets[s + 1]] for s in slots
+        ]
+        if not parts:
+            return np.empty(0, dtype=self._positions.dtype)
+        return np.sort(np.concatenate(parts))
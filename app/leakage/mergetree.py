@@ -0,0 +1,37 @@
+"""Pairwise merging of per-chunk partial aggregates.
+
+Folding every chunk's partial into one running aggregate re-merges the
+whole aggregate per chunk: O(chunks x cells). A :class:`MergeTree` merges
+partials like a binary counter instead. Two partials of the same rank
+(each covering ``2**rank`` chunks) are merged into one of the next rank,
+so every chunk takes part in ``log2(chunks)`` merges and at most
+``log2(chunks) + 1`` partials are held at a time.
+"""
+
+
+class MergeTree:
+    """Binary-counter merge of partials with ``merge_all(list) -> partial``."""
+
+    def __init__(self, merge_all):
+        self.merge_all = merge_all
+        self._stack = []
+
+    def __len__(self):
+        return len(self._stack)
+
+    def add(self, partial):
+        rank = 0
+        while self._stack and self._stack[-1][0] == rank:
+            _, top = self._stack.pop()
+            partial = self.merge_all([top, partial])
+            rank += 1
+        self._stack.append((rank, partial))
+
+    def result(self, base=None):
+        """Everything added, merged with ``base`` if given, or ``None``."""
+        partials = [partial for _, partial in self._stack]
+        if base is not None:
+            partials.insert(0, base)
+        if not partials:
+            return None
+        return partials[0] if len(partials) == 1 else self.merge_all(partials)
@@ -0,0 +1,301 @@
+"""Chunked cleaning pipeline for the raw leakage extract.
+
+Scriptable replacement for ``notebooks/01_data_cleaning.ipynb``. The raw
+CSV is read in fixed-size chunks, each chunk is typed and checked against
+the ``profit == net_revenue - cost`` invariant, and rows are written to a
+Parquet dataset partitioned by month of ``order_date``::
+
+    python -m app.leakage.pipeline --raw data/raw/profit_leakage_large_dataset.csv
+
+With ``--incremental`` only raw rows past the recorded high-water mark are
+processed and appended as new partition files.
+
+Either way the run builds a new version of the dataset, parts, derived
+side files and watermark together, and publishes it in one atomic step
+(:mod:`leakage.versions`); a run that fails leaves the published dataset
+as it was. Older versions are left in place: the dashboard servers delete
+them once they no longer read them.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .cube import CubeAccumulator
+from .rollups import RollupAccumulator
+from .schema import (
+    CLEANED_PARQUET,
+    DATE_COLUMN,
+    RAW_CSV,
+    month_labels,
+    optimize_dtypes,
+)
+from .scoring import SegmentScoreAccumulator
+from .stats import StatsAccumulator
+from .versions import publish, start_version
+
+DEFAULT_CHUNKSIZE = 250_000
+DEFAULT_TOLERANCE = 1e-6
+WATERMARK_FILE = "_watermark.json"
+
+# Builders for derived aggregates kept next to the dataset. Each entry is
+# called as ``builder(dataset_dir, append)`` and returns an accumulator with
+# ``add(chunk)`` and ``commit()``; ``append`` is True for incremental runs,
+# where the accumulator must merge into what is already on disk.
+DERIVED_BUILDERS = [
+    CubeAccumulator,
+    RollupAccumulator,
+    SegmentScoreAccumulator,
+    StatsAccumulator,
+]
+
+
+@dataclass
+class CleanReport:
+    """Summary of one pipeline run."""
+
+    rows: int = 0
+    chunks: int = 0
+    tolerance: float = DEFAULT_TOLERANCE
+    max_abs_error: float = 0.0
+    abs_error_sum: float = 0.0
+    violations: int = 0
+    partitions: set = field(default_factory=set)
+    batch: int = 0
+
+    @property
+    def mean_abs_error(self):
+        return self.abs_error_sum / self.rows if self.rows else 0.0
+
+    def __str__(self):
+        return (
+            f"batch={self.batch} rows={self.rows:,} chunks={self.chunks} "
+            f"partitions={len(self.partitions)}\n"
+            f"profit check: mean |error|={self.mean_abs_error:.3e} "
+            f"max |error|={self.max_abs_error:.3e} "
+            f"violations (> {self.tolerance:g})={self.violations:,}"
+        )
+
+
+@dataclass
+class Watermark:
+    """High-water mark of the rows already ingested from the raw file."""
+
+    batch: int
+    order_id: int
+    order_date: str
+    raw_offset: int
+
+    @classmethod
+    def read(cls, dataset_dir):
+        path = Path(dataset_dir) / WATERMARK_FILE
+        if not path.exists():
+            return None
+        return cls(**json.loads(path.read_text()))
+
+    def write(self, dataset_dir):
+        path = Path(dataset_dir) / WATERMARK_FILE
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.__dict__, indent=2))
+        os.replace(tmp, path)
+
+    def after(self, chunk):
+        """Mask of rows in ``chunk`` that sort after this watermark."""
+        date = pd.Timestamp(self.order_date)
+        return (chunk[DATE_COLUMN] > date) | (
+            (chunk[DATE_COLUMN] == date) & (chunk["order_id"] > self.order_id)
+        )
+
+
+class _Window(io.RawIOBase):
+    """Read-only view of a binary file that stops at a fixed byte offset."""
+
+    def __init__(self, handle, end):
+        self._handle = handle
+        self._end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self._end - self._handle.tell())
+        if n <= 0:
+            return 0
+        data = self._handle.read(n)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def check_profit(chunk, report):
+    """Validate ``profit == net_revenue - cost`` for a chunk, vectorized."""
+    error = np.abs(
+        chunk["profit"].to_numpy()
+        - (chunk["net_revenue"].to_numpy() - chunk["cost"].to_numpy())
+    )
+    if len(error):
+        report.max_abs_error = max(report.max_abs_error, float(error.max()))
+        report.abs_error_sum += float(error.sum())
+        report.violations += int((error > report.tolerance).sum())
+
+
+def write_partitions(chunk, out_dir, part_name):
+    """Append ``chunk`` to ``out_dir`` as one file per ``order_date`` month."""
+    months = month_labels(chunk[DATE_COLUMN])
+    written = []
+    for month, rows in chunk.groupby(months, sort=True):
+        month_dir = out_dir / month
+        month_dir.mkdir(parents=True, exist_ok=True)
+        rows.to_parquet(month_dir / f"{part_name}.parquet", index=False)
+        written.append(month)
+    return written
+
+
+def _complete_size(path):
+    """Size of ``path`` up to and including its last newline."""
+    size = path.stat().st_size
+    with open(path, "rb") as handle:
+        pos = size
+        while pos > 0:
+            step = min(pos, 64 * 1024)
+            handle.seek(pos - step)
+            block = handle.read(step)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                return pos - step + newline + 1
+            pos -= step
+    return 0
+
+
+def _ingest(chunks, out_dir, batch, report, watermark=None, append=False):
+    """Clean ``chunks`` into ``out_dir`` and return the last row ingested."""
+    accumulators = [build(out_dir, append) for build in DERIVED_BUILDERS]
+    last = None
+    for i, chunk in enumerate(chunks):
+        chunk = optimize_dtypes(chunk, downcast_integers=False)
+        if watermark is not None:
+            chunk = chunk[watermark.after(chunk)]
+        if chunk.empty:
+            continue
+        check_profit(chunk, report)
+        report.partitions.update(
+            write_partitions(chunk, out_dir, f"part-{batch:05d}-{i:05d}")
+        )
+        for acc in accumulators:
+            acc.add(chunk)
+        report.rows += len(chunk)
+        report.chunks += 1
+        last = chunk.iloc[-1]
+    for acc in accumulators:
+        acc.commit()
+    return last
+
+
+def run(raw_path=RAW_CSV, out_path=CLEANED_PARQUET,
+        chunksize=DEFAULT_CHUNKSIZE, tolerance=DEFAULT_TOLERANCE):
+    """Rebuild the cleaned dataset at ``out_path`` from ``raw_path``.
+
+    The dataset is built as a new version and published only once every
+    chunk, side file and the watermark have been written, so readers
+    never see a partial dataset.
+    """
+    raw_path, out_path = Path(raw_path), Path(out_path)
+    build, version = start_version(out_path, 0)
+
+    report = CleanReport(tolerance=tolerance)
+    end = _complete_size(raw_path)
+    with open(raw_path, "rb") as handle:
+        reader = io.BufferedReader(_Window(handle, end))
+        last = _ingest(pd.read_csv(reader, chunksize=chunksize), build,
+                       0, report)
+    if last is not None:
+        Watermark(0, int(last["order_id"]), str(last[DATE_COLUMN]),
+                  end).write(build)
+
+    publish(out_path, build, version)
+    return report
+
+
+def run_incremental(raw_path=RAW_CSV, out_path=CLEANED_PARQUET,
+                    chunksize=DEFAULT_CHUNKSIZE, tolerance=DEFAULT_TOLERANCE):
+    """Append raw rows newer than the dataset's watermark to ``out_path``.
+
+    Reading resumes at the byte offset where the previous run stopped, so
+    the cost follows the new volume rather than the whole history. If the
+    raw file shrank (rotated or truncated), it is rescanned from the start
+    and rows at or before the watermark are skipped. Falls back to a full
+    :func:`run` when the dataset has never been built.
+
+    The new version starts as hard links to the current one; the new
+    parts, the merged side files and the advanced watermark are written
+    into it and published together. A run that fails part-way publishes
+    nothing, so the next run starts again from the same watermark.
+    """
+    raw_path, out_path = Path(raw_path), Path(out_path)
+    watermark = Watermark.read(out_path) if out_path.is_dir() else None
+    if watermark is None:
+        return run(raw_path, out_path, chunksize, tolerance)
+
+    report = CleanReport(tolerance=tolerance, batch=watermark.batch)
+    end = _complete_size(raw_path)
+    if end == watermark.raw_offset:
+        return report
+
+    batch = watermark.batch + 1
+    report.batch = batch
+    build, version = start_version(out_path, batch, base=out_path.resolve())
+    with open(raw_path, "rb") as handle:
+        header = handle.readline()
+        columns = pd.read_csv(io.BytesIO(header), nrows=0).columns
+        header_end = len(header)
+        start = watermark.raw_offset
+        if not header_end <= start <= end:
+            start = header_end
+        handle.seek(start)
+        reader = io.BufferedReader(_Window(handle, end))
+        chunks = pd.read_csv(reader, header=None, names=columns,
+                             chunksize=chunksize)
+        last = _ingest(chunks, build, batch, report, watermark,
+                       append=True)
+
+    if last is not None:
+        Watermark(batch, int(last["order_id"]), str(last[DATE_COLUMN]),
+                  end).write(build)
+    else:
+        Watermark(watermark.batch, watermark.order_id,
+                  watermark.order_date, end).write(build)
+        report.batch = watermark.batch
+    publish(out_path, build, version)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--raw", type=Path, default=RAW_CSV,
+                        help="raw CSV extract to clean")
+    parser.add_argument("--out", type=Path, default=CLEANED_PARQUET,
+                        help="output Parquet dataset directory")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="rows held in memory per chunk")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed |profit - (net_revenue - cost)|")
+    parser.add_argument("--strict", action="store_true",
+                        help="exit non-zero if any row breaks the invariant")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only ingest rows past the stored watermark")
+    args = parser.parse_args(argv)
+
+    runner = run_incremental if args.incremental else run
+    report = runner(args.raw, args.out, args.chunksize, args.tolerance)
+    print(report)
+    return 1 if args.strict and report.violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""Plotting helpers that keep chart render time bounded as data grows.
+
+Charts are drawn from a selection (:mod:`leakage.selection`), whose rows
+are binned batch by batch in two passes: the first finds the value
+range (and spread, for the KDE bandwidth), the second counts into bins
+over that range. Only bins and bounded point samples are ever held, so
+a chart over a scanned history needs no more memory than one over a
+filtered page. A selection held in memory is one batch, binned exactly
+as before.
+
+seaborn and matplotlib are imported by the helpers that draw with them,
+not by this module, so pages whose charts are all served from the figure
+cache never load the plotting stack.
+"""
+
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from .kde import binned_kde, scott_bandwidth
+
+# Above this many points a scatter is drawn as a density grid or a sample.
+MAX_POINTS = int(os.environ.get("LEAKAGE_MAX_POINTS", 20_000))
+# "density" (2D binned counts) or "sample" (stratified point sample).
+SCATTER_MODE = os.environ.get("LEAKAGE_SCATTER_MODE", "density")
+GRID_BINS = 120
+# Fine KDE grid cells per kernel bandwidth.
+KDE_BINS_PER_BANDWIDTH = 8
+
+
+def _bounds(values):
+    low, high = values.min(), values.max()
+    return low, high
+
+
+def _cells(x, y, bins, bounds=None):
+    """Flat 2D grid cell number of every point.
+
+    The grid spans ``bounds`` (``((x_low, x_high), (y_low, y_high))``),
+    by default the points' own range.
+    """
+    def bucket(values, low, high):
+        if high == low:
+            return np.zeros(len(values), dtype=np.intp)
+        scaled = (values - low) * (bins / (high - low))
+        return np.clip(scaled.astype(np.intp), 0, bins - 1)
+
+    if bounds is None:
+        bounds = _bounds(x), _bounds(y)
+    (x_low, x_high), (y_low, y_high) = bounds
+    return bucket(x, x_low, x_high) * bins + bucket(y, y_low, y_high)
+
+
+def stratified_sample(x, y, size, bins=GRID_BINS, seed=0, rate=None,
+                      bounds=None):
+    """Positions of about ``size`` points, sampled per 2D grid cell.
+
+    Each occupied cell keeps a share proportional to its count but at least
+    one point, so sparse regions of the plot stay visible. To sample one
+    batch of a larger set, pass the set's sampling ``rate`` and grid
+    ``bounds``; ``size`` is then ignored.
+    """
+    n = len(x)
+    if rate is None:
+        if n <= size:
+            return np.arange(n)
+        rate = size / n
+    cells = _cells(x, y, bins, bounds)
+    shuffled = np.random.default_rng(seed).permutation(n)
+    order = shuffled[np.argsort(cells[shuffled], kind="stable")]
+    sorted_cells = cells[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    counts = np.diff(np.r_[starts, n])
+    quota = np.maximum(1, np.ceil(counts * rate)).astype(np.intp)
+    rank = np.arange(n) - np.repeat(starts, counts)
+    return np.sort(order[rank < np.repeat(quota, counts)])
+
+
+def _pairs(rows, x, y):
+    """``(xs, ys)`` float arrays per batch of the selection ``rows``."""
+    for frame in rows.batches([x, y]):
+        yield (frame[x].to_numpy(dtype=np.float64),
+               frame[y].to_numpy(dtype=np.float64))
+
+
+def _pair_bounds(pairs):
+    """``((x_low, x_high), (y_low, y_high))`` over every batch."""
+    x_bounds, y_bounds = [], []
+    for xs, ys in pairs:
+        if len(xs):
+            x_bounds.append(_bounds(xs))
+            y_bounds.append(_bounds(ys))
+    return tuple(
+        (min(low for low, _ in b), max(high for _, high in b))
+        for b in (x_bounds, y_bounds)
+    )
+
+
+def _sample(rows, x, y, size):
+    """``(xs, ys)`` of about ``size`` rows of ``rows``, stratified per cell."""
+    n = len(rows)
+    picked_x, picked_y = [], []
+    if n <= size:
+        for xs, ys in _pairs(rows, x, y):
+            picked_x.append(xs)
+            picked_y.append(ys)
+    else:
+        bounds = _pair_bounds(_pairs(rows, x, y))
+        for xs, ys in _pairs(rows, x, y):
+            picked = stratified_sample(xs, ys, size, rate=size / n,
+                                       bounds=bounds)
+            picked_x.append(xs[picked])
+            picked_y.append(ys[picked])
+    return np.concatenate(picked_x), np.concatenate(picked_y)
+
+
+@dataclass
+class ScatterData:
+    """What a scatter draws, reduced to a bounded size.
+
+    ``kind`` is ``"points"`` (every row, in ``points``), ``"sample"`` (a
+    stratified sample, in ``points``) or ``"density"`` (``grid`` holds
+    the counts and the x and y edges). ``highlight`` holds the flagged
+    rows, sampled the same way, for the two bounded kinds.
+    """
+
+    x: str
+    y: str
+    kind: str
+    points: tuple = None
+    grid: tuple = None
+    highlight: tuple = None
+
+
+def scatter_data(rows, x, y, highlight=None, max_points=MAX_POINTS,
+                 mode=SCATTER_MODE):
+    """Bin the selection ``rows`` for a scatter of ``y`` against ``x``.
+
+    Up to ``max_points`` rows are kept as points. Larger selections become
+    a ``GRID_BINS`` x ``GRID_BINS`` count grid (``mode="density"``) or a
+    stratified sample (``mode="sample"``), with the rows of the
+    ``highlight`` selection (typically the flagged ones) sampled down to
+    ``max_points`` on top.
+    """
+    if len(rows) <= max_points:
+        return ScatterData(x, y, "points", points=_sample(rows, x, y, max_points))
+
+    if mode == "sample":
+        data = ScatterData(x, y, "sample", points=_sample(rows, x, y, max_points))
+    else:
+        bounds = _pair_bounds(_pairs(rows, x, y))
+        counts = 0
+        for xs, ys in _pairs(rows, x, y):
+            batch, x_edges, y_edges = np.histogram2d(
+                xs, ys, bins=GRID_BINS, range=bounds
+            )
+            counts = counts + batch
+        data = ScatterData(x, y, "density", grid=(counts, x_edges, y_edges))
+
+    if highlight is not None:
+        data.highlight = _sample(highlight, x, y, max_points)
+    return data
+
+
+def scatter(ax, rows, x, y, alpha=0.6, highlight=None,
+            max_points=MAX_POINTS, mode=SCATTER_MODE):
+    """Scatter ``y`` against ``x``, switching to a bounded view for big selections.
+
+    Up to ``max_points`` rows are drawn as a plain seaborn scatter. Larger
+    selections become a log-scaled 2D density grid (``mode="density"``)
+    or a stratified sample (``mode="sample"``). Rows of the ``highlight``
+    selection, typically the leakage region, are overlaid as points on
+    top; if there are more than ``max_points`` of them they are thinned
+    the same stratified way so the overlay stays bounded too.
+    """
+    data = scatter_data(rows, x, y, highlight, max_points, mode)
+    if data.kind == "points":
+        import seaborn as sns
+
+        xs, ys = data.points
+        sns.scatterplot(x=xs, y=ys, alpha=alpha, ax=ax)
+    elif data.kind == "sample":
+        xs, ys = data.points
+        ax.scatter(xs, ys, s=8, alpha=alpha, linewidths=0)
+    else:
+        from matplotlib.colors import LogNorm
+
+        counts, x_edges, y_edges = data.grid
+        mesh = ax.pcolormesh(
+            x_edges, y_edges, np.ma.masked_equal(counts.T, 0),
+            cmap="Blues", norm=LogNorm(), rasterized=True
+        )
+        ax.figure.colorbar(mesh, ax=ax, label="orders")
+
+    if data.highlight is not None:
+        xs, ys = data.highlight
+        ax.scatter(xs, ys, s=8, color="crimson",
+                   alpha=alpha, linewidths=0, label="leakage")
+        ax.legend(loc="upper right")
+
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+
+
+def _finite(values):
+    values = np.asarray(values, dtype=np.float64)
+    return values[~np.isnan(values)]
+
+
+def _moments(batches):
+    """Count, minimum, maximum and sample standard deviation of ``batches``.
+
+    Per-batch moments are combined pairwise (Chan et al.); a single batch
+    gives exactly NumPy's ``std(ddof=1)``.
+    """
+    n, low, high, mean, m2 = 0, np.inf, -np.inf, 0.0, 0.0
+    for values in batches:
+        values = _finite(values)
+        k = len(values)
+        if not k:
+            continue
+        batch_mean = values.mean()
+        deviations = values - batch_mean
+        batch_m2 = (deviations * deviations).sum()
+        if not n:
+            mean, m2 = batch_mean, batch_m2
+        else:
+            delta = batch_mean - mean
+            mean += delta * k / (n + k)
+            m2 += batch_m2 + delta * delta * n * k / (n + k)
+        n += k
+        low, high = min(low, values.min()), max(high, values.max())
+    std = np.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+    return n, low, high, std
+
+
+def _histogram_bins(batches, bins, kde):
+    """:func:`histogram_bins` over the arrays ``batches()`` yields, in two passes."""
+    n, low, high, std = _moments(batches())
+    if not n:
+        return np.empty(0), np.empty(0, dtype=np.intp), np.empty(0), np.empty(0)
+
+    if high == low:
+        low, high = low - 0.5, high + 0.5
+    bandwidth = 0.0
+    oversample = 1
+    if kde and n > 1:
+        bandwidth = scott_bandwidth(n, std)
+        if bandwidth > 0:
+            per_bin = (high - low) / bins / bandwidth
+            oversample = max(1, int(np.ceil(per_bin * KDE_BINS_PER_BANDWIDTH)))
+
+    fine_counts = 0
+    for values in batches():
+        counts, fine_edges = np.histogram(
+            _finite(values), bins=bins * oversample, range=(low, high)
+        )
+        fine_counts = fine_counts + counts
+    counts = fine_counts.reshape(bins, oversample).sum(axis=1)
+    edges = fine_edges[::oversample]
+    if bandwidth <= 0:
+        return edges, counts, np.empty(0), np.empty(0)
+    centres, density = binned_kde(fine_counts, fine_edges, bandwidth)
+    return edges, counts, centres, density * n * (edges[1] - edges[0])
+
+
+def histogram_bins(values, bins=30, kde=True):
+    """Bar counts and KDE curve of ``values``, binned once.
+
+    Returns ``(edges, counts, centres, curve)``: the ``bins + 1`` display
+    bin edges, the count per bin, and the KDE evaluated at ``centres``
+    scaled to counts per bin (both empty when there is no KDE).
+
+    Values are counted once into a fine grid that nests inside the
+    display bins. The bars are sums of fine cells, and the KDE is
+    convolved from the same counts by FFT (:mod:`leakage.kde`) instead of
+    evaluating every point against every grid position.
+    """
+    return _histogram_bins(lambda: [values], bins, kde)
+
+
+def selection_histogram_bins(rows, col, bins=30, kde=True):
+    """:func:`histogram_bins` of column ``col`` of the selection ``rows``.
+
+    The fine counts of every batch add up, so only they are held.
+    """
+    return _histogram_bins(
+        lambda: (frame[col] for frame in rows.batches([col])), bins, kde
+    )
+
+
+def histogram(ax, rows, col, bins=30, color=None, kde=True):
+    """Histogram of ``col`` with an optional KDE line, like ``sns.histplot``.
+
+    The bars and curve come from :func:`selection_histogram_bins`.
+    """
+    color = color or "C0"
+    ax.set_xlabel(col)
+    ax.set_ylabel("Count")
+    edges, counts, centres, curve = selection_histogram_bins(rows, col, bins, kde)
+    if not len(counts):
+        return
+
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align="edge",
+           color=color, alpha=0.5, edgecolor="black", linewidth=0.8)
+    if len(curve):
+        ax.plot(centres, curve, color=color)
@@ -0,0 +1,124 @@
+"""Warm a dashboard server before its first visitor.
+
+The first visit to each page of a fresh server process pays for loading
+the dataset snapshot (column maps, range and entity indexes, cube,
+rollups, segment scores), importing the plotting stack and drawing the
+page's default charts. :func:`prewarm` does all of it up front: it runs
+every page script once outside any session, where Streamlit's widgets
+return their defaults, so the snapshot is loaded and each page's
+default-filter charts land in the figure cache under the same keys a
+visitor's first rerun looks up.
+
+``app/serve.py`` starts it in a background thread as the server boots;
+``streamlit run app/app.py`` starts it from the landing page's first run
+instead. Run this module to measure the cold start::
+
+    python -m app.leakage.prewarm
+"""
+
+import argparse
+import logging
+import runpy
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger("leakage.prewarm")
+
+APP_DIR = Path(__file__).resolve().parent.parent
+PAGES_DIR = APP_DIR / "pages"
+
+# Streamlit loggers that warn about every widget used outside a session.
+_BARE_MODE_LOGGERS = [
+    "streamlit",
+    "streamlit.runtime.scriptrunner_utils.script_run_context",
+    "streamlit.runtime.state.session_state_proxy",
+]
+
+_started = None
+_start_lock = threading.Lock()
+
+
+def _above_warning(record):
+    return record.levelno > logging.WARNING
+
+
+@contextmanager
+def _bare_mode():
+    """Silence the bare-mode warnings while page scripts run headless.
+
+    Streamlit resets its loggers' levels when it creates them, so the
+    warnings are dropped by a filter instead.
+    """
+    loggers = [logging.getLogger(name) for name in _BARE_MODE_LOGGERS]
+    for log in loggers:
+        log.addFilter(_above_warning)
+    try:
+        yield
+    finally:
+        for log in loggers:
+            log.removeFilter(_above_warning)
+
+
+def prewarm(pages=None):
+    """Run every page script once with its default filters.
+
+    Returns the seconds spent per page, in run order; the first page also
+    carries the snapshot load. A page that fails is logged and skipped.
+    """
+    # Pages import the package as ``leakage``, as under ``streamlit run``.
+    if str(APP_DIR) not in sys.path:
+        sys.path.insert(0, str(APP_DIR))
+    pages = sorted(PAGES_DIR.glob("*.py")) if pages is None else pages
+
+    timings = {}
+    with _bare_mode():
+        for page in pages:
+            started = time.perf_counter()
+            try:
+                runpy.run_path(str(page), run_name="__main__")
+            except Exception:
+                logger.exception("prewarming %s failed", page.name)
+                continue
+            timings[page.stem] = time.perf_counter() - started
+    logger.info("prewarmed %d pages in %.2fs: %s", len(timings),
+                sum(timings.values()),
+                ", ".join(f"{name} {sec:.2f}s" for name, sec in timings.items()))
+    return timings
+
+
+def start_prewarm():
+    """Prewarm in a daemon thread, once per process; returns the thread."""
+    global _started
+    with _start_lock:
+        if _started is None:
+            _started = threading.Thread(
+                target=prewarm, name="leakage-prewarm", daemon=True
+            )
+            _started.start()
+    return _started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", type=Path,
+                        help="page scripts to run (default: every page)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    timings = prewarm(args.pages or None)
+    total = time.perf_counter() - started
+    # A second pass is what a visitor sees on a warm server.
+    warm = prewarm(args.pages or None)
+    print(f"{'page':<24}{'cold s':>8}{'warm s':>8}")
+    for name, seconds in timings.items():
+        print(f"{name:<24}{seconds:>8.2f}{warm.get(name, float('nan')):>8.2f}")
+    print(f"cold start {total:.2f}s "
+          "(dataset snapshot, plotting stack, default-view charts)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
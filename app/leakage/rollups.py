@@ -0,0 +1,155 @@
+"""Per-customer and per-product leakage rollups maintained at ingest.
+
+For each ``customer_id`` and ``product_id`` the pipeline keeps additive
+totals: orders, returns, outstanding amount, payment delay days, refunds,
+discount, gross margin (``revenue - cost``, i.e. before discount) and
+losses (profit below zero). The dashboard measures are ratios of those
+totals:
+
+- ``mean_payment_delay_days``: payment delay days / orders
+- ``return_rate``: returned orders / orders
+- ``margin_weighted_discount``: discount / gross margin, the share of the
+  pre-discount margin that was given away
+
+Entities are ranked by ``leakage = outstanding + refunds + losses``. The
+tables are stored sorted by it, so the worst ``K`` are the first ``K``
+rows; other rankings go through a bounded heap.
+"""
+
+import heapq
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .mergetree import MergeTree
+
+ENTITY_COLUMNS = ["customer_id", "product_id"]
+ROLLUP_FILE = "_rollup_{}.parquet"
+
+SUM_COLUMNS = [
+    "orders",
+    "returns",
+    "outstanding",
+    "payment_delay_days",
+    "refunds",
+    "discount",
+    "gross_margin",
+    "losses",
+]
+
+
+def _partial(frame, key):
+    """Additive totals of ``frame`` per ``key``."""
+    profit = frame["profit"].to_numpy()
+    work = pd.DataFrame({
+        key: frame[key].to_numpy(),
+        "orders": np.ones(len(frame), dtype=np.int64),
+        "returns": frame["return_flag"].to_numpy(np.int64),
+        "outstanding": frame["outstanding_amount"].to_numpy(np.float64),
+        "payment_delay_days": frame["payment_delay_days"].to_numpy(np.int64),
+        "refunds": frame["refund_amount"].to_numpy(np.float64),
+        "discount": frame["discount_amount"].to_numpy(np.float64),
+        "gross_margin": (frame["revenue"] - frame["cost"]).to_numpy(np.float64),
+        "losses": np.maximum(-profit, 0).astype(np.float64),
+    })
+    return work.groupby(key, sort=False).sum()
+
+
+def _merge_partials(partials):
+    """Additive totals of several partials, summed per entity."""
+    return pd.concat(partials).groupby(level=0, sort=False).sum()
+
+
+class EntityRollup:
+    """Leakage totals per entity, sorted by ``leakage`` descending."""
+
+    def __init__(self, key, totals):
+        self.key = key
+        totals = totals.copy()
+        totals["leakage"] = (
+            totals["outstanding"] + totals["refunds"] + totals["losses"]
+        )
+        self.totals = totals.sort_values(
+            "leakage", ascending=False, kind="stable"
+        ).reset_index()
+
+    @classmethod
+    def from_frame(cls, frame, key):
+        return cls(key, _partial(frame, key))
+
+    def merge(self, other):
+        """Combine two rollups of the same key by adding their totals."""
+        return EntityRollup(self.key, _merge_partials([
+            self.totals.set_index(self.key)[SUM_COLUMNS],
+            other.totals.set_index(self.key)[SUM_COLUMNS],
+        ]))
+
+    def __len__(self):
+        return len(self.totals)
+
+    def top_k(self, k, by="leakage"):
+        """The ``k`` entities with the largest ``by``, with derived measures.
+
+        ``leakage`` is the stored order, so that ranking is a slice of the
+        first ``k`` rows. Any other column or derived measure is ranked
+        with a size-``k`` heap.
+        """
+        if by == "leakage":
+            return self._derive(self.totals.iloc[:k])
+        values = self._derive(self.totals)[by].to_numpy()
+        finite = np.flatnonzero(~np.isnan(values))
+        picked = heapq.nlargest(k, finite, key=values.__getitem__)
+        return self._derive(self.totals.iloc[picked])
+
+    @staticmethod
+    def _derive(totals):
+        out = totals.copy()
+        orders = out["orders"].to_numpy()
+        margin = out["gross_margin"].to_numpy()
+        out["mean_payment_delay_days"] = out["payment_delay_days"] / orders
+        out["return_rate"] = out["returns"] / orders
+        out["margin_weighted_discount"] = np.divide(
+            out["discount"].to_numpy(), margin,
+            out=np.full(len(out), np.nan), where=margin > 0,
+        )
+        return out.reset_index(drop=True)
+
+    def save(self, path):
+        tmp = Path(path).with_suffix(".tmp")
+        self.totals.drop(columns="leakage").to_parquet(tmp, index=False)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path, key):
+        return cls(key, pd.read_parquet(path).set_index(key))
+
+
+class RollupAccumulator:
+    """Pipeline builder that maintains one rollup file per entity column.
+
+    Chunk totals are summed pairwise (:class:`~leakage.mergetree.MergeTree`)
+    and each rollup is merged with the stored one and sorted once, on
+    commit.
+    """
+
+    def __init__(self, dataset_dir, append):
+        self.paths = {
+            key: Path(dataset_dir) / ROLLUP_FILE.format(key)
+            for key in ENTITY_COLUMNS
+        }
+        self.append = append
+        self.parts = {key: MergeTree(_merge_partials) for key in ENTITY_COLUMNS}
+
+    def add(self, chunk):
+        for key in ENTITY_COLUMNS:
+            self.parts[key].add(_partial(chunk, key))
+
+    def commit(self):
+        for key, path in self.paths.items():
+            base = None
+            if self.append and path.exists():
+                base = EntityRollup.load(path, key).totals.set_index(key)[SUM_COLUMNS]
+            totals = self.parts[key].result(base)
+            if totals is not None:
+                EntityRollup(key, totals).save(path)
@@ -0,0 +1,156 @@
+"""Leakage rules of the five analysis modules.
+
+The same definitions back the dashboard pages and the batch detector
+(:mod:`leakage.detect`). Each rule reads plain column arrays and a dict
+of percentile thresholds, so :func:`evaluate` pulls every column it needs
+out of the frame once and flags all modules in a single vectorized pass.
+Thresholds come from anything with a ``quantile(col, q)`` method: a
+:class:`~leakage.cube.FrameSummary` for exact values or a cube query for
+sketch-based ones.
+
+The tests only combine columns with comparisons, ``*``, ``&`` and ``|``,
+which Arrow expressions support as well. :func:`expression` therefore
+runs the same test on ``pyarrow.compute`` field references, so the scan
+backend pushes a rule down into its Parquet scan unchanged.
+
+Besides the rule behind each dashboard page, the inventory module has the
+stockout check from ``notebooks/06_module4_inventory.ipynb``.
+"""
+
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pyarrow.compute as pc
+
+from .cube import FrameSummary
+
+# Percentile behind every "top quartile" rule.
+TOP_QUARTILE = 0.75
+# Margin below which an order leaks profit, and discount above which a
+# low-margin order counts as discount leakage (both in percent).
+LOW_MARGIN_PERCENT = 5
+HIGH_DISCOUNT_PERCENT = 30
+
+
+@dataclass(frozen=True)
+class Rule:
+    module: str
+    title: str
+    columns: tuple
+    # Columns whose TOP_QUARTILE threshold the test needs.
+    percentiles: tuple
+    # Money column totalled over flagged orders in the batch summaries.
+    exposure: str
+    test: Callable
+
+
+def _low_margin(cols, limits):
+    return cols["profit_margin_percent"] < LOW_MARGIN_PERCENT
+
+
+def _high_discount(cols, limits):
+    return (
+        (cols["discount_percent"] > HIGH_DISCOUNT_PERCENT)
+        & (cols["profit_margin_percent"] < LOW_MARGIN_PERCENT)
+    )
+
+
+def _overstock(cols, limits):
+    return (
+        (cols["inventory_level"] > cols["reorder_level"] * 2)
+        | (cols["holding_cost"] > limits["holding_cost"])
+    )
+
+
+def _stockout(cols, limits):
+    return cols["inventory_level"] <= cols["reorder_level"]
+
+
+def _late_payment(cols, limits):
+    return (
+        (cols["payment_delay_days"] > limits["payment_delay_days"])
+        | (cols["outstanding_amount"] > limits["outstanding_amount"])
+    )
+
+
+def _high_refund(cols, limits):
+    return (
+        (cols["refund_amount"] > limits["refund_amount"])
+        | (cols["quantity_sold"] > limits["quantity_sold"])
+    )
+
+
+RULES = {
+    rule.module: rule
+    for rule in [
+        Rule("revenue_profit", "profit margin < 5%",
+             ("profit_margin_percent",), (), "profit", _low_margin),
+        Rule("discount_leakage", "discount > 30% and profit margin < 5%",
+             ("discount_percent", "profit_margin_percent"), (),
+             "discount_amount", _high_discount),
+        Rule("inventory_leakage",
+             "inventory > 2x reorder level or top-quartile holding cost",
+             ("inventory_level", "reorder_level", "holding_cost"),
+             ("holding_cost",), "holding_cost", _overstock),
+        Rule("inventory_stockout", "inventory at or below reorder level",
+             ("inventory_level", "reorder_level"), (), "revenue", _stockout),
+        Rule("payment_delays",
+             "top-quartile payment delay or outstanding amount",
+             ("payment_delay_days", "outstanding_amount"),
+             ("payment_delay_days", "outstanding_amount"),
+             "outstanding_amount", _late_payment),
+        Rule("returns_refunds",
+             "top-quartile refund amount or quantity sold",
+             ("refund_amount", "quantity_sold"),
+             ("refund_amount", "quantity_sold"),
+             "refund_amount", _high_refund),
+    ]
+}
+
+MODULES = list(RULES)
+
+
+def rule_columns(modules=MODULES):
+    """Columns read by the rules of ``modules``, without duplicates."""
+    return list(dict.fromkeys(c for m in modules for c in RULES[m].columns))
+
+
+def percentile_columns(modules=MODULES):
+    """Columns whose top-quartile threshold the rules of ``modules`` need."""
+    return list(dict.fromkeys(c for m in modules for c in RULES[m].percentiles))
+
+
+def thresholds(summary, modules=MODULES):
+    """Top-quartile thresholds needed by ``modules``, from ``summary``."""
+    return {
+        col: summary.quantile(col, TOP_QUARTILE)
+        for col in percentile_columns(modules)
+    }
+
+
+def evaluate(frame, limits=None, modules=MODULES):
+    """Boolean flag array per module, evaluated in one pass over ``frame``.
+
+    ``limits`` maps columns to their percentile thresholds; when omitted
+    they are computed exactly from ``frame`` itself.
+    """
+    if limits is None:
+        limits = thresholds(FrameSummary(frame), modules)
+    cols = {col: frame[col].to_numpy() for col in rule_columns(modules)}
+    return {m: np.asarray(RULES[m].test(cols, limits)) for m in modules}
+
+
+def flag(frame, module, summary=None):
+    """Flags of a single module, with thresholds taken from ``summary``."""
+    summary = FrameSummary(frame) if summary is None else summary
+    return evaluate(frame, thresholds(summary, [module]), [module])[module]
+
+
+def expression(module, limits):
+    """The rule of ``module`` as an Arrow filter expression.
+
+    ``limits`` are its percentile thresholds, as for :func:`evaluate`.
+    """
+    rule = RULES[module]
+    return rule.test({col: pc.field(col) for col in rule.columns}, limits)
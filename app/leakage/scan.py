@@ -0,0 +1,159 @@
+"""Out-of-core query backend over the partitioned Parquet dataset.
+
+With ``LEAKAGE_BACKEND=scan`` the pages never hold the whole dataset in
+memory. A :class:`DatasetScanner` answers their filters straight from the
+month partitions with an Arrow dataset scan: slider ranges and selected
+ids become one predicate that Arrow checks against each row group's
+min/max statistics before reading it, and only the columns a page shows
+or flags on are decoded. Slider bounds come from the same statistics, so
+opening a page reads no column data at all.
+
+The scanner mirrors the parts of :class:`~leakage.filters.RangeIndex` the
+pages use (``bounds``, ``normalize``, ``len``), so chart cache keys are
+identical under both backends.
+
+A page never reads its whole selection at once: it counts, folds over
+batches of at most ``BATCH_ROWS`` rows or takes single table pages
+(:class:`~leakage.selection.ScanSelection`). Leakage rules are pushed
+down as an extra ``where`` expression, so only flagged rows are read for
+the flagged-order tables.
+"""
+
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from .filters import normalize_ranges
+
+# Rows per batch a page folds over; smaller selections are read as one frame.
+BATCH_ROWS = int(os.environ.get("LEAKAGE_SCAN_BATCH_ROWS", 1_000_000))
+
+
+class DatasetScanner:
+    """Filter and projection pushdown over a partitioned Parquet dataset."""
+
+    def __init__(self, path):
+        # Side files (``_cube.parquet``, rollups, ...) are skipped by the
+        # dataset's default ``_`` and ``.`` ignore prefixes.
+        self.dataset = ds.dataset(path, format="parquet")
+        self._fragments = list(self.dataset.get_fragments())
+        for fragment in self._fragments:
+            fragment.ensure_complete_metadata()
+        self.n_rows = sum(
+            group.num_rows
+            for fragment in self._fragments
+            for group in fragment.row_groups
+        )
+        self._bounds = {}
+
+    def __len__(self):
+        return self.n_rows
+
+    def bounds(self, col):
+        """``(min, max)`` of a column from the row-group statistics."""
+        if col not in self._bounds:
+            stats = [
+                group.statistics[col]
+                for fragment in self._fragments
+                for group in fragment.row_groups
+                if group.num_rows and group.statistics.get(col)
+            ]
+            self._bounds[col] = (
+                min(s["min"] for s in stats), max(s["max"] for s in stats)
+            )
+        return self._bounds[col]
+
+    def normalize(self, ranges):
+        """Canonical, hashable form of ``ranges`` (see ``RangeIndex.normalize``)."""
+        return normalize_ranges(ranges, self.bounds)
+
+    def _literal(self, col, value):
+        """A slider bound in the type of a floating column ``col``.
+
+        A float64 literal would compare a float32 column at float64, unlike
+        the in-memory backend (``RangeIndex._cast``), and keep different
+        boundary rows.
+        """
+        dtype = self.dataset.schema.field(col).type
+        if not pa.types.is_floating(dtype):
+            return value
+        return pa.scalar(value, type=dtype)
+
+    def predicate(self, ranges, entities=None, where=None):
+        """Arrow expression for ``ranges``, ``{id column: ids}`` and ``where``.
+
+        ``where`` is any further Arrow expression, such as a leakage rule
+        (:func:`leakage.rules.expression`). Returns ``None`` when there is
+        nothing to filter on.
+        """
+        terms = [
+            (pc.field(col) >= self._literal(col, low))
+            & (pc.field(col) <= self._literal(col, high))
+            for col, low, high in self.normalize(ranges)
+        ]
+        terms += [
+            pc.field(col).isin(list(ids))
+            for col, ids in (entities or {}).items() if len(ids)
+        ]
+        if where is not None:
+            terms.append(where)
+        if not terms:
+            return None
+        expression = terms[0]
+        for term in terms[1:]:
+            expression = expression & term
+        return expression
+
+    def read(self, ranges, columns, entities=None):
+        """Rows inside ``ranges`` and ``entities``, with only ``columns`` read.
+
+        Rows come back in dataset order, like ``frame.iloc[rows]`` on the
+        in-memory backend.
+        """
+        return self.to_frame(self.predicate(ranges, entities), columns)
+
+    def to_frame(self, expression, columns):
+        """Rows matching the Arrow ``expression``, with only ``columns`` read."""
+        table = self.dataset.to_table(
+            columns=list(dict.fromkeys(columns)), filter=expression
+        )
+        return table.to_pandas()
+
+    def count(self, expression):
+        """Rows matching ``expression``; row-group metadata when unfiltered."""
+        return self.dataset.count_rows(filter=expression)
+
+    def batches(self, expression, columns, batch_rows=BATCH_ROWS):
+        """Rows matching ``expression`` as frames of up to ``batch_rows`` rows.
+
+        Arrow's record batches follow row groups, so consecutive ones are
+        combined until a frame holds ``batch_rows`` rows; a selection of
+        at most that many rows comes back as a single frame. At least one
+        frame is always yielded, empty when nothing matches.
+        """
+        columns = list(dict.fromkeys(columns))
+        pending, rows, yielded = [], 0, False
+        for batch in self.dataset.to_batches(
+            columns=columns, filter=expression, batch_size=batch_rows,
+        ):
+            if not batch.num_rows:
+                continue
+            if rows + batch.num_rows > batch_rows and pending:
+                yield pa.Table.from_batches(pending).to_pandas()
+                pending, rows, yielded = [], 0, True
+            pending.append(batch)
+            rows += batch.num_rows
+        if pending:
+            yield pa.Table.from_batches(pending).to_pandas()
+        elif not yielded:
+            schema = pa.schema([self.dataset.schema.field(col) for col in columns])
+            yield schema.empty_table().to_pandas()
+
+    def take(self, expression, positions, columns):
+        """Rows at ``positions`` among those matching ``expression``, in that order."""
+        scanner = self.dataset.scanner(
+            columns=list(dict.fromkeys(columns)), filter=expression
+        )
+        return scanner.take(pa.array(positions, type=pa.int64())).to_pandas()
@@ -0,0 +1,141 @@
+"""Dataset locations and column types for the cleaned leakage dataset."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ---------------- LOCATIONS ----------------
+ROOT_DIR = Path(__file__).resolve().parents[2]
+DATA_DIR = Path(os.environ.get("LEAKAGE_DATA_DIR", ROOT_DIR / "data"))
+RAW_CSV = DATA_DIR / "raw" / "profit_leakage_large_dataset.csv"
+PROCESSED_DIR = DATA_DIR / "processed"
+CLEANED_CSV = PROCESSED_DIR / "profit_leakage_cleaned.csv"
+CLEANED_PARQUET = PROCESSED_DIR / "profit_leakage_cleaned.parquet"
+# Memory-mapped column exports of the cleaned dataset, one per version.
+COLUMN_DIR = PROCESSED_DIR / "profit_leakage_cleaned.columns"
+
+# ---------------- COLUMN TYPES ----------------
+DATE_COLUMN = "order_date"
+
+CATEGORY_COLUMNS = [
+    "customer_type",
+    "region",
+    "sales_channel",
+    "product_category",
+]
+
+INTEGER_COLUMNS = [
+    "order_id",
+    "customer_id",
+    "product_id",
+    "quantity_sold",
+    "return_flag",
+    "inventory_level",
+    "reorder_level",
+    "payment_delay_days",
+    "supplier_delay_days",
+]
+
+# Bounded two-decimal measurements are safe to hold as float32.
+FLOAT32_COLUMNS = [
+    "unit_cost",
+    "unit_price",
+    "discount_percent",
+    "holding_cost",
+    "logistics_cost",
+    "operational_cost",
+    "profit_margin_percent",
+]
+
+# Money columns are summed into KPI totals and checked against the
+# profit invariant, so they keep full float64 precision.
+MONEY_COLUMNS = [
+    "revenue",
+    "cost",
+    "discount_amount",
+    "net_revenue",
+    "profit",
+    "refund_amount",
+    "outstanding_amount",
+]
+
+COLUMNS = [
+    "order_id",
+    "order_date",
+    "customer_id",
+    "customer_type",
+    "region",
+    "sales_channel",
+    "product_id",
+    "product_category",
+    "unit_cost",
+    "unit_price",
+    "quantity_sold",
+    "revenue",
+    "cost",
+    "discount_percent",
+    "discount_amount",
+    "net_revenue",
+    "profit",
+    "return_flag",
+    "refund_amount",
+    "inventory_level",
+    "reorder_level",
+    "holding_cost",
+    "payment_delay_days",
+    "outstanding_amount",
+    "supplier_delay_days",
+    "logistics_cost",
+    "operational_cost",
+    "profit_margin_percent",
+]
+
+
+def optimize_dtypes(df, downcast_integers=True):
+    """Convert a cleaned frame to compact dtypes in place and return it.
+
+    Categories become ``category``, integer columns are downcast to the
+    smallest type that holds them, bounded measurements become float32 and
+    ``order_date`` is parsed to datetime. Already-typed columns are left
+    untouched, so the call is cheap on frames read back from Parquet.
+
+    Pass ``downcast_integers=False`` when writing chunks that must share one
+    on-disk schema; the integers are then stored as int64.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(df[DATE_COLUMN]):
+        df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN])
+
+    for col in CATEGORY_COLUMNS:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    for col in INTEGER_COLUMNS:
+        if downcast_integers:
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif df[col].dtype != np.int64:
+            df[col] = df[col].astype(np.int64)
+
+    for col in FLOAT32_COLUMNS:
+        if df[col].dtype != np.float32:
+            df[col] = df[col].astype(np.float32)
+
+    for col in MONEY_COLUMNS:
+        if df[col].dtype != np.float64:
+            df[col] = df[col].astype(np.float64)
+
+    return df
+
+
+def month_labels(dates):
+    """``YYYY-MM`` label of every timestamp in a datetime Series.
+
+    Each distinct month is formatted once and the labels are gathered by
+    code, which is far cheaper than ``dt.strftime`` on every row. Returns
+    a categorical Series aligned with ``dates``.
+    """
+    months = dates.to_numpy().astype("datetime64[M]")
+    uniques, codes = np.unique(months, return_inverse=True)
+    labels = np.datetime_as_string(uniques, unit="M")
+    return pd.Series(pd.Categorical.from_codes(codes, labels), index=dates.index)
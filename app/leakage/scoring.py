@@ -0,0 +1,403 @@
+"""Segment-wise outlier scores for discounts and margins.
+
+``notebooks/04_module2_discounts.ipynb`` flags discounts with a single
+global z-score and ``notebooks/03_module1_revenue_profit.ipynb`` min-max
+normalises one copied column at a time. Here every scored column is
+judged against its own segment, ``product_category`` x ``region`` x
+``sales_channel``:
+
+- robust z: ``(x - median) / (1.4826 * MAD)``, where MAD is the median
+  absolute deviation from the segment median (the factor makes it agree
+  with the standard z on normal data; NaN when the segment's MAD is 0)
+- min-max: ``(x - min) / (max - min)`` within the segment (0 when the
+  segment holds a single value)
+
+All columns are scored together. The rows are grouped once into a single
+integer segment code, the per-segment statistics of the whole
+``rows x columns`` value matrix come from that one grouping, and scoring
+is a gather of those statistics by segment code. No per-column frame
+copies are made.
+
+The per-segment statistics are the materialised feature table:
+:class:`SegmentScores` holds one row per segment (a few dozen) and is
+kept beside the dataset as ``_segment_scores.parquet`` by the pipeline,
+so the dashboards score any filtered subset without revisiting the rest
+of the data.
+
+Medians do not merge, so the pipeline keeps :class:`SegmentSketches`
+next to it (``_segment_sketches.parquet``): per segment, the order count,
+the min and max of every scored column and a KLL sketch of its values.
+Each ingested chunk updates the sketches of the segments it touches, and
+only those segments' rows are recomputed. The median and MAD then come
+from the sketch, with a rank error of about 0.2% (``SCORE_KLL_K``);
+:meth:`SegmentScores.from_frame` stays exact. From the command line::
+
+    python -m app.leakage.scoring --out data/processed/leakage
+
+writes the per-order feature table (``order_scores.parquet``) and the
+exact per-segment statistics it was scored with
+(``segment_scores.parquet``) for batch use. Both go to ``--out`` only:
+the dataset is a published version (:mod:`leakage.versions`) and is
+never written to.
+"""
+
+import argparse
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .detect import write_table
+from .schema import CLEANED_PARQUET, PROCESSED_DIR
+from .sketches import KLLSketch
+
+SEGMENT_COLUMNS = ["product_category", "region", "sales_channel"]
+SCORE_COLUMNS = [
+    "discount_percent",
+    "discount_amount",
+    "profit_margin_percent",
+    "profit",
+    "revenue",
+]
+SCORES_FILE = "_segment_scores.parquet"
+SKETCHES_FILE = "_segment_sketches.parquet"
+ORDER_SCORES_FILE = "order_scores.parquet"
+# Exact per-segment statistics written by the CLI, beside the order table.
+SEGMENT_SCORES_FILE = "segment_scores.parquet"
+DEFAULT_OUT = PROCESSED_DIR / "leakage"
+STATISTICS = ["median", "mad", "min", "max"]
+
+# Scales the MAD to a standard deviation for normally distributed data.
+MAD_SCALE = 1.4826
+# There are only segments x scored columns sketches, so a large k is
+# cheap; it keeps the rank error of the pipeline's medians near 0.2%.
+SCORE_KLL_K = 2000
+
+
+def _segment_codes(frame, categories):
+    """Segment number of every row, -1 where a value is missing or unknown."""
+    codes = np.zeros(len(frame), dtype=np.int64)
+    valid = np.ones(len(frame), dtype=bool)
+    for col in SEGMENT_COLUMNS:
+        part = pd.Categorical(frame[col], categories=categories[col]).codes
+        valid &= part >= 0
+        codes = codes * len(categories[col]) + part
+    return np.where(valid, codes, -1)
+
+
+class SegmentScores:
+    """Per-segment median, MAD, min and max of the scored columns."""
+
+    def __init__(self, table, columns=SCORE_COLUMNS):
+        self.table = table.reset_index(drop=True)
+        self.columns = list(columns)
+        self.categories = {
+            col: pd.Index(sorted(self.table[col].unique())) for col in SEGMENT_COLUMNS
+        }
+        shape = [len(self.categories[col]) for col in SEGMENT_COLUMNS]
+        codes = _segment_codes(self.table, self.categories)
+        # Segment code -> row of ``table`` (-1 for segments never seen).
+        self._slot = np.full(int(np.prod(shape)) + 1, -1)
+        self._slot[codes] = np.arange(len(self.table))
+        self._stats = {
+            stat: self.table[[f"{c}_{stat}" for c in self.columns]].to_numpy()
+            for stat in STATISTICS
+        }
+
+    @classmethod
+    def from_frame(cls, frame, columns=SCORE_COLUMNS):
+        categories = {
+            col: pd.Index(sorted(pd.Categorical(frame[col]).categories))
+            for col in SEGMENT_COLUMNS
+        }
+        codes = _segment_codes(frame, categories)
+        keep = codes >= 0
+        codes = codes[keep]
+        values = frame[columns].to_numpy(np.float64)[keep]
+
+        grouped = pd.DataFrame(values, copy=False).groupby(codes, sort=True)
+        median = grouped.median().to_numpy()
+        segments = grouped.size()
+        slot = np.searchsorted(segments.index.to_numpy(), codes)
+        deviation = np.abs(values - median[slot])
+        mad = pd.DataFrame(deviation, copy=False).groupby(codes, sort=True).median()
+
+        shape = [len(categories[col]) for col in SEGMENT_COLUMNS]
+        keys = np.unravel_index(segments.index.to_numpy(), shape)
+        table = pd.DataFrame({
+            col: categories[col][key] for col, key in zip(SEGMENT_COLUMNS, keys)
+        })
+        table["orders"] = segments.to_numpy()
+        stats = {
+            "median": median, "mad": mad.to_numpy(),
+            "min": grouped.min().to_numpy(), "max": grouped.max().to_numpy(),
+        }
+        for stat in STATISTICS:
+            for i, col in enumerate(columns):
+                table[f"{col}_{stat}"] = stats[stat][:, i]
+        return cls(table, columns)
+
+    def __len__(self):
+        return len(self.table)
+
+    def score(self, frame, columns=None):
+        """Robust z and min-max score of every row of ``frame``, by segment.
+
+        Returns a float32 frame aligned with ``frame`` holding
+        ``<col>_z`` and ``<col>_minmax`` per scored column. Rows whose
+        segment is unknown score NaN.
+        """
+        columns = self.columns if columns is None else list(columns)
+        picked = [self.columns.index(col) for col in columns]
+        codes = _segment_codes(frame, self.categories)
+        slot = np.where(codes >= 0, self._slot[codes], -1)
+        known = slot >= 0
+        slot = np.where(known, slot, 0)
+
+        def stat(name):
+            values = self._stats[name][:, picked][slot]
+            values[~known] = np.nan
+            return values
+
+        values = frame[columns].to_numpy(np.float64)
+        median, mad, low, high = (stat(name) for name in STATISTICS)
+        spread = high - low
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where(mad > 0, (values - median) / (MAD_SCALE * mad), np.nan)
+            minmax = np.where(spread > 0, (values - low) / spread, 0.0)
+        minmax[~known] = np.nan
+
+        out = {}
+        for i, col in enumerate(columns):
+            out[f"{col}_z"] = z[:, i].astype(np.float32)
+            out[f"{col}_minmax"] = minmax[:, i].astype(np.float32)
+        return pd.DataFrame(out, index=frame.index)
+
+    def outliers(self, frames, columns, limit=2.0, top=10):
+        """Rows scored more than ``limit`` robust z out on any of ``columns``.
+
+        ``frames`` are the rows in batches, scored one at a time. Returns
+        how many rows are out and the ``top`` most extreme of them, by
+        whichever score is further out, with their ``<col>_z`` columns
+        joined on.
+        """
+        z_columns = [f"{col}_z" for col in columns]
+        count, worst = 0, None
+        for frame in frames:
+            scores = self.score(frame, columns)[z_columns]
+            out = (scores.abs().max(axis=1) > limit).to_numpy()
+            count += int(out.sum())
+            if worst is not None and not out.any():
+                continue
+            candidates = frame[out].join(scores[out])
+            if worst is not None and len(worst):
+                candidates = pd.concat([worst, candidates])
+            extremity = candidates[z_columns].abs().max(axis=1)
+            worst = candidates.iloc[
+                extremity.reset_index(drop=True).nlargest(top).index
+            ]
+        return count, worst
+
+    def save(self, path):
+        tmp = Path(path).with_suffix(".tmp")
+        self.table.to_parquet(tmp, index=False)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path, columns=SCORE_COLUMNS):
+        return cls(pd.read_parquet(path), columns)
+
+
+def order_scores(frame, scores):
+    """The per-order feature table: id, segment and every score."""
+    table = frame[["order_id"] + SEGMENT_COLUMNS].reset_index(drop=True)
+    return pd.concat(
+        [table, scores.score(frame).reset_index(drop=True)], axis=1
+    )
+
+
+def _weighted_median(values, weights):
+    cumulative = np.cumsum(weights)
+    return values[np.searchsorted(cumulative, cumulative[-1] / 2)]
+
+
+def sketch_median_mad(sketch):
+    """Median and MAD of the values a KLL sketch summarises.
+
+    The MAD is the weighted median of the retained items' distances from
+    the median, so it carries the same rank error as the median.
+    """
+    if not sketch.n:
+        return float("nan"), float("nan")
+    items, weights = sketch.weighted_items()
+    median = _weighted_median(items, weights)
+    deviation = np.abs(items - median)
+    order = np.argsort(deviation, kind="stable")
+    return float(median), float(_weighted_median(deviation[order], weights[order]))
+
+
+@dataclass
+class _SegmentState:
+    orders: int
+    low: np.ndarray
+    high: np.ndarray
+    sketches: list
+
+
+class SegmentSketches:
+    """Mergeable per-segment state from which the score table is derived."""
+
+    def __init__(self, columns=SCORE_COLUMNS):
+        self.columns = list(columns)
+        self.segments = {}
+
+    def __len__(self):
+        return len(self.segments)
+
+    def _state(self, key):
+        state = self.segments.get(key)
+        if state is None:
+            n = len(self.columns)
+            state = self.segments[key] = _SegmentState(
+                0, np.full(n, np.nan), np.full(n, np.nan),
+                [KLLSketch(SCORE_KLL_K) for _ in self.columns],
+            )
+        return state
+
+    def update(self, frame):
+        """Add the rows of ``frame``; returns the segment keys they touch.
+
+        Rows with a missing segment value are skipped, as in
+        :meth:`SegmentScores.from_frame`.
+        """
+        values = frame[self.columns].to_numpy(np.float64)
+        grouped = frame.groupby(
+            [frame[col] for col in SEGMENT_COLUMNS], observed=True, sort=False
+        )
+        touched = set()
+        for key, rows in grouped.indices.items():
+            key = tuple(str(part) for part in key)
+            block = values[rows]
+            state = self._state(key)
+            state.orders += len(rows)
+            state.low = np.fmin(state.low, np.fmin.reduce(block, axis=0))
+            state.high = np.fmax(state.high, np.fmax.reduce(block, axis=0))
+            for sketch, column in zip(state.sketches, block.T):
+                sketch.update(column)
+            touched.add(key)
+        return touched
+
+    def table(self, keys=None):
+        """Rows of the :class:`SegmentScores` table for ``keys`` (default all)."""
+        keys = sorted(self.segments if keys is None else keys)
+        rows = []
+        for key in keys:
+            state = self.segments[key]
+            row = dict(zip(SEGMENT_COLUMNS, key), orders=state.orders)
+            stats = [sketch_median_mad(sketch) for sketch in state.sketches]
+            for i, col in enumerate(self.columns):
+                row[f"{col}_median"], row[f"{col}_mad"] = stats[i]
+                row[f"{col}_min"] = state.low[i]
+                row[f"{col}_max"] = state.high[i]
+            rows.append(row)
+        columns = SEGMENT_COLUMNS + ["orders"] + [
+            f"{col}_{stat}" for stat in STATISTICS for col in self.columns
+        ]
+        return pd.DataFrame(rows, columns=columns)
+
+    def save(self, path):
+        table = pd.DataFrame(list(self.segments), columns=SEGMENT_COLUMNS)
+        states = list(self.segments.values())
+        table["orders"] = [state.orders for state in states]
+        for i, col in enumerate(self.columns):
+            table[f"{col}_min"] = [state.low[i] for state in states]
+            table[f"{col}_max"] = [state.high[i] for state in states]
+            table[f"kll_{col}"] = [state.sketches[i].to_bytes() for state in states]
+        tmp = Path(path).with_suffix(".tmp")
+        table.to_parquet(tmp, index=False)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path, columns=SCORE_COLUMNS):
+        sketches = cls(columns)
+        for row in pd.read_parquet(path).itertuples(index=False):
+            row = row._asdict()
+            sketches.segments[tuple(row[col] for col in SEGMENT_COLUMNS)] = (
+                _SegmentState(
+                    int(row["orders"]),
+                    np.array([row[f"{col}_min"] for col in columns]),
+                    np.array([row[f"{col}_max"] for col in columns]),
+                    [KLLSketch.from_bytes(row[f"kll_{col}"]) for col in columns],
+                )
+            )
+        return sketches
+
+
+class SegmentScoreAccumulator:
+    """Pipeline builder that maintains ``_segment_scores.parquet``.
+
+    Chunks update the :class:`SegmentSketches` kept beside it; on commit
+    only the segments the run touched are recomputed and the state is
+    saved. The dataset is never read back, except once to seed the state
+    of a dataset built before the state file existed.
+    """
+
+    def __init__(self, dataset_dir, append):
+        self.dataset_dir = Path(dataset_dir)
+        self.append = append
+        state = self.dataset_dir / SKETCHES_FILE
+        self.sketches = SegmentSketches()
+        if append and state.exists():
+            self.sketches = SegmentSketches.load(state)
+        elif append and (self.dataset_dir / SCORES_FILE).exists():
+            for part in sorted(self.dataset_dir.glob("*/*.parquet")):
+                self.sketches.update(pd.read_parquet(
+                    part, columns=SEGMENT_COLUMNS + SCORE_COLUMNS
+                ))
+        self.touched = set()
+
+    def add(self, chunk):
+        self.touched |= self.sketches.update(chunk)
+
+    def commit(self):
+        if not self.touched:
+            return
+        path = self.dataset_dir / SCORES_FILE
+        table = self.sketches.table(self.touched)
+        if self.append and path.exists():
+            kept = pd.read_parquet(path)
+            stale = pd.MultiIndex.from_frame(kept[SEGMENT_COLUMNS]).isin(
+                list(self.touched)
+            )
+            table = pd.concat([kept[~stale], table], ignore_index=True)
+            table = table.sort_values(SEGMENT_COLUMNS, kind="stable")
+        SegmentScores(table).save(path)
+        self.sketches.save(self.dataset_dir / SKETCHES_FILE)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", type=Path, default=CLEANED_PARQUET,
+                        help="cleaned Parquet dataset (file or directory)")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT,
+                        help="directory for the per-order feature table")
+    args = parser.parse_args(argv)
+
+    frame = pd.read_parquet(
+        args.data, columns=["order_id"] + SEGMENT_COLUMNS + SCORE_COLUMNS
+    )
+    scores = SegmentScores.from_frame(frame)
+    table = order_scores(frame, scores)
+    args.out.mkdir(parents=True, exist_ok=True)
+    scores.save(args.out / SEGMENT_SCORES_FILE)
+    write_table(table, args.out / ORDER_SCORES_FILE)
+    outliers = (table[[f"{c}_z" for c in SCORE_COLUMNS]].abs() > 2).sum()
+    print(f"{len(scores)} segments, {len(table):,} orders scored")
+    print(outliers.rename("orders with |z| > 2").to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""The rows a page's filters select, read the way the page consumes them.
+
+Pages used to receive their filtered rows as one frame, which under the
+scan backend meant reading the page's columns over the whole history on
+the default view. A selection hands the rows out only as the page uses
+them:
+
+- ``len`` and :meth:`summary` for the KPI tiles
+- :meth:`flagged`: the rows a leakage rule flags, itself a selection
+- :meth:`batches`: frames to fold over, for the charts
+  (:mod:`leakage.plots`), segment outliers and the cap what-if
+- :meth:`column` and :meth:`take`: sort keys and the rows of one table
+  page (:mod:`leakage.tables`)
+
+A :class:`FrameSelection` wraps rows already in memory. Its single batch
+is the frame itself, so every fold gives exactly what the frame gave. A
+:class:`ScanSelection` holds only an Arrow filter expression. A rule
+becomes one more term of it, and counts come from ``count_rows``. A
+selection of up to ``BATCH_ROWS`` rows is read as one frame and stays
+exact. Larger ones are folded batch by batch, with quantiles and
+distinct counts sketched like the cube's (:class:`~leakage.cube.BatchSummary`).
+"""
+
+from .cube import BatchSummary, FrameSummary
+from .rules import expression as rule_expression
+from .rules import flag, thresholds
+
+
+class FrameSelection:
+    """Selected rows held as a frame."""
+
+    def __init__(self, frame, narrowed=True):
+        self.frame = frame
+        # False when no filter applied, so the cube answers the KPIs
+        self.narrowed = narrowed
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def nbytes(self):
+        return int(self.frame.memory_usage(index=True).sum())
+
+    def batches(self, columns=None):
+        """The frame, as the one batch; it holds at least ``columns``."""
+        yield self.frame
+
+    def column(self, col):
+        return self.frame[col]
+
+    def take(self, positions, columns):
+        return self.frame.iloc[positions][columns]
+
+    def summary(self):
+        return FrameSummary(self.frame)
+
+    def flagged(self, module, summary):
+        """The rows the rule of ``module`` flags, thresholds from ``summary``."""
+        return FrameSelection(self.frame[flag(self.frame, module, summary)])
+
+
+class ScanSelection:
+    """Selected rows of a :class:`~leakage.scan.DatasetScanner`, read on demand.
+
+    ``columns`` are the page's columns, what :meth:`batches` and
+    :meth:`summary` read by default. The row count and the flagged
+    selections are kept once computed, so a selection cached on the
+    snapshot answers a repeated rerun without scanning again.
+    """
+
+    def __init__(self, scanner, expression, columns, narrowed=True):
+        self.scanner = scanner
+        self.expression = expression
+        self.columns = list(columns)
+        self.narrowed = narrowed
+        self._count = None
+        self._flagged = {}
+
+    def __len__(self):
+        if self._count is None:
+            self._count = self.scanner.count(self.expression)
+        return self._count
+
+    @property
+    def nbytes(self):
+        # Only counts and expressions are held, never rows.
+        return 0
+
+    def batches(self, columns=None):
+        return self.scanner.batches(self.expression, columns or self.columns)
+
+    def column(self, col):
+        return self.scanner.to_frame(self.expression, [col])[col]
+
+    def take(self, positions, columns):
+        return self.scanner.take(self.expression, positions, columns)
+
+    def summary(self):
+        """Exact :class:`FrameSummary` of one batch, else a :class:`BatchSummary`."""
+        frames = self.batches()
+        first = next(frames)
+        second = next(frames, None)
+        if second is None:
+            return FrameSummary(first)
+        summary = BatchSummary().add(first).add(second)
+        for frame in frames:
+            summary.add(frame)
+        return summary
+
+    def flagged(self, module, summary):
+        """The rows the rule of ``module`` flags, pushed down into the scan."""
+        limits = thresholds(summary, [module])
+        key = module, tuple(sorted(limits.items()))
+        selection = self._flagged.get(key)
+        if selection is None:
+            where = rule_expression(module, limits)
+            if self.expression is not None:
+                where = self.expression & where
+            selection = ScanSelection(self.scanner, where, self.columns)
+            self._flagged[key] = selection
+        return selection
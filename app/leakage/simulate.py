@@ -0,0 +1,302 @@
+"""What-if simulation of discount caps per category and sales channel.
+
+The discount page recommends discount caps; this evaluates them. A cap
+``c`` on a segment limits each of its orders to ``min(discount_percent,
+c)``. Quantities and prices are left as they are (demand is not modelled),
+so every figure of an order follows from the dataset's own identities::
+
+    discount_amount       = revenue * discount_percent / 100
+    net_revenue           = revenue - discount_amount
+    profit                = net_revenue - cost
+    profit_margin_percent = profit / net_revenue * 100
+
+Under a cap all four move by the order's recovered discount,
+``revenue * max(discount_percent - c, 0) / 100``, which is also the
+profit the cap recovers.
+
+A scenario sets one cap per ``product_category`` x ``sales_channel``
+segment (``NO_CAP`` leaves a segment alone), so a batch of scenarios is a
+``scenarios x segments`` cap matrix. :meth:`CapSimulator.run` evaluates
+the whole batch over every order at once. Orders are kept sorted by
+segment, then discount. Each segment's orders are processed in chunks.
+Within a chunk, the ``orders x scenarios`` matrix of excess discount
+points comes from broadcasting the orders' discounts against that
+segment's row of caps. Only the scenarios whose cap is below the
+segment's largest discount get a column; the other scenarios leave the
+segment untouched. Since discounts ascend within a segment, the same
+holds per chunk with the chunk's largest discount, so low-discount chunks
+skip most caps. Every per-scenario result is then one reduction:
+
+- recovered profit: a matrix-vector product with the revenue column
+- discount, net revenue and profit totals: the base totals moved by it
+- orders whose discount a cap lowers: a binary search in the sorted
+  discounts
+- orders still flagged by the discount-leakage rule: one comparison
+  against a per-order limit, since the recomputed margin and discount of
+  an order cross the rule's thresholds at fixed excess values
+
+Chunks are sized so the matrices stay within ``MEMORY_BYTES``.
+:meth:`CapSimulator.orders` recomputes the four columns per order for a
+single scenario. Every figure of a scenario is a sum over its orders, so
+:func:`cap_grid` evaluates orders that arrive in batches (a scanned
+selection) batch by batch and adds the grids up. From the command line::
+
+    python -m app.leakage.simulate --caps 0 40 1
+
+writes the segment x cap grid (``discount_caps.parquet``).
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .detect import write_table
+from .rules import HIGH_DISCOUNT_PERCENT, LOW_MARGIN_PERCENT
+from .schema import CLEANED_PARQUET, PROCESSED_DIR
+
+SEGMENT_COLUMNS = ["product_category", "sales_channel"]
+SIMULATION_COLUMNS = SEGMENT_COLUMNS + [
+    "revenue", "discount_percent", "net_revenue", "profit",
+]
+GRID_FILE = "discount_caps.parquet"
+DEFAULT_OUT = PROCESSED_DIR / "leakage"
+# Cap values (percent) of the default grid.
+DEFAULT_CAPS = np.arange(0, 41, 1.0)
+
+NO_CAP = np.inf
+# Label of the scenarios that cap every segment at once.
+ALL_SEGMENTS = "All"
+# Working memory of one chunk: the excess matrix and a comparison mask.
+MEMORY_BYTES = 64 * 2**20
+_CELL_BYTES = 8 + 1
+
+
+class CapSimulator:
+    """Discount-cap scenarios over the orders of a frame."""
+
+    def __init__(self, frame):
+        categories = [pd.Categorical(frame[col]) for col in SEGMENT_COLUMNS]
+        self.segments = pd.MultiIndex.from_product(
+            [c.categories for c in categories], names=SEGMENT_COLUMNS
+        ).to_frame(index=False)
+        codes = np.zeros(len(frame), dtype=np.intp)
+        valid = np.ones(len(frame), dtype=bool)
+        for part in categories:
+            valid &= part.codes >= 0
+            codes = codes * len(part.categories) + part.codes
+        codes = np.where(valid, codes, -1)
+
+        # Segment, then discount order; orders outside every segment
+        # (code -1) come first and are never capped.
+        discount = frame["discount_percent"].to_numpy(np.float64)
+        self._order = np.lexsort((discount, codes))
+        self.codes = codes[self._order]
+        self.discount = discount[self._order]
+        self.revenue = frame["revenue"].to_numpy(np.float64)[self._order]
+        self.net_revenue = frame["net_revenue"].to_numpy(np.float64)[self._order]
+        self.profit = frame["profit"].to_numpy(np.float64)[self._order]
+        self._leakage_limit = self._excess_limit()
+
+        bounds = np.searchsorted(self.codes, np.arange(-1, len(self.segments) + 1))
+        self._starts, self._stops = bounds[1:-1], bounds[2:]
+        # Running count of the orders the discount-leakage rule flags
+        # before any cap.
+        self._flagged = np.r_[0, np.cumsum(self._leakage_limit > 0)]
+
+    def __len__(self):
+        return len(self.revenue)
+
+    def _excess_limit(self):
+        """Excess discount points below which an order stays flagged.
+
+        With ``d = revenue * excess / 100`` recovered, the margin stays
+        under ``LOW_MARGIN_PERCENT`` while ``profit + d < f * (net_revenue
+        + d)`` (``f`` the threshold as a fraction), i.e. while ``excess``
+        is under a per-order limit; the discount stays above
+        ``HIGH_DISCOUNT_PERCENT`` while ``excess < discount - HIGH``.
+        """
+        f = LOW_MARGIN_PERCENT / 100
+        with np.errstate(divide="ignore", invalid="ignore"):
+            margin_limit = (
+                100 * (f * self.net_revenue - self.profit)
+                / ((1 - f) * self.revenue)
+            )
+            margin = 100 * self.profit / self.net_revenue
+        # Zero revenue recovers nothing; the order keeps its current margin.
+        margin_limit = np.where(
+            self.revenue > 0, margin_limit,
+            np.where(margin < LOW_MARGIN_PERCENT, np.inf, -np.inf),
+        )
+        return np.minimum(margin_limit, self.discount - HIGH_DISCOUNT_PERCENT)
+
+    def run(self, caps, memory_bytes=MEMORY_BYTES):
+        """Totals of every scenario of a ``scenarios x segments`` cap matrix.
+
+        Returns one row per scenario: the recomputed ``discount_amount``,
+        ``net_revenue``, ``profit`` and ``profit_margin_percent`` totals,
+        ``recovered_profit``, ``capped_orders`` (orders whose discount the
+        cap lowers) and ``leakage_orders`` (orders the discount-leakage
+        rule still flags).
+        """
+        caps = np.atleast_2d(np.asarray(caps, dtype=np.float64))
+        n_scenarios = len(caps)
+        recovered = np.zeros(n_scenarios)
+        capped = np.zeros(n_scenarios, dtype=np.int64)
+        # Until a cap applies, an order stays as flagged as it was.
+        leakage = np.full(n_scenarios, self._flagged[-1])
+
+        for segment in range(len(self.segments)):
+            start, stop = self._starts[segment], self._stops[segment]
+            if start == stop:
+                continue
+            discounts = self.discount[start:stop]
+            active = np.flatnonzero(caps[:, segment] < discounts[-1])
+            if not len(active):
+                continue
+            segment_caps = caps[active, segment]
+            capped[active] += stop - start - np.searchsorted(
+                discounts, segment_caps, side="right"
+            )
+
+            step = max(1, memory_bytes // (len(active) * _CELL_BYTES))
+            for chunk in range(start, stop, step):
+                end = min(chunk + step, stop)
+                # Discounts ascend, so caps at or above the chunk's last
+                # discount leave the whole chunk as it is.
+                live = np.flatnonzero(segment_caps < self.discount[end - 1])
+                if not len(live):
+                    continue
+                excess = np.subtract(
+                    self.discount[chunk:end, None], segment_caps[live]
+                )
+                np.maximum(excess, 0, out=excess)
+                columns = active[live]
+                recovered[columns] += self.revenue[chunk:end] @ excess
+                leakage[columns] += np.count_nonzero(
+                    excess < self._leakage_limit[chunk:end, None], axis=0
+                ) - (self._flagged[end] - self._flagged[chunk])
+        recovered /= 100
+
+        net_revenue = self.net_revenue.sum() + recovered
+        profit = self.profit.sum() + recovered
+        with np.errstate(divide="ignore", invalid="ignore"):
+            margin = 100 * profit / net_revenue
+        return pd.DataFrame({
+            "discount_amount": self.revenue.sum() - net_revenue,
+            "net_revenue": net_revenue,
+            "profit": profit,
+            "profit_margin_percent": margin,
+            "recovered_profit": recovered,
+            "capped_orders": capped,
+            "leakage_orders": leakage,
+        })
+
+    def grid(self, caps=DEFAULT_CAPS, memory_bytes=MEMORY_BYTES):
+        """Every cap on each segment alone, and on all segments at once.
+
+        Returns one row per ``(segment, cap)``, with ``ALL_SEGMENTS`` in
+        both segment columns for the scenarios capping every segment,
+        followed by the :meth:`run` results.
+        """
+        caps = np.asarray(caps, dtype=np.float64)
+        n_segments, n_caps = len(self.segments), len(caps)
+        matrix = np.full((n_segments + 1, n_caps, n_segments), NO_CAP)
+        matrix[np.arange(n_segments), :, np.arange(n_segments)] = caps
+        matrix[n_segments] = caps[:, None]
+
+        keys = pd.concat([
+            self.segments.astype(str),
+            pd.DataFrame({col: [ALL_SEGMENTS] for col in SEGMENT_COLUMNS}),
+        ], ignore_index=True)
+        table = keys.loc[keys.index.repeat(n_caps)].reset_index(drop=True)
+        table["cap"] = np.tile(caps, n_segments + 1)
+        results = self.run(matrix.reshape(-1, n_segments), memory_bytes)
+        return pd.concat([table, results], axis=1)
+
+    def orders(self, caps):
+        """Per-order ``discount_percent`` and the four recomputed columns.
+
+        ``caps`` holds one cap per segment (a single scenario). Like
+        :meth:`run`, each order's stored figures are moved by its
+        recovered discount, so the two agree to rounding.
+        """
+        by_segment = np.append(np.asarray(caps, dtype=np.float64), NO_CAP)
+        discount = np.minimum(self.discount, by_segment[self.codes])
+        recovered = self.revenue * (self.discount - discount) / 100
+        net_revenue = self.net_revenue + recovered
+        profit = self.profit + recovered
+        with np.errstate(divide="ignore", invalid="ignore"):
+            margin = 100 * profit / net_revenue
+        table = pd.DataFrame({
+            "discount_percent": discount,
+            "discount_amount": self.revenue - net_revenue,
+            "net_revenue": net_revenue,
+            "profit": profit,
+            "profit_margin_percent": margin,
+        })
+        # Back to the frame's row order
+        table.index = self._order
+        return table.sort_index()
+
+
+def cap_grid(frames, caps=DEFAULT_CAPS, memory_bytes=MEMORY_BYTES):
+    """:meth:`CapSimulator.grid` over the orders of every frame in ``frames``.
+
+    The grids of the frames are summed per segment and cap, and the
+    margin is recomputed from the summed totals. A single frame's grid
+    is returned as it is.
+    """
+    grids = [CapSimulator(frame).grid(caps, memory_bytes) for frame in frames]
+    if len(grids) == 1:
+        return grids[0]
+    keys = SEGMENT_COLUMNS + ["cap"]
+    table = pd.concat(grids).groupby(keys, sort=False, as_index=False).sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        table["profit_margin_percent"] = (
+            100 * table["profit"] / table["net_revenue"]
+        )
+    # Segments seen only in later frames were appended after "All"
+    last = table["product_category"] == ALL_SEGMENTS
+    return pd.concat([table[~last], table[last]], ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", type=Path, default=CLEANED_PARQUET,
+                        help="cleaned Parquet dataset (file or directory)")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT,
+                        help="directory for the scenario grid")
+    parser.add_argument("--caps", type=float, nargs=3, default=None,
+                        metavar=("START", "STOP", "STEP"),
+                        help="cap grid in percent, STOP included "
+                             "(default 0 40 1)")
+    args = parser.parse_args(argv)
+
+    caps = DEFAULT_CAPS
+    if args.caps is not None:
+        start, stop, step = args.caps
+        caps = np.arange(start, stop + step / 2, step)
+
+    frame = pd.read_parquet(args.data, columns=SIMULATION_COLUMNS)
+    started = time.perf_counter()
+    simulator = CapSimulator(frame)
+    table = simulator.grid(caps)
+    seconds = time.perf_counter() - started
+    args.out.mkdir(parents=True, exist_ok=True)
+    write_table(table, args.out / GRID_FILE)
+
+    print(f"{len(table):,} scenarios x {len(simulator):,} orders "
+          f"in {seconds:.2f}s")
+    overall = table[table["product_category"] == ALL_SEGMENTS]
+    print(overall.set_index("cap")[
+        ["recovered_profit", "profit_margin_percent", "leakage_orders"]
+    ].to_string(float_format=lambda v: f"{v:,.2f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""Filter state shared across pages, and a cache of resolved row selections.
+
+Several pages filter on the same columns: quantity, margin and discount
+sliders on the revenue and discount pages, the customer picker on the
+payment and returns pages. A :class:`FilterState` kept in the session
+holds one value per filtered column, so a range or selection made on one
+page is already applied when the user opens another.
+
+Resolving a filter set to row positions is then shared as well. A
+:class:`SelectionCache` maps canonical predicate sets to the sorted row
+positions they select. A page whose filters are exactly a cached set
+reuses its rows. A page whose filters imply a cached set (the same
+predicates, narrower ranges or fewer ids, plus possibly more predicates)
+only checks its own predicates on the cached rows instead of resolving
+them against the whole dataset. Entries are evicted least recently used
+first, bounded by count and by bytes of row positions held.
+
+Results computed from a filter set (the discount page's what-if grid,
+the sort orders of a flagged-order table) are kept in a
+:class:`ResultCache` under the same ``(page, filters, version)`` keys as
+the figure cache, so a rerun that only moves an unrelated widget reuses
+them.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+# ``st.session_state`` key of the session's :class:`FilterState`.
+SESSION_KEY = "leakage_filters"
+
+DEFAULT_MAX_BYTES = (
+    int(os.environ.get("LEAKAGE_SELECTION_CACHE_MB", 64)) * 2**20
+)
+DEFAULT_MAX_ENTRIES = 256
+
+RESULT_MAX_BYTES = int(os.environ.get("LEAKAGE_RESULT_CACHE_MB", 128)) * 2**20
+RESULT_MAX_ENTRIES = 128
+
+
+@dataclass
+class FilterState:
+    """One session's filter values, by column, shared by every page.
+
+    ``ranges`` maps slider columns to ``(low, high)`` and ``entities`` id
+    columns to the selected ids.
+    """
+
+    ranges: dict = field(default_factory=dict)
+    entities: dict = field(default_factory=dict)
+
+    def range(self, col, bounds):
+        """The stored range of ``col`` clipped to ``bounds``, or ``bounds``.
+
+        Bounds move when a refresh loads new data, so a range stored
+        against the previous version is clipped to stay valid.
+        """
+        low, high = self.ranges.get(col, bounds)
+        low = min(max(low, bounds[0]), bounds[1])
+        high = max(min(high, bounds[1]), low)
+        return low, high
+
+
+def predicate_key(ranges, entities):
+    """Canonical, hashable form of a filter set.
+
+    ``ranges`` is a normalized range tuple (``RangeIndex.normalize``) and
+    ``entities`` maps id columns to non-empty id collections.
+    """
+    return ranges, tuple(sorted(
+        (col, frozenset(ids)) for col, ids in entities.items()
+    ))
+
+
+def implies(key, cached):
+    """Whether every row selected by ``key`` is selected by ``cached``."""
+    ranges = {col: (low, high) for col, low, high in key[0]}
+    for col, low, high in cached[0]:
+        if col not in ranges:
+            return False
+        query_low, query_high = ranges[col]
+        if query_low < low or query_high > high:
+            return False
+    entities = dict(key[1])
+    return all(
+        col in entities and entities[col] <= ids for col, ids in cached[1]
+    )
+
+
+class SelectionCache:
+    """Thread-safe LRU of row selections, bounded by entries and bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.nbytes = 0
+        self.hits = 0
+        self.refined = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Rows cached for exactly ``key``, or ``None``."""
+        with self._lock:
+            rows = self._entries.get(key)
+            if rows is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return rows
+
+    def closest(self, key):
+        """The smallest cached selection that ``key`` refines, or ``None``.
+
+        Returns ``(cached key, rows)``.
+        """
+        with self._lock:
+            best = None
+            for cached, rows in self._entries.items():
+                if best is not None and len(rows) >= len(best[1]):
+                    continue
+                if implies(key, cached):
+                    best = cached, rows
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best[0])
+            self.refined += 1
+            return best
+
+    def put(self, key, rows):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            if rows.nbytes > self.max_bytes:
+                return
+            self._entries[key] = rows
+            self.nbytes += rows.nbytes
+            while (self.nbytes > self.max_bytes
+                   or len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+
+def _nbytes(value):
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(index=True).sum())
+    return int(getattr(value, "nbytes", 0))
+
+
+class ResultCache:
+    """Thread-safe LRU of derived results, bounded by entries and bytes.
+
+    A result's size is taken when it is stored: ``memory_usage`` for
+    frames, ``nbytes`` for anything else that has it.
+    """
+
+    def __init__(self, max_bytes=RESULT_MAX_BYTES,
+                 max_entries=RESULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, build):
+        """The result cached for ``key``, calling ``build()`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # Built outside the lock; two sessions missing at once both build.
+        value = build()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = value, size
+            self.nbytes += size
+            while (self.nbytes > self.max_bytes
+                   or len(self._entries) > self.max_entries):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
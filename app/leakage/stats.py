@@ -0,0 +1,424 @@
+"""Chunked, mergeable summary statistics for the EDA overview.
+
+``notebooks/02_eda_overview.ipynb`` runs ``describe()``, ``corr()`` and
+the per-category and per-region groupbys on one in-memory frame. The
+same report is produced here from chunks, so it runs over the full raw
+feed or the partitioned dataset in bounded memory::
+
+    python -m app.leakage.stats --out data/processed/eda
+    python -m app.leakage.stats --raw data/raw/profit_leakage_large_dataset.csv
+
+Every statistic is a mergeable partial result:
+
+- :class:`ColumnStats` keeps count, means, the co-moment matrix (Welford's
+  update with Chan et al.'s pairwise merge), min/max and a KLL sketch per
+  column, from which means, variances, covariance, correlation and
+  approximate quartiles follow.
+- :class:`GroupedSums` keeps row counts and sums of the money columns per
+  group.
+
+Partials from different chunks, partitions or worker processes combine
+with ``merge`` in any order. The pipeline keeps each month's partial in
+a ``_stats.json`` side file (:class:`StatsAccumulator`), written with the
+rest of the version it builds, so an incremental run only folds its new
+rows into the months they touched. Reports never write to the dataset:
+a partition without a current side file is folded from its files batch
+by batch.
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from .detect import partitions, write_table
+from .schema import (
+    CLEANED_PARQUET,
+    COLUMNS,
+    DATE_COLUMN,
+    FLOAT32_COLUMNS,
+    INTEGER_COLUMNS,
+    MONEY_COLUMNS,
+    PROCESSED_DIR,
+    month_labels,
+)
+from .sketches import KLLSketch
+
+DEFAULT_OUT = PROCESSED_DIR / "eda"
+DEFAULT_CHUNKSIZE = 250_000
+DEFAULT_WORKERS = os.cpu_count() or 1
+STATS_FILE = "_stats.json"
+# Written first, then renamed over STATS_FILE.
+STATS_TMP_FILE = "_stats.tmp"
+
+# Every numeric column, in dataset order, as ``select_dtypes(np.number)``.
+NUMERIC_COLUMNS = [
+    col for col in COLUMNS
+    if col in INTEGER_COLUMNS + FLOAT32_COLUMNS + MONEY_COLUMNS
+]
+GROUP_KEYS = ["product_category", "region", "sales_channel", "customer_type"]
+
+
+class ColumnStats:
+    """Count, means, co-moments, extremes and sketches of numeric columns.
+
+    Rows with a missing value in any of the columns are skipped (and
+    counted in ``skipped``), so every statistic is over the same rows.
+    """
+
+    def __init__(self, columns=NUMERIC_COLUMNS):
+        self.columns = list(columns)
+        width = len(self.columns)
+        self.n = 0
+        self.skipped = 0
+        self.mean = np.zeros(width)
+        self.comoment = np.zeros((width, width))
+        self.minimum = np.full(width, np.inf)
+        self.maximum = np.full(width, -np.inf)
+        self.sketches = [KLLSketch() for _ in self.columns]
+
+    def update(self, chunk):
+        """Fold the rows of a DataFrame chunk in."""
+        values = np.column_stack([
+            chunk[col].to_numpy(np.float64, na_value=np.nan)
+            for col in self.columns
+        ]) if len(chunk) else np.empty((0, len(self.columns)))
+        complete = ~np.isnan(values).any(axis=1)
+        part = ColumnStats(self.columns)
+        part.skipped = int(len(values) - complete.sum())
+        values = values[complete]
+        if len(values):
+            part.n = len(values)
+            part.mean = values.mean(axis=0)
+            centered = values - part.mean
+            part.comoment = centered.T @ centered
+            part.minimum = values.min(axis=0)
+            part.maximum = values.max(axis=0)
+            part.sketches = [KLLSketch().update(col) for col in values.T]
+        self.__dict__.update(self.merge(part).__dict__)
+        return self
+
+    def merge(self, other):
+        """Statistics of the union of both inputs."""
+        out = ColumnStats(self.columns)
+        out.n = self.n + other.n
+        out.skipped = self.skipped + other.skipped
+        if not other.n or not self.n:
+            source = self if self.n else other
+            out.mean = source.mean.copy()
+            out.comoment = source.comoment.copy()
+            out.minimum = source.minimum.copy()
+            out.maximum = source.maximum.copy()
+            out.sketches = source.sketches
+            return out
+        delta = other.mean - self.mean
+        out.mean = self.mean + delta * (other.n / out.n)
+        out.comoment = (
+            self.comoment + other.comoment
+            + np.outer(delta, delta) * (self.n * other.n / out.n)
+        )
+        out.minimum = np.minimum(self.minimum, other.minimum)
+        out.maximum = np.maximum(self.maximum, other.maximum)
+        out.sketches = [a.merge(b) for a, b in zip(self.sketches, other.sketches)]
+        return out
+
+    def covariance(self, ddof=1):
+        cov = self.comoment / max(self.n - ddof, 1)
+        if self.n <= ddof:
+            cov = np.full_like(cov, np.nan)
+        return pd.DataFrame(cov, index=self.columns, columns=self.columns)
+
+    def variance(self, ddof=1):
+        return pd.Series(np.diag(self.covariance(ddof).to_numpy()),
+                         index=self.columns)
+
+    def correlation(self):
+        """Pearson correlation, as ``DataFrame.corr()``."""
+        scale = np.sqrt(np.diag(self.comoment))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = self.comoment / np.outer(scale, scale)
+        corr = np.clip(corr, -1, 1)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+    def describe(self):
+        """``DataFrame.describe()`` layout; quartiles are KLL estimates."""
+        table = {
+            "count": np.full(len(self.columns), float(self.n)),
+            "mean": self.mean if self.n else np.full(len(self.columns), np.nan),
+            "std": np.sqrt(self.variance().to_numpy()),
+            "min": np.where(self.n, self.minimum, np.nan),
+        }
+        for q in [0.25, 0.5, 0.75]:
+            table[f"{q:.0%}"] = [sketch.quantile(q) for sketch in self.sketches]
+        table["max"] = np.where(self.n, self.maximum, np.nan)
+        return pd.DataFrame(table, index=self.columns).T
+
+    def to_dict(self):
+        return {
+            "columns": self.columns,
+            "n": self.n,
+            "skipped": self.skipped,
+            "mean": self.mean.tolist(),
+            "comoment": self.comoment.tolist(),
+            "minimum": self.minimum.tolist(),
+            "maximum": self.maximum.tolist(),
+            "sketches": [
+                base64.b64encode(sketch.to_bytes()).decode()
+                for sketch in self.sketches
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data["columns"])
+        stats.n = data["n"]
+        stats.skipped = data["skipped"]
+        stats.mean = np.array(data["mean"])
+        stats.comoment = np.array(data["comoment"])
+        stats.minimum = np.array(data["minimum"])
+        stats.maximum = np.array(data["maximum"])
+        stats.sketches = [
+            KLLSketch.from_bytes(base64.b64decode(raw))
+            for raw in data["sketches"]
+        ]
+        return stats
+
+
+class GroupedSums:
+    """Row counts and column sums per value of a group key."""
+
+    def __init__(self, key, columns=MONEY_COLUMNS, totals=None):
+        self.key = key
+        self.columns = list(columns)
+        if totals is None:
+            totals = pd.DataFrame(
+                columns=["rows"] + self.columns, dtype=np.float64
+            ).rename_axis(key)
+        self.totals = totals
+
+    def update(self, chunk):
+        work = chunk[self.columns].astype(np.float64)
+        work.insert(0, "rows", 1.0)
+        work[self.key] = chunk[self.key].astype(str).to_numpy()
+        part = work.groupby(self.key, sort=False).sum()
+        self.totals = self.merge(GroupedSums(self.key, self.columns, part)).totals
+        return self
+
+    def merge(self, other):
+        both = pd.concat([self.totals, other.totals])
+        totals = both.groupby(level=0).sum() if len(both) else both
+        return GroupedSums(self.key, self.columns, totals.rename_axis(self.key))
+
+    def means(self):
+        """Per-group means of the summed columns."""
+        return self.totals[self.columns].div(self.totals["rows"], axis=0)
+
+    def to_dict(self):
+        return {
+            "key": self.key,
+            "columns": self.columns,
+            "groups": self.totals.index.tolist(),
+            "totals": self.totals.to_numpy().tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        totals = pd.DataFrame(
+            np.array(data["totals"], dtype=np.float64).reshape(
+                len(data["groups"]), len(data["columns"]) + 1
+            ),
+            index=pd.Index(data["groups"], name=data["key"]),
+            columns=["rows"] + data["columns"],
+        )
+        return cls(data["key"], data["columns"], totals)
+
+
+class EDAStats:
+    """Everything the EDA overview reports, as one mergeable partial."""
+
+    def __init__(self, numeric=None, groups=None):
+        self.numeric = numeric or ColumnStats()
+        self.groups = groups or {key: GroupedSums(key) for key in GROUP_KEYS}
+
+    def update(self, chunk):
+        self.numeric.update(chunk)
+        for grouped in self.groups.values():
+            grouped.update(chunk)
+        return self
+
+    def merge(self, other):
+        return EDAStats(
+            self.numeric.merge(other.numeric),
+            {key: g.merge(other.groups[key]) for key, g in self.groups.items()},
+        )
+
+    @classmethod
+    def merge_all(cls, parts):
+        merged = cls()
+        for part in parts:
+            merged = merged.merge(part)
+        return merged
+
+    def to_dict(self):
+        return {
+            "numeric": self.numeric.to_dict(),
+            "groups": [g.to_dict() for g in self.groups.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        groups = [GroupedSums.from_dict(g) for g in data["groups"]]
+        return cls(ColumnStats.from_dict(data["numeric"]),
+                   {g.key: g for g in groups})
+
+
+def _files(path):
+    """Data files of a partition directory (or the file ``path`` itself)."""
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    return sorted(
+        f for f in path.rglob("*.parquet") if not f.name.startswith("_")
+    )
+
+
+def _stamp(path):
+    """Identifies the current contents of a partition directory."""
+    return [[f.name, f.stat().st_size, f.stat().st_mtime_ns] for f in _files(path)]
+
+
+def fold_partition(path, batch_rows=DEFAULT_CHUNKSIZE):
+    """Statistics of one partition, read ``batch_rows`` rows at a time."""
+    stats = EDAStats()
+    for file in _files(path):
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=batch_rows):
+            stats.update(batch.to_pandas())
+    return stats
+
+
+def _cached(path, stamp):
+    """The partial in ``path``'s side file, if it describes ``stamp``."""
+    cache = Path(path) / STATS_FILE
+    if not cache.exists():
+        return None
+    cached = json.loads(cache.read_text())
+    if cached["stamp"] != stamp:
+        return None
+    return EDAStats.from_dict(cached["stats"])
+
+
+def partition_stats(path):
+    """Statistics of one partition, from its side file when still current."""
+    path = Path(path)
+    stats = _cached(path, _stamp(path)) if path.is_dir() else None
+    return stats if stats is not None else fold_partition(path)
+
+
+class StatsAccumulator:
+    """Pipeline builder that maintains ``_stats.json`` in each month directory.
+
+    Chunks are folded into the partial of every month they fall in. On
+    commit each touched month's partial is merged with the one the
+    previous version left, when that one still matches the month's parts
+    as they were before the run, and written through a temporary name;
+    the hard link to the previous version's file is replaced, not
+    modified. A month without a usable side file is folded from its files.
+    """
+
+    def __init__(self, dataset_dir, append):
+        self.dataset_dir = Path(dataset_dir)
+        self.append = append
+        # Parts of every month before this run added to them
+        self.before = {
+            path.name: _stamp(path) for path in partitions(self.dataset_dir)
+            if path.is_dir() and path != self.dataset_dir
+        } if append else {}
+        self.months = {}
+
+    def add(self, chunk):
+        for month, rows in chunk.groupby(
+            month_labels(chunk[DATE_COLUMN]), sort=False
+        ):
+            self.months.setdefault(month, EDAStats()).update(rows)
+
+    def commit(self):
+        for month, stats in self.months.items():
+            month_dir = self.dataset_dir / month
+            if month in self.before:
+                base = _cached(month_dir, self.before[month])
+                stats = (fold_partition(month_dir) if base is None
+                         else base.merge(stats))
+            tmp = month_dir / STATS_TMP_FILE
+            # A leftover may be a hard link into the previous version
+            tmp.unlink(missing_ok=True)
+            tmp.write_text(json.dumps({
+                "stamp": _stamp(month_dir), "stats": stats.to_dict(),
+            }))
+            tmp.replace(month_dir / STATS_FILE)
+
+
+def dataset_stats(data=CLEANED_PARQUET, workers=DEFAULT_WORKERS):
+    """Statistics of the partitioned dataset, one partition per worker task."""
+    parts = partitions(data)
+    workers = min(workers, len(parts))
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    with pool or nullcontext():
+        map_ = pool.map if pool else map
+        return EDAStats.merge_all(map_(partition_stats, parts))
+
+
+def raw_stats(raw_path, chunksize=DEFAULT_CHUNKSIZE):
+    """Statistics of a raw CSV extract, streamed in ``chunksize`` rows."""
+    stats = EDAStats()
+    for chunk in pd.read_csv(raw_path, chunksize=chunksize):
+        stats.update(chunk)
+    return stats
+
+
+def write_report(stats, out):
+    """Write the describe, correlation and grouped tables to ``out``."""
+    out.mkdir(parents=True, exist_ok=True)
+    write_table(stats.numeric.describe().reset_index(names="statistic"),
+                out / "describe.parquet")
+    write_table(stats.numeric.correlation().reset_index(names="column"),
+                out / "correlation.parquet")
+    for key, grouped in stats.groups.items():
+        totals = grouped.totals.join(grouped.means(), rsuffix="_mean")
+        write_table(totals.reset_index(), out / f"by_{key}.parquet")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", type=Path, default=CLEANED_PARQUET,
+                        help="cleaned Parquet dataset (file or directory)")
+    parser.add_argument("--raw", type=Path, default=None,
+                        help="stream a raw CSV extract instead of --data")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT,
+                        help="directory for the report tables")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="processes summarising partitions in parallel")
+    args = parser.parse_args(argv)
+
+    if args.raw is not None:
+        stats = raw_stats(args.raw, args.chunksize)
+    else:
+        stats = dataset_stats(args.data, args.workers)
+    write_report(stats, args.out)
+    print(stats.numeric.describe().T.to_string(float_format="{:,.2f}".format))
+    if stats.numeric.skipped:
+        print(f"{stats.numeric.skipped:,} rows with missing values skipped")
+    print(f"report written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Server-side paging, sorting and export of flagged-order tables.
+
+The pages used to show the first ten flagged rows and nothing else. A
+:class:`ResultPager` serves the whole flagged set (a selection, see
+:mod:`leakage.selection`) from the server and hands the browser one page
+at a time, sorted by any column. Sorting is stable (ties keep dataset
+order) and NaN sorts last in either direction. Only the sort column is
+read in full to order the rows; a page then takes just its own rows, so
+under the scan backend the flagged set itself is never held.
+
+The first pages are what analysts look at, so while a page ends within
+the first ``TOPK_ROWS`` rows only that many rows are ordered: they are
+selected with ``np.partition`` in linear time and only they are sorted.
+Pages further down fall back to one full stable sort per column and
+direction, kept on the pager.
+
+Exports are written batch by batch, in ``EXPORT_CHUNK_ROWS`` slices,
+through Arrow's CSV and Parquet writers into a spooled temporary file,
+so building one holds one chunk in Arrow form at a time, not a second
+copy of the flagged set.
+Serving it is another matter: ``st.download_button`` reads the finished
+file into bytes, so each download holds the encoded export in memory
+while Streamlit serves it.
+
+A pager keeps its sort orders, so :func:`leakage.widgets.result_table`
+keeps each pager in the result cache under the page's filter set and
+data version; paging or re-sorting the same result reuses them.
+"""
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+PAGE_SIZES = [10, 25, 50, 100]
+# Rows that may be ordered by top-K selection before a full sort is used.
+TOPK_ROWS = 1_000
+EXPORT_CHUNK_ROWS = 100_000
+# Exports spill from memory to disk beyond this size.
+SPOOL_BYTES = 32 * 2**20
+
+
+def _first_k(key, k):
+    """Positions of the ``k`` smallest ``key`` values, stably sorted."""
+    if k >= len(key):
+        return np.argsort(key, kind="stable")
+    kth = np.partition(key, k - 1)[k - 1]
+    better = np.flatnonzero(key < kth)
+    ties = np.flatnonzero(key == kth)[:k - len(better)]
+    picked = np.sort(np.concatenate([better, ties]))
+    return picked[np.argsort(key[picked], kind="stable")]
+
+
+class ResultPager:
+    """Sorted pages over the rows of a (flagged) selection."""
+
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = list(columns)
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def nbytes(self):
+        """Bytes of the rows held and of the sort orders computed so far."""
+        return self.rows.nbytes + sum(
+            order.nbytes for order in self._orders.values()
+        )
+
+    def page_count(self, size):
+        return max(1, -(-len(self) // size))
+
+    def _sort_key(self, col, descending):
+        """Float keys whose ascending order is the requested order."""
+        values = self.rows.column(col)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Categories read from Parquet come in order of appearance
+            rank = np.argsort(np.argsort(values.cat.categories.to_numpy()))
+            codes = values.array.codes
+            key = np.full(len(codes), np.nan)
+            key[codes >= 0] = rank[codes[codes >= 0]]
+        elif pd.api.types.is_numeric_dtype(values.dtype) or (
+            pd.api.types.is_datetime64_any_dtype(values.dtype)
+        ):
+            key = values.to_numpy(np.float64, na_value=np.nan, copy=True)
+        else:
+            codes, _ = pd.factorize(values, sort=True)
+            key = codes.astype(np.float64)
+            key[codes < 0] = np.nan
+        if descending:
+            key = -key
+        key[np.isnan(key)] = np.inf
+        return key
+
+    def positions(self, start, stop, sort_by=None, descending=False):
+        """Row positions ``start:stop`` of the rows in the requested order."""
+        if sort_by is None:
+            return np.arange(start, min(stop, len(self)))
+        order = self._orders.get((sort_by, descending))
+        if order is None:
+            key = self._sort_key(sort_by, descending)
+            if stop <= TOPK_ROWS:
+                return _first_k(key, stop)[start:stop]
+            order = np.argsort(key, kind="stable")
+            self._orders[sort_by, descending] = order
+        return order[start:stop]
+
+    def page(self, number, size, sort_by=None, descending=False):
+        """Rows of page ``number`` (0-based) of ``size`` rows."""
+        positions = self.positions(number * size, (number + 1) * size,
+                                   sort_by, descending)
+        return self.rows.take(positions, self.columns)
+
+
+def _writer(handle, empty, fmt):
+    schema = pa.Schema.from_pandas(empty, preserve_index=False)
+    if fmt == "csv":
+        return pa_csv.CSVWriter(handle, schema)
+    return pq.ParquetWriter(handle, schema)
+
+
+def export(rows, columns, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    """``columns`` of the selection ``rows`` as a CSV or Parquet file object.
+
+    The returned file is positioned at the start, ready to be read or
+    handed to ``st.download_button``.
+    """
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"unknown export format {fmt!r}")
+    handle = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    writer = None
+    try:
+        # A selection always yields at least one, possibly empty, batch.
+        for frame in rows.batches(columns):
+            if writer is None:
+                writer = _writer(handle, frame.iloc[:0][columns], fmt)
+            for start in range(0, len(frame), chunk_rows):
+                writer.write_table(pa.Table.from_pandas(
+                    frame.iloc[start:start + chunk_rows][columns],
+                    preserve_index=False,
+                ))
+    finally:
+        if writer is not None:
+            writer.close()
+    handle.seek(0)
+    return handle
@@ -0,0 +1,142 @@
+"""Browser-rendered Vega-Lite versions of the dashboard charts.
+
+With ``LEAKAGE_CHARTS=vega`` the pages stop rasterising charts on the
+server. Each chart is reduced to compact, pre-binned data and sent with a
+Vega-Lite spec through ``st.vega_lite_chart``, which ships the data as
+Arrow and draws it in the browser:
+
+- histograms: one row per bar plus the KDE curve
+  (:func:`~leakage.plots.selection_histogram_bins`)
+- scatters up to ``MAX_POINTS`` rows: the points themselves
+- larger scatters: the non-empty cells of a ``GRID_BINS`` x ``GRID_BINS``
+  count grid (or a stratified sample with ``LEAKAGE_SCATTER_MODE=sample``),
+  with the flagged rows overlaid as a bounded sample
+
+The binning is the one the matplotlib helpers in :mod:`leakage.plots`
+use, so both backends show the same picture. Every chart binds an
+interval selection to its scales: dragging pans and scrolling zooms in
+the browser, without a rerun. The server's cost per chart is the binning
+only, which is linear in the filtered rows and needs no plotting stack.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .plots import (
+    MAX_POINTS, SCATTER_MODE, scatter_data, selection_histogram_bins,
+)
+
+# "image" (matplotlib through the figure cache) or "vega" (this module).
+CHART_BACKEND = os.environ.get("LEAKAGE_CHARTS", "image").strip().lower()
+HEIGHT = 320
+POINT_SIZE = 14
+# Coordinates are sent at float32, plenty for a chart a few hundred
+# pixels wide, to halve the payload.
+COORD_DTYPE = np.float32
+
+# Drag to pan, scroll to zoom; handled entirely by the browser.
+ZOOM = {"name": "zoom", "select": "interval", "bind": "scales"}
+
+
+def _axis(field, title=None):
+    return {"field": field, "type": "quantitative", "title": title or field}
+
+
+def _points(name, x, y, alpha, color=None):
+    mark = {"type": "circle", "opacity": alpha, "size": POINT_SIZE}
+    if color is not None:
+        mark["color"] = color
+    return {
+        "data": {"name": name},
+        "mark": mark,
+        "encoding": {"x": _axis(x), "y": _axis(y)},
+    }
+
+
+def _frame(**columns):
+    return pd.DataFrame({
+        name: values.astype(np.int32 if values.dtype.kind in "iu" else COORD_DTYPE)
+        for name, values in columns.items()
+    })
+
+
+def _chart(title, datasets, layers):
+    layers[0]["params"] = [ZOOM]
+    return {
+        "title": title,
+        "height": HEIGHT,
+        "datasets": datasets,
+        "layer": layers,
+    }
+
+
+def scatter_spec(rows, x, y, title, alpha=0.6, highlight=None,
+                 max_points=MAX_POINTS, mode=SCATTER_MODE):
+    """Vega-Lite spec of :func:`leakage.plots.scatter` for the same data.
+
+    At most ``max_points`` points (or ``GRID_BINS ** 2`` grid cells) plus
+    ``max_points`` flagged points are sent, whatever the size of ``rows``.
+    """
+    data = scatter_data(rows, x, y, highlight, max_points, mode)
+    datasets = {}
+    if data.kind != "density":
+        xs, ys = data.points
+        datasets["points"] = _frame(**{x: xs, y: ys})
+        layers = [_points("points", x, y, alpha)]
+    else:
+        counts, x_edges, y_edges = data.grid
+        i, j = np.nonzero(counts)
+        datasets["grid"] = _frame(
+            x0=x_edges[i], x1=x_edges[i + 1],
+            y0=y_edges[j], y1=y_edges[j + 1],
+            orders=counts[i, j].astype(np.int64),
+        )
+        layers = [{
+            "data": {"name": "grid"},
+            "mark": "rect",
+            "encoding": {
+                "x": _axis("x0", x), "x2": {"field": "x1"},
+                "y": _axis("y0", y), "y2": {"field": "y1"},
+                "color": {
+                    "field": "orders", "type": "quantitative",
+                    "scale": {"type": "log", "scheme": "blues"},
+                },
+            },
+        }]
+
+    if data.highlight is not None:
+        xs, ys = data.highlight
+        datasets["leakage"] = _frame(**{x: xs, y: ys})
+        layers.append(_points("leakage", x, y, alpha, color="crimson"))
+    return _chart(title, datasets, layers)
+
+
+def histogram_spec(rows, col, title, bins=30, color=None, kde=True):
+    """Vega-Lite spec of :func:`leakage.plots.histogram` for the same data."""
+    edges, counts, centres, curve = selection_histogram_bins(rows, col, bins, kde)
+    bar = {"type": "bar", "opacity": 0.5, "stroke": "black", "strokeWidth": 0.8}
+    line = {"type": "line"}
+    if color is not None:
+        bar["color"] = line["color"] = color
+
+    datasets = {
+        "bars": _frame(start=edges[:-1], end=edges[1:], count=counts),
+    }
+    layers = [{
+        "data": {"name": "bars"},
+        "mark": bar,
+        "encoding": {
+            "x": _axis("start", col), "x2": {"field": "end"},
+            "y": _axis("count", "Count"),
+        },
+    }]
+    if len(curve):
+        datasets["kde"] = _frame(start=centres, count=curve)
+        layers.append({
+            "data": {"name": "kde"},
+            "mark": line,
+            "encoding": {"x": _axis("start", col), "y": _axis("count", "Count")},
+        })
+    return _chart(title, datasets, layers)
@@ -0,0 +1,125 @@
+"""Immutable, versioned publication of the cleaned dataset.
+
+The dataset path (``profit_leakage_cleaned.parquet``) is a symlink to one
+directory under ``profit_leakage_cleaned.parquet.versions/``. Every
+pipeline run builds a complete new version directory: the partition
+files, the derived side files (cube, rollups, segment scores and
+sketches, per-month EDA stats) and the watermark. It then publishes the
+version by replacing the symlink in a single ``rename``. Readers therefore see either the previous version or the new
+one, never a dataset whose side files or watermark are out of step with
+its parts.
+
+An incremental run starts its version as hard links to every file of
+the current one, so its cost still follows the new volume. Files are
+never modified in place: side files are rewritten through a temporary
+name, which gives them a new inode and leaves the previous version
+untouched, and temporary names are never linked into a new version.
+Only the pipeline writes into a version, and only while building it;
+the batch CLIs (scoring, stats, detect) read the published dataset and
+write to their own ``--out``.
+
+Versions are built under a ``.``-prefixed name and renamed when
+complete, so an unfinished build is never mistaken for a version.
+
+Publishing never deletes a version, since a server may still be scanning
+it. Each server pins its snapshot to the version directory itself and
+calls :func:`retire_versions` once it has swapped to a newer one. A
+version counts as superseded from the moment the next one is published
+(the directory's mtime is set on publish). Retiring keeps the current
+version, the newest other one, and every version superseded less than a
+grace period ago: other servers only switch after two polls plus a load,
+so until then they may still be reading it.
+"""
+
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from .colstore import prune_versions
+
+VERSIONS_SUFFIX = ".versions"
+
+# Side files are written to a ``.tmp`` sibling and renamed into place.
+TMP_PATTERN = "*.tmp"
+
+
+def versions_dir(path):
+    """Directory holding every version of the dataset at ``path``."""
+    path = Path(path)
+    return path.with_name(path.name + VERSIONS_SUFFIX)
+
+
+def current_version(path):
+    """Name of the version ``path`` points to, or ``None`` if unversioned."""
+    path = Path(path)
+    if not path.is_symlink():
+        return None
+    return Path(os.readlink(path)).name
+
+
+def version_path(path, version):
+    """Directory of ``version`` of the dataset at ``path``."""
+    return versions_dir(path) / version
+
+
+def start_version(path, batch, base=None):
+    """Create the build directory of a new version, optionally seeded.
+
+    With ``base`` (the directory of the current version) every file of it
+    is hard-linked into the new version, falling back to a copy where
+    links are not supported. Leftover temporary files are skipped, so a
+    side file written through one cannot share its inode with ``base``. Unfinished builds left by earlier runs are
+    removed first. Returns ``(build dir, version name)``.
+    """
+    root = versions_dir(path)
+    root.mkdir(parents=True, exist_ok=True)
+    for stale in root.glob(".*"):
+        shutil.rmtree(stale, ignore_errors=True)
+
+    version = f"v{batch:05d}-{uuid.uuid4().hex[:8]}"
+    build = root / f".{version}"
+    if base is None:
+        build.mkdir()
+    else:
+        shutil.copytree(base, build, copy_function=_link,
+                        ignore=shutil.ignore_patterns(TMP_PATTERN))
+    return build, version
+
+
+def _link(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def publish(path, build, version):
+    """Make the finished ``build`` the version ``path`` points to.
+
+    The symlink is replaced atomically. A dataset still stored directly
+    at ``path`` (from before versioning) is first moved into the versions
+    directory, which leaves ``path`` missing for that one rename.
+    """
+    path = Path(path)
+    final = versions_dir(path) / version
+    # Retirement orders versions by publication time.
+    os.utime(build)
+    build.rename(final)
+    if path.exists() and not path.is_symlink():
+        if path.is_dir():
+            path.rename(versions_dir(path) / f"legacy-{uuid.uuid4().hex[:8]}")
+        else:
+            path.unlink()
+    link = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}")
+    link.symlink_to(Path(final.parent.name) / final.name)
+    os.replace(link, path)
+    return final
+
+
+def retire_versions(path, current, grace=0.0):
+    """Delete old versions of ``path``, keeping ``current`` and the newest other.
+
+    Versions superseded less than ``grace`` seconds ago are kept as well.
+    """
+    prune_versions(versions_dir(path), current, grace=grace)
@@ -0,0 +1,154 @@
+"""Widgets shared by the dashboard pages."""
+
+import streamlit as st
+
+from .lookup import DEFAULT_LIMIT
+from .state import SESSION_KEY, FilterState
+from .tables import PAGE_SIZES, ResultPager, export
+from .vega import CHART_BACKEND
+
+# Ids an entity multiselect preselects, the first ones seen in the data.
+DEFAULT_SELECTED = 5
+
+
+def shared_filters():
+    """This session's :class:`~leakage.state.FilterState`, shared by all pages."""
+    return st.session_state.setdefault(SESSION_KEY, FilterState())
+
+
+def range_slider(range_index, col, label):
+    """Sidebar range slider over ``col`` whose position every page shares.
+
+    The position lives in the session's :class:`FilterState`: it is copied
+    into the widget before each render and back when the user moves the
+    slider, so any page filtering on ``col`` opens at the same range.
+    """
+    filters = shared_filters()
+    bounds = range_index.bounds(col)
+    key = f"filter_{col}"
+
+    def keep():
+        filters.ranges[col] = st.session_state[key]
+
+    st.session_state[key] = filters.range(col, bounds)
+    return st.sidebar.slider(label, *bounds, key=key, on_change=keep)
+
+
+def entity_multiselect(index, label, col, default_count=DEFAULT_SELECTED):
+    """Searchable multiselect over the ids of an :class:`EntityIndex`.
+
+    Only the current selection plus the top matches for the typed prefix
+    are sent to the browser. The selection is kept in the session's
+    :class:`FilterState` under ``col`` so it survives a change of search
+    text, which rebuilds the widget with new options, and is shared by
+    every page selecting on ``col``.
+    """
+    filters = shared_filters()
+    selected = filters.entities.setdefault(col, index.first(default_count))
+    prefix = st.sidebar.text_input(
+        f"Search {label}", key=f"filter_{col}_search", placeholder="ID prefix"
+    )
+    picked = st.sidebar.multiselect(
+        f"Select {label}",
+        options=index.options(prefix, selected, DEFAULT_LIMIT),
+        default=selected,
+    )
+    filters.entities[col] = picked
+    return picked
+
+
+def profile_panel(profile):
+    """Sidebar table of the stage timings of this rerun, when profiling."""
+    if not profile.enabled:
+        return
+    with st.sidebar.expander("⏱️ Stage timings"):
+        st.dataframe(
+            [
+                {
+                    "stage": stage.name,
+                    "ms": round(stage.seconds * 1000, 1),
+                    "rows in": stage.rows_in,
+                    "rows out": stage.rows_out,
+                    "peak MB": None if stage.peak_bytes is None
+                    else round(stage.peak_bytes / 2**20, 1),
+                }
+                for stage in profile.stages
+            ],
+            hide_index=True,
+            width="stretch",
+        )
+        st.caption(f"Total {profile.total_seconds * 1000:,.0f} ms · "
+                   f"rerun {profile.rerun}")
+
+
+def chart(figures, key, draw, spec):
+    """One dashboard chart, drawn by the configured backend.
+
+    By default ``draw(ax)`` renders it with matplotlib through the figure
+    cache under ``key``. With ``LEAKAGE_CHARTS=vega`` the browser draws
+    the Vega-Lite spec returned by ``spec()`` instead (:mod:`leakage.vega`).
+    """
+    if CHART_BACKEND == "vega":
+        st.vega_lite_chart(spec=spec(), width="stretch")
+    else:
+        st.image(figures.render(key, draw), width="stretch")
+
+
+def result_table(rows, columns, key, file_name, results=None, cache_key=None):
+    """Paged, sortable table of ``columns`` of the selection ``rows``.
+
+    Only the visible page is sent to the browser; sorting and paging run
+    on the server (:class:`~leakage.tables.ResultPager`), with CSV and
+    Parquet export. With a ``results`` cache the pager, and the sort
+    orders it has computed, is kept under ``cache_key``, which must
+    identify ``rows`` (the page's filter set and data version). The
+    exports are built when a download button is clicked, off the script
+    thread.
+    """
+    if results is None or cache_key is None:
+        pager = ResultPager(rows, columns)
+    else:
+        pager = results.get(
+            cache_key + ("table", key, tuple(columns)),
+            lambda: ResultPager(rows, columns),
+        )
+    sort_col, order_col, size_col, page_col = st.columns([3, 2, 2, 2])
+    sort_by = sort_col.selectbox(
+        "Sort by", [None] + list(columns), key=f"{key}_sort",
+        format_func=lambda col: "Dataset order" if col is None else col,
+    )
+    descending = order_col.radio(
+        "Order", ["Descending", "Ascending"], horizontal=True,
+        key=f"{key}_order", disabled=sort_by is None,
+    ) == "Descending"
+    size = size_col.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_size")
+
+    # Filters may have shrunk the result below the remembered page
+    pages = pager.page_count(size)
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    number = page_col.number_input("Page", 1, pages, key=page_key)
+
+    st.dataframe(
+        pager.page(number - 1, size, sort_by, descending), width="stretch"
+    )
+    if results is not None and cache_key is not None:
+        # Re-stored so the cache accounts for any sort order just added
+        results.put(cache_key + ("table", key, tuple(columns)), pager)
+    start = min((number - 1) * size + 1, len(pager))
+    stop = min(number * size, len(pager))
+    st.caption(f"Rows {start:,}–{stop:,} of {len(pager):,}")
+
+    csv_col, parquet_col, _ = st.columns([2, 2, 5])
+    csv_col.download_button(
+        "⬇️ Download CSV", lambda: export(rows, columns, "csv"),
+        file_name=f"{file_name}.csv", mime="text/csv",
+        key=f"{key}_csv", on_click="ignore",
+    )
+    parquet_col.download_button(
+        "⬇️ Download Parquet", lambda: export(rows, columns, "parquet"),
+        file_name=f"{file_name}.parquet",
+        mime="application/vnd.apache.parquet",
+        key=f"{key}_parquet", on_click="ignore",
+    )
@@ -1,16 +1,30 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from leakage.data import load_figure_cache, load_result_cache, load_snapshot
+from leakage.instrument import Profiler
+from leakage.plots import histogram, scatter
+from leakage.vega import histogram_spec, scatter_spec
+from leakage.widgets import chart, profile_panel, range_slider, result_table
 
 st.set_page_config(page_title="Revenue & Profit Leakage", layout="wide")
+profile = Profiler("revenue_profit")
+
+# Every column this page shows, charts or flags on.
+PAGE_COLUMNS = [
+    "order_id",
+    "revenue",
+    "cost",
+    "discount_percent",
+    "profit_margin_percent",
+]
 
 # ---------------- LOAD DATA ----------------
-@st.cache_data
-def load_data():
-    return pd.read_csv("data/processed/profit_leakage_cleaned.csv")
-
-df = load_data()
+with profile.stage("load") as stage:
+    snapshot = load_snapshot()
+    range_index = snapshot.range_index
+    figures = load_figure_cache()
+    results = load_result_cache()
+    stage.rows_out = len(range_index)
 
 # ---------------- PAGE TITLE ----------------
 st.title("📉 Revenue & Profit Leakage Analysis")
@@ -28,121 +42,123 @@ st.divider()
 st.sidebar.header("🔎 Filter Transactions")
 
 # Quantity filter
-qty_range = st.sidebar.slider(
-    "Quantity Sold",
-    int(df["quantity_sold"].min()),
-    int(df["quantity_sold"].max()),
-    (int(df["quantity_sold"].min()), int(df["quantity_sold"].max()))
-)
+qty_range = range_slider(range_index, "quantity_sold", "Quantity Sold")
 
 # Profit margin filter
-margin_range = st.sidebar.slider(
-    "Profit Margin (%)",
-    float(df["profit_margin_percent"].min()),
-    float(df["profit_margin_percent"].max()),
-    (
-        float(df["profit_margin_percent"].min()),
-        float(df["profit_margin_percent"].max())
-    )
-)
+margin_range = range_slider(range_index, "profit_margin_percent", "Profit Margin (%)")
 
 # Discount filter
-discount_range = st.sidebar.slider(
-    "Discount (%)",
-    float(df["discount_percent"].min()),
-    float(df["discount_percent"].max()),
-    (
-        float(df["discount_percent"].min()),
-        float(df["discount_percent"].max())
-    )
-)
+discount_range = range_slider(range_index, "discount_percent", "Discount (%)")
 
 # Revenue filter
-revenue_range = st.sidebar.slider(
-    "Revenue Range",
-    float(df["revenue"].min()),
-    float(df["revenue"].max()),
-    (
-        float(df["revenue"].min()),
-        float(df["revenue"].max())
-    )
-)
+revenue_range = range_slider(range_index, "revenue", "Revenue Range")
 
 # ---------------- APPLY FILTERS ----------------
-filtered_df = df[
-    (df["quantity_sold"] >= qty_range[0]) &
-    (df["quantity_sold"] <= qty_range[1]) &
-    (df["profit_margin_percent"] >= margin_range[0]) &
-    (df["profit_margin_percent"] <= margin_range[1]) &
-    (df["discount_percent"] >= discount_range[0]) &
-    (df["discount_percent"] <= discount_range[1]) &
-    (df["revenue"] >= revenue_range[0]) &
-    (df["revenue"] <= revenue_range[1])
-]
-
-st.subheader("📊 Filtered Dataset Summary")
-
-col1, col2, col3, col4 = st.columns(4)
-
-col1.metric("Total Orders", len(filtered_df))
-col2.metric("Total Revenue", f"₹ {filtered_df['revenue'].sum():,.0f}")
-col3.metric("Total Cost", f"₹ {filtered_df['cost'].sum():,.0f}")
-col4.metric("Avg Profit Margin (%)", f"{filtered_df['profit_margin_percent'].mean():.2f}")
+slider_ranges = {
+    "quantity_sold": qty_range,
+    "profit_margin_percent": margin_range,
+    "discount_percent": discount_range,
+    "revenue": revenue_range,
+}
+with profile.stage("filter", rows_in=len(range_index)) as stage:
+    selection = snapshot.select(slider_ranges, PAGE_COLUMNS)
+    stage.rows_out = len(selection)
+
+# KPI tiles are answered from the pre-aggregated cube while no slider
+# narrows the data
+with profile.stage("kpi", rows_in=len(selection)):
+    kpi = selection.summary() if selection.narrowed else snapshot.cube.query()
+
+    st.subheader("📊 Filtered Dataset Summary")
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    col1.metric("Total Orders", kpi.count)
+    col2.metric("Total Revenue", f"₹ {kpi.sum('revenue'):,.0f}")
+    col3.metric("Total Cost", f"₹ {kpi.sum('cost'):,.0f}")
+    col4.metric("Avg Profit Margin (%)", f"{kpi.mean('profit_margin_percent'):.2f}")
 
 st.divider()
 
+# Low-margin orders are always drawn on top of the charts
+with profile.stage("flag", rows_in=len(selection)) as stage:
+    leakage = selection.flagged("revenue_profit", kpi)
+    stage.rows_out = len(leakage)
+
 # ---------------- VISUALIZATIONS ----------------
 st.subheader("📈 Revenue & Profit Insights")
 
+# Rendered charts are cached per page, filter state and dataset version
+chart_key = (
+    "revenue_profit",
+    range_index.normalize(slider_ranges),
+    snapshot.version,
+)
+
 col1, col2 = st.columns(2)
 
 # Revenue vs Cost
-with col1:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.scatterplot(
-        data=filtered_df,
+def draw_revenue_vs_cost(ax):
+    scatter(
+        ax,
+        selection,
         x="revenue",
         y="cost",
         alpha=0.5,
-        ax=ax
+        highlight=leakage
     )
     ax.set_title("Revenue vs Cost")
-    st.pyplot(fig)
+
+with col1, profile.stage("render:revenue_vs_cost", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("revenue_vs_cost",), draw_revenue_vs_cost,
+        lambda: scatter_spec(
+            selection, "revenue", "cost", "Revenue vs Cost",
+            alpha=0.5, highlight=leakage
+        ),
+    )
 
 # Profit Margin Distribution
-with col2:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.histplot(
-        filtered_df["profit_margin_percent"],
+def draw_margin_distribution(ax):
+    histogram(
+        ax,
+        selection,
+        "profit_margin_percent",
         bins=30,
-        kde=True,
-        ax=ax
+        kde=True
     )
     ax.set_title("Profit Margin Distribution")
-    st.pyplot(fig)
+
+with col2, profile.stage("render:margin_distribution", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("margin_distribution",), draw_margin_distribution,
+        lambda: histogram_spec(
+            selection, "profit_margin_percent", "Profit Margin Distribution"
+        ),
+    )
 
 st.divider()
 
 # ---------------- LEAKAGE IDENTIFICATION ----------------
 st.subheader("🚨 High-Risk Profit Leakage Orders")
 
-leakage_df = filtered_df[filtered_df["profit_margin_percent"] < 5]
-
 st.write(
-    f"Orders with **profit margin < 5%**: **{len(leakage_df)}**"
+    f"Orders with **profit margin < 5%**: **{len(leakage)}**"
 )
 
-st.dataframe(
-    leakage_df[
-        [
-            "order_id",
-            "revenue",
-            "cost",
-            "discount_percent",
-            "profit_margin_percent"
-        ]
-    ].head(10),
-    use_container_width=True
+result_table(
+    leakage,
+    [
+        "order_id",
+        "revenue",
+        "cost",
+        "discount_percent",
+        "profit_margin_percent",
+    ],
+    key="revenue_profit_flagged",
+    file_name="revenue_profit_flagged",
+    results=results,
+    cache_key=chart_key,
 )
 
 st.divider()
@@ -175,3 +191,5 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+profile_panel(profile)
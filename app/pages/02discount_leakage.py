@@ -1,16 +1,38 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from leakage.data import load_figure_cache, load_result_cache, load_snapshot
+from leakage.instrument import Profiler
+from leakage.plots import scatter
+from leakage.simulate import ALL_SEGMENTS, DEFAULT_CAPS, cap_grid
+from leakage.vega import scatter_spec
+from leakage.widgets import chart, profile_panel, range_slider, result_table
 
 st.set_page_config(page_title="Discount Leakage Analysis", layout="wide")
+profile = Profiler("discount_leakage")
 
-# ---------------- LOAD DATA ----------------
-@st.cache_data
-def load_data():
-    return pd.read_csv("data/processed/profit_leakage_cleaned.csv")
+# Every column this page shows, charts or flags on.
+PAGE_COLUMNS = [
+    "order_id",
+    "discount_percent",
+    "discount_amount",
+    "revenue",
+    "net_revenue",
+    "profit",
+    "quantity_sold",
+    "profit_margin_percent",
+    "product_category",
+    "region",
+    "sales_channel",
+]
 
-df = load_data()
+# ---------------- LOAD DATA ----------------
+with profile.stage("load") as stage:
+    snapshot = load_snapshot()
+    range_index = snapshot.range_index
+    segment_scores = snapshot.segment_scores
+    figures = load_figure_cache()
+    results = load_result_cache()
+    stage.rows_out = len(range_index)
 
 # ---------------- PAGE TITLE ----------------
 st.title("🏷️ Discount Leakage Analysis")
@@ -26,112 +48,210 @@ st.divider()
 # ---------------- SIDEBAR FILTERS ----------------
 st.sidebar.header("🔎 Filter Discounts")
 
-discount_range = st.sidebar.slider(
-    "Discount Percentage",
-    float(df["discount_percent"].min()),
-    float(df["discount_percent"].max()),
-    (
-        float(df["discount_percent"].min()),
-        float(df["discount_percent"].max())
-    )
-)
+discount_range = range_slider(range_index, "discount_percent", "Discount Percentage")
 
-quantity_range = st.sidebar.slider(
-    "Quantity Sold",
-    int(df["quantity_sold"].min()),
-    int(df["quantity_sold"].max()),
-    (
-        int(df["quantity_sold"].min()),
-        int(df["quantity_sold"].max())
-    )
-)
+quantity_range = range_slider(range_index, "quantity_sold", "Quantity Sold")
 
-margin_range = st.sidebar.slider(
-    "Profit Margin (%)",
-    float(df["profit_margin_percent"].min()),
-    float(df["profit_margin_percent"].max()),
-    (
-        float(df["profit_margin_percent"].min()),
-        float(df["profit_margin_percent"].max())
-    )
-)
+margin_range = range_slider(range_index, "profit_margin_percent", "Profit Margin (%)")
 
 # ---------------- APPLY FILTERS ----------------
-filtered_df = df[
-    (df["discount_percent"] >= discount_range[0]) &
-    (df["discount_percent"] <= discount_range[1]) &
-    (df["quantity_sold"] >= quantity_range[0]) &
-    (df["quantity_sold"] <= quantity_range[1]) &
-    (df["profit_margin_percent"] >= margin_range[0]) &
-    (df["profit_margin_percent"] <= margin_range[1])
-]
+slider_ranges = {
+    "discount_percent": discount_range,
+    "quantity_sold": quantity_range,
+    "profit_margin_percent": margin_range,
+}
+with profile.stage("filter", rows_in=len(range_index)) as stage:
+    selection = snapshot.select(slider_ranges, PAGE_COLUMNS)
+    stage.rows_out = len(selection)
 
 # ---------------- KPI METRICS ----------------
 st.subheader("📊 Discount Impact Summary")
 
-col1, col2, col3, col4 = st.columns(4)
+# KPI tiles are answered from the pre-aggregated cube while no slider
+# narrows the data
+with profile.stage("kpi", rows_in=len(selection)):
+    kpi = selection.summary() if selection.narrowed else snapshot.cube.query()
+
+    col1, col2, col3, col4 = st.columns(4)
 
-col1.metric("Total Orders", len(filtered_df))
-col2.metric("Avg Discount (%)", f"{filtered_df['discount_percent'].mean():.2f}")
-col3.metric("Avg Profit Margin (%)", f"{filtered_df['profit_margin_percent'].mean():.2f}")
-col4.metric("Total Discount Amount", f"₹ {filtered_df['discount_amount'].sum():,.0f}")
+    col1.metric("Total Orders", kpi.count)
+    col2.metric("Avg Discount (%)", f"{kpi.mean('discount_percent'):.2f}")
+    col3.metric("Avg Profit Margin (%)", f"{kpi.mean('profit_margin_percent'):.2f}")
+    col4.metric("Total Discount Amount", f"₹ {kpi.sum('discount_amount'):,.0f}")
 
 st.divider()
 
+# High-discount, low-margin orders are always drawn on top of the charts
+with profile.stage("flag", rows_in=len(selection)) as stage:
+    leakage = selection.flagged("discount_leakage", kpi)
+    stage.rows_out = len(leakage)
+
 # ---------------- VISUALIZATIONS ----------------
 st.subheader("📉 Discount Behavior Analysis")
 
+# Rendered charts are cached per page, filter state and dataset version
+chart_key = (
+    "discount_leakage",
+    range_index.normalize(slider_ranges),
+    snapshot.version,
+)
+
 col1, col2 = st.columns(2)
 
 # Discount vs Quantity
-with col1:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.scatterplot(
-        data=filtered_df,
+def draw_discount_vs_quantity(ax):
+    scatter(
+        ax,
+        selection,
         x="discount_percent",
         y="quantity_sold",
         alpha=0.6,
-        ax=ax
+        highlight=leakage
     )
     ax.set_title("Discount vs Quantity Sold")
-    st.pyplot(fig)
+
+with col1, profile.stage("render:discount_vs_quantity", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("discount_vs_quantity",), draw_discount_vs_quantity,
+        lambda: scatter_spec(
+            selection, "discount_percent", "quantity_sold",
+            "Discount vs Quantity Sold", highlight=leakage
+        ),
+    )
 
 # Discount vs Profit Margin
-with col2:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.scatterplot(
-        data=filtered_df,
+def draw_discount_vs_margin(ax):
+    scatter(
+        ax,
+        selection,
         x="discount_percent",
         y="profit_margin_percent",
         alpha=0.6,
-        ax=ax
+        highlight=leakage
     )
     ax.set_title("Discount vs Profit Margin")
-    st.pyplot(fig)
+
+with col2, profile.stage("render:discount_vs_margin", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("discount_vs_margin",), draw_discount_vs_margin,
+        lambda: scatter_spec(
+            selection, "discount_percent", "profit_margin_percent",
+            "Discount vs Profit Margin", highlight=leakage
+        ),
+    )
 
 st.divider()
 
 # ---------------- LEAKAGE DETECTION ----------------
 st.subheader("🚨 High Discount – Low Profit Orders")
 
-leakage_df = filtered_df[
-    (filtered_df["discount_percent"] > 30) &
-    (filtered_df["profit_margin_percent"] < 5)
-]
+st.write(f"Orders with **high discount (>30%) & low profit (<5%)**: **{len(leakage)}**")
 
-st.write(f"Orders with **high discount (>30%) & low profit (<5%)**: **{len(leakage_df)}**")
+result_table(
+    leakage,
+    [
+        "order_id",
+        "discount_percent",
+        "discount_amount",
+        "revenue",
+        "profit_margin_percent",
+    ],
+    key="discount_leakage_flagged",
+    file_name="discount_leakage_flagged",
+    results=results,
+    cache_key=chart_key,
+)
+
+st.divider()
+
+# ---------------- SEGMENT OUTLIERS ----------------
+st.subheader("🎯 Segment Outliers")
+
+# Orders are scored against their own product category x region x sales
+# channel segment (robust z from the segment median and MAD), so a
+# discount that is routine in one segment still stands out in another.
+# Only the count and the most extreme orders, by whichever of the two
+# scores is further out, are kept per filter set and data version
+with profile.stage("score", rows_in=len(selection)) as stage:
+    outlier_count, worst = results.get(
+        chart_key + ("outliers",),
+        lambda: segment_scores.outliers(
+            selection.batches(),
+            ["discount_percent", "profit_margin_percent"],
+        ),
+    )
+    stage.rows_out = outlier_count
+
+st.write(
+    f"Orders more than **2 robust standard deviations** from their "
+    f"segment's discount or margin: **{outlier_count}**"
+)
 
 st.dataframe(
-    leakage_df[
+    worst[
         [
             "order_id",
+            "product_category",
+            "region",
+            "sales_channel",
             "discount_percent",
-            "discount_amount",
-            "revenue",
-            "profit_margin_percent"
+            "discount_percent_z",
+            "profit_margin_percent",
+            "profit_margin_percent_z",
         ]
-    ].head(10),
-    use_container_width=True
+    ],
+    width="stretch"
+)
+
+st.divider()
+
+# ---------------- DISCOUNT CAP WHAT-IF ----------------
+st.subheader("🧪 Discount Cap What-If")
+
+# Every cap of the grid on each category x channel segment alone and on
+# all of them at once, recomputed over the filtered orders in one pass and
+# kept per filter set and data version
+with profile.stage("simulate", rows_in=len(selection)) as stage:
+    caps_grid = results.get(
+        chart_key + ("caps_grid", tuple(DEFAULT_CAPS)),
+        lambda: cap_grid(selection.batches(), DEFAULT_CAPS),
+    )
+    stage.rows_out = len(caps_grid)
+
+overall = caps_grid[caps_grid["product_category"] == ALL_SEGMENTS].set_index("cap")
+st.line_chart(overall["recovered_profit"], x_label="Discount cap (%)",
+              y_label="Recovered profit")
+
+cap = st.select_slider(
+    "Cap to inspect (%)",
+    options=[int(c) for c in DEFAULT_CAPS],
+    value=30,
+    key="discount_cap_whatif",
+)
+chosen = overall.loc[float(cap)]
+
+c1, c2, c3 = st.columns(3)
+c1.metric("Recovered Profit", f"₹ {chosen['recovered_profit']:,.0f}")
+c2.metric("Profit / Net Revenue (%)", f"{chosen['profit_margin_percent']:.2f}")
+c3.metric("Leakage Orders Left", f"{int(chosen['leakage_orders']):,}")
+
+# Profit each segment recovers when capped on its own
+by_segment = caps_grid[
+    (caps_grid["product_category"] != ALL_SEGMENTS)
+    & (caps_grid["cap"] == cap)
+]
+st.dataframe(
+    by_segment.pivot(
+        index="product_category", columns="sales_channel",
+        values="recovered_profit",
+    ).style.format("₹ {:,.0f}"),
+    width="stretch"
+)
+
+st.caption(
+    "Quantities and prices are held fixed: a cap only lowers the discount "
+    "of the orders above it, so it may overstate what a cap would recover "
+    "if some of those orders would not have been placed."
 )
 
 st.divider()
@@ -162,3 +282,5 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+profile_panel(profile)
@@ -1,16 +1,30 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from leakage.data import load_figure_cache, load_result_cache, load_snapshot
+from leakage.instrument import Profiler
+from leakage.plots import scatter
+from leakage.vega import scatter_spec
+from leakage.widgets import chart, profile_panel, range_slider, result_table
 
 st.set_page_config(page_title="Inventory Leakage Analysis", layout="wide")
+profile = Profiler("inventory_leakage")
+
+# Every column this page shows, charts or flags on.
+PAGE_COLUMNS = [
+    "product_id",
+    "inventory_level",
+    "reorder_level",
+    "holding_cost",
+    "supplier_delay_days",
+]
 
 # ---------------- LOAD DATA ----------------
-@st.cache_data
-def load_data():
-    return pd.read_csv("data/processed/profit_leakage_cleaned.csv")
-
-df = load_data()
+with profile.stage("load") as stage:
+    snapshot = load_snapshot()
+    range_index = snapshot.range_index
+    figures = load_figure_cache()
+    results = load_result_cache()
+    stage.rows_out = len(range_index)
 
 # ---------------- PAGE TITLE ----------------
 st.title("📦 Inventory Leakage Analysis")
@@ -26,112 +40,118 @@ st.divider()
 # ---------------- SIDEBAR FILTERS ----------------
 st.sidebar.header("🔎 Inventory Filters")
 
-inventory_range = st.sidebar.slider(
-    "Inventory Level",
-    int(df["inventory_level"].min()),
-    int(df["inventory_level"].max()),
-    (
-        int(df["inventory_level"].min()),
-        int(df["inventory_level"].max())
-    )
-)
+inventory_range = range_slider(range_index, "inventory_level", "Inventory Level")
 
-holding_cost_range = st.sidebar.slider(
-    "Holding Cost",
-    float(df["holding_cost"].min()),
-    float(df["holding_cost"].max()),
-    (
-        float(df["holding_cost"].min()),
-        float(df["holding_cost"].max())
-    )
-)
+holding_cost_range = range_slider(range_index, "holding_cost", "Holding Cost")
 
-supplier_delay_range = st.sidebar.slider(
-    "Supplier Delay (Days)",
-    int(df["supplier_delay_days"].min()),
-    int(df["supplier_delay_days"].max()),
-    (
-        int(df["supplier_delay_days"].min()),
-        int(df["supplier_delay_days"].max())
-    )
-)
+supplier_delay_range = range_slider(range_index, "supplier_delay_days", "Supplier Delay (Days)")
 
 # ---------------- APPLY FILTERS ----------------
-filtered_df = df[
-    (df["inventory_level"] >= inventory_range[0]) &
-    (df["inventory_level"] <= inventory_range[1]) &
-    (df["holding_cost"] >= holding_cost_range[0]) &
-    (df["holding_cost"] <= holding_cost_range[1]) &
-    (df["supplier_delay_days"] >= supplier_delay_range[0]) &
-    (df["supplier_delay_days"] <= supplier_delay_range[1])
-]
+slider_ranges = {
+    "inventory_level": inventory_range,
+    "holding_cost": holding_cost_range,
+    "supplier_delay_days": supplier_delay_range,
+}
+with profile.stage("filter", rows_in=len(range_index)) as stage:
+    selection = snapshot.select(slider_ranges, PAGE_COLUMNS)
+    stage.rows_out = len(selection)
 
 # ---------------- KPI METRICS ----------------
 st.subheader("📊 Inventory KPIs")
 
-col1, col2, col3, col4 = st.columns(4)
+# KPI tiles are answered from the pre-aggregated cube while no slider
+# narrows the data (product count is then a HyperLogLog estimate)
+with profile.stage("kpi", rows_in=len(selection)):
+    kpi = selection.summary() if selection.narrowed else snapshot.cube.query()
+
+    col1, col2, col3, col4 = st.columns(4)
 
-col1.metric("Total Products", filtered_df["product_id"].nunique())
-col2.metric("Avg Inventory Level", int(filtered_df["inventory_level"].mean()))
-col3.metric("Avg Holding Cost", f"₹ {filtered_df['holding_cost'].mean():,.0f}")
-col4.metric("Avg Supplier Delay", f"{filtered_df['supplier_delay_days'].mean():.1f} days")
+    col1.metric("Total Products", kpi.distinct("product_id"))
+    col2.metric("Avg Inventory Level", int(kpi.mean("inventory_level")))
+    col3.metric("Avg Holding Cost", f"₹ {kpi.mean('holding_cost'):,.0f}")
+    col4.metric("Avg Supplier Delay", f"{kpi.mean('supplier_delay_days'):.1f} days")
 
 st.divider()
 
+# Overstocked or high holding-cost records are always drawn on top of the charts
+with profile.stage("flag", rows_in=len(selection)) as stage:
+    leakage = selection.flagged("inventory_leakage", kpi)
+    stage.rows_out = len(leakage)
+
 # ---------------- VISUALIZATIONS ----------------
 st.subheader("📉 Inventory Risk Patterns")
 
+# Rendered charts are cached per page, filter state and dataset version
+chart_key = (
+    "inventory_leakage",
+    range_index.normalize(slider_ranges),
+    snapshot.version,
+)
+
 col1, col2 = st.columns(2)
 
 # Inventory vs Holding Cost
-with col1:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.scatterplot(
-        data=filtered_df,
+def draw_inventory_vs_holding_cost(ax):
+    scatter(
+        ax,
+        selection,
         x="inventory_level",
         y="holding_cost",
         alpha=0.6,
-        ax=ax
+        highlight=leakage
     )
     ax.set_title("Inventory Level vs Holding Cost")
-    st.pyplot(fig)
+
+with col1, profile.stage("render:inventory_vs_holding_cost", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("inventory_vs_holding_cost",), draw_inventory_vs_holding_cost,
+        lambda: scatter_spec(
+            selection, "inventory_level", "holding_cost",
+            "Inventory Level vs Holding Cost", highlight=leakage
+        ),
+    )
 
 # Supplier Delay vs Inventory
-with col2:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.scatterplot(
-        data=filtered_df,
+def draw_supplier_delay_vs_inventory(ax):
+    scatter(
+        ax,
+        selection,
         x="supplier_delay_days",
         y="inventory_level",
         alpha=0.6,
-        ax=ax
+        highlight=leakage
     )
     ax.set_title("Supplier Delay vs Inventory Level")
-    st.pyplot(fig)
+
+with col2, profile.stage("render:supplier_delay_vs_inventory", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("supplier_delay_vs_inventory",), draw_supplier_delay_vs_inventory,
+        lambda: scatter_spec(
+            selection, "supplier_delay_days", "inventory_level",
+            "Supplier Delay vs Inventory Level", highlight=leakage
+        ),
+    )
 
 st.divider()
 
 # ---------------- LEAKAGE IDENTIFICATION ----------------
 st.subheader("🚨 Inventory Leakage Indicators")
 
-leakage_df = filtered_df[
-    (filtered_df["inventory_level"] > filtered_df["reorder_level"] * 2) |
-    (filtered_df["holding_cost"] > filtered_df["holding_cost"].quantile(0.75))
-]
-
-st.write(f"⚠️ Potential Inventory Leakage Records: **{len(leakage_df)}**")
-
-st.dataframe(
-    leakage_df[
-        [
-            "product_id",
-            "inventory_level",
-            "reorder_level",
-            "holding_cost",
-            "supplier_delay_days"
-        ]
-    ].head(10),
-    use_container_width=True
+st.write(f"⚠️ Potential Inventory Leakage Records: **{len(leakage)}**")
+
+result_table(
+    leakage,
+    [
+        "product_id",
+        "inventory_level",
+        "reorder_level",
+        "holding_cost",
+        "supplier_delay_days",
+    ],
+    key="inventory_leakage_flagged",
+    file_name="inventory_leakage_flagged",
+    results=results,
+    cache_key=chart_key,
 )
 
 st.divider()
@@ -162,3 +182,5 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+profile_panel(profile)
@@ -1,17 +1,32 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
+
+from leakage.data import load_figure_cache, load_result_cache, load_snapshot
+from leakage.instrument import Profiler
+from leakage.plots import histogram, scatter
+from leakage.vega import histogram_spec, scatter_spec
+from leakage.widgets import (
+    chart, entity_multiselect, profile_panel, range_slider, result_table
+)
 
 st.set_page_config(page_title="Payment Delay Analysis", layout="wide")
+profile = Profiler("payment_delays")
+
+# Every column this page shows, charts or flags on.
+PAGE_COLUMNS = [
+    "order_id",
+    "customer_id",
+    "payment_delay_days",
+    "outstanding_amount",
+]
 
 # ---------------- LOAD DATA ----------------
-@st.cache_data
-def load_data():
-    return pd.read_csv("data/processed/profit_leakage_cleaned.csv")
-
-df = load_data()
+with profile.stage("load") as stage:
+    snapshot = load_snapshot()
+    range_index = snapshot.range_index
+    customer_index = snapshot.entity_indexes["customer_id"]
+    figures = load_figure_cache()
+    results = load_result_cache()
+    stage.rows_out = len(range_index)
 
 # ---------------- PAGE TITLE ----------------
 st.title("💳 Payment Delay Analysis")
@@ -27,95 +42,129 @@ st.divider()
 # ---------------- SIDEBAR FILTERS ----------------
 st.sidebar.header("🔎 Payment Filters")
 
-payment_delay_range = st.sidebar.slider(
-    "Payment Delay (Days)",
-    int(df["payment_delay_days"].min()),
-    int(df["payment_delay_days"].max()),
-    (int(df["payment_delay_days"].min()), int(df["payment_delay_days"].max()))
-)
+payment_delay_range = range_slider(range_index, "payment_delay_days", "Payment Delay (Days)")
 
-outstanding_range = st.sidebar.slider(
-    "Outstanding Amount",
-    float(df["outstanding_amount"].min()),
-    float(df["outstanding_amount"].max()),
-    (float(df["outstanding_amount"].min()), float(df["outstanding_amount"].max()))
-)
+outstanding_range = range_slider(range_index, "outstanding_amount", "Outstanding Amount")
 
 # Optional filter by customer
-customers = st.sidebar.multiselect(
-    "Select Customers",
-    options=df["customer_id"].unique(),
-    default=df["customer_id"].unique()[:5]
-)
+customers = entity_multiselect(customer_index, "Customers", "customer_id")
 
 # ---------------- APPLY FILTERS ----------------
-filtered_df = df[
-    (df["payment_delay_days"] >= payment_delay_range[0]) & (df["payment_delay_days"] <= payment_delay_range[1]) &
-    (df["outstanding_amount"] >= outstanding_range[0]) & (df["outstanding_amount"] <= outstanding_range[1])
-]
-
-if customers:
-    filtered_df = filtered_df[filtered_df["customer_id"].isin(customers)]
+slider_ranges = {
+    "payment_delay_days": payment_delay_range,
+    "outstanding_amount": outstanding_range,
+}
+# Selected ids gather their rows from the lookup index (or become an id
+# predicate under the scan backend), never a frame scan
+with profile.stage("filter", rows_in=len(range_index)) as stage:
+    selection = snapshot.select(
+        slider_ranges, PAGE_COLUMNS, {"customer_id": customers}
+    )
+    stage.rows_out = len(selection)
 
 # ---------------- KPI METRICS ----------------
 st.subheader("📊 Payment Delay KPIs")
 
-col1, col2, col3, col4 = st.columns(4)
+# KPI tiles are answered from the pre-aggregated cube while no filter
+# narrows the data (customer count is then a HyperLogLog estimate)
+with profile.stage("kpi", rows_in=len(selection)):
+    if not selection.narrowed:
+        kpi = snapshot.cube.query()
+    else:
+        kpi = selection.summary()
+
+    col1, col2, col3, col4 = st.columns(4)
 
-col1.metric("Total Customers", filtered_df["customer_id"].nunique())
-col2.metric("Total Outstanding", f"₹ {filtered_df['outstanding_amount'].sum():,.0f}")
-col3.metric("Avg Payment Delay", f"{filtered_df['payment_delay_days'].mean():.1f} days")
-col4.metric("Max Payment Delay", f"{filtered_df['payment_delay_days'].max()} days")
+    col1.metric("Total Customers", kpi.distinct("customer_id"))
+    col2.metric("Total Outstanding", f"₹ {kpi.sum('outstanding_amount'):,.0f}")
+    col3.metric("Avg Payment Delay", f"{kpi.mean('payment_delay_days'):.1f} days")
+    col4.metric("Max Payment Delay", f"{kpi.max('payment_delay_days')} days")
 
 st.divider()
 
+# Define high risk: top 25% delays or outstanding
+with profile.stage("flag", rows_in=len(selection)) as stage:
+    payment_risk = selection.flagged("payment_delays", kpi)
+    stage.rows_out = len(payment_risk)
+
 # ---------------- VISUALIZATIONS ----------------
 st.subheader("📈 Payment Patterns")
 
+# Rendered charts are cached per page, filter state and dataset version
+chart_key = (
+    "payment_delays",
+    range_index.normalize(slider_ranges) + (tuple(sorted(customers)),),
+    snapshot.version,
+)
+
 col1, col2 = st.columns(2)
 
 # Payment Delay vs Outstanding Amount
-with col1:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.scatterplot(
-        data=filtered_df,
+def draw_delay_vs_outstanding(ax):
+    scatter(
+        ax,
+        selection,
         x="payment_delay_days",
         y="outstanding_amount",
         alpha=0.6,
-        ax=ax
+        highlight=payment_risk
     )
     ax.set_title("Payment Delay vs Outstanding Amount")
-    st.pyplot(fig)
+
+with col1, profile.stage("render:delay_vs_outstanding", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("delay_vs_outstanding",), draw_delay_vs_outstanding,
+        lambda: scatter_spec(
+            selection, "payment_delay_days", "outstanding_amount",
+            "Payment Delay vs Outstanding Amount", highlight=payment_risk
+        ),
+    )
 
 # Histogram of Payment Delays
-with col2:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.histplot(filtered_df["payment_delay_days"], bins=30, kde=True, color="orange", ax=ax)
+def draw_delay_distribution(ax):
+    histogram(ax, selection, "payment_delay_days", bins=30, kde=True, color="orange")
     ax.set_title("Payment Delay Distribution")
-    st.pyplot(fig)
+
+with col2, profile.stage("render:delay_distribution", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("delay_distribution",), draw_delay_distribution,
+        lambda: histogram_spec(
+            selection, "payment_delay_days", "Payment Delay Distribution",
+            color="orange"
+        ),
+    )
 
 # ---------------- LEAKAGE IDENTIFICATION ----------------
 st.subheader("🚨 Payment Delay Leakage Indicators")
 
-# Define high risk: top 25% delays or outstanding
-filtered_df["payment_risk_flag"] = np.where(
-    (filtered_df["payment_delay_days"] > filtered_df["payment_delay_days"].quantile(0.75)) |
-    (filtered_df["outstanding_amount"] > filtered_df["outstanding_amount"].quantile(0.75)),
-    1, 0
-)
+st.write(f"⚠️ Potential Payment Delay Risk Records: **{len(payment_risk)}**")
 
-risk_df = filtered_df[filtered_df["payment_risk_flag"] == 1]
+result_table(
+    payment_risk,
+    [
+        "order_id",
+        "customer_id",
+        "outstanding_amount",
+        "payment_delay_days",
+    ],
+    key="payment_delays_flagged",
+    file_name="payment_delays_flagged",
+    results=results,
+    cache_key=chart_key,
+)
 
-st.write(f"⚠️ Potential Payment Delay Risk Records: **{len(risk_df)}**")
+# Entity ranking comes from the rollup maintained at ingest (all orders)
+st.subheader("👥 Worst Customers by Leakage")
 
 st.dataframe(
-    risk_df[[
-        "order_id",
+    snapshot.rollups["customer_id"].top_k(10)[[
         "customer_id",
-        "outstanding_amount",
-        "payment_delay_days"
-    ]].head(10),
-    use_container_width=True
+        "orders",
+        "outstanding",
+        "mean_payment_delay_days",
+        "leakage"
+    ]],
+    width="stretch"
 )
 
 st.divider()
@@ -147,3 +196,5 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+profile_panel(profile)
@@ -1,17 +1,34 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
+
+from leakage.data import load_figure_cache, load_result_cache, load_snapshot
+from leakage.instrument import Profiler
+from leakage.plots import histogram, scatter
+from leakage.vega import histogram_spec, scatter_spec
+from leakage.widgets import (
+    chart, entity_multiselect, profile_panel, range_slider, result_table
+)
 
 st.set_page_config(page_title="Returns & Refunds Analysis", layout="wide")
+profile = Profiler("returns_refunds")
+
+# Every column this page shows, charts or flags on.
+PAGE_COLUMNS = [
+    "order_id",
+    "customer_id",
+    "product_id",
+    "quantity_sold",
+    "refund_amount",
+]
 
 # ---------------- LOAD DATA ----------------
-@st.cache_data
-def load_data():
-    return pd.read_csv("data/processed/profit_leakage_cleaned.csv")
-
-df = load_data()
+with profile.stage("load") as stage:
+    snapshot = load_snapshot()
+    range_index = snapshot.range_index
+    customer_index = snapshot.entity_indexes["customer_id"]
+    product_index = snapshot.entity_indexes["product_id"]
+    figures = load_figure_cache()
+    results = load_result_cache()
+    stage.rows_out = len(range_index)
 
 # ---------------- PAGE TITLE ----------------
 st.title("🔄 Returns & Refunds Analysis")
@@ -27,104 +44,134 @@ st.divider()
 # ---------------- SIDEBAR FILTERS ----------------
 st.sidebar.header("🔎 Refund Filters")
 
-refund_range = st.sidebar.slider(
-    "Refund Amount",
-    float(df["refund_amount"].min()),
-    float(df["refund_amount"].max()),
-    (float(df["refund_amount"].min()), float(df["refund_amount"].max()))
-)
+refund_range = range_slider(range_index, "refund_amount", "Refund Amount")
 
-return_quantity_range = st.sidebar.slider(
-    "Quantity Returned",
-    int(df["quantity_sold"].min()),
-    int(df["quantity_sold"].max()),
-    (int(df["quantity_sold"].min()), int(df["quantity_sold"].max()))
-)
+return_quantity_range = range_slider(range_index, "quantity_sold", "Quantity Returned")
 
-customers = st.sidebar.multiselect(
-    "Select Customers",
-    options=df["customer_id"].unique(),
-    default=df["customer_id"].unique()[:5]
-)
+customers = entity_multiselect(customer_index, "Customers", "customer_id")
 
-products = st.sidebar.multiselect(
-    "Select Products",
-    options=df["product_id"].unique(),
-    default=df["product_id"].unique()[:5]
-)
+products = entity_multiselect(product_index, "Products", "product_id")
 
 # ---------------- APPLY FILTERS ----------------
-filtered_df = df[
-    (df["refund_amount"] >= refund_range[0]) & (df["refund_amount"] <= refund_range[1]) &
-    (df["quantity_sold"] >= return_quantity_range[0]) & (df["quantity_sold"] <= return_quantity_range[1])
-]
-
-if customers:
-    filtered_df = filtered_df[filtered_df["customer_id"].isin(customers)]
-
-if products:
-    filtered_df = filtered_df[filtered_df["product_id"].isin(products)]
+slider_ranges = {
+    "refund_amount": refund_range,
+    "quantity_sold": return_quantity_range,
+}
+# Selected ids gather their rows from the lookup index (or become an id
+# predicate under the scan backend), never a frame scan
+with profile.stage("filter", rows_in=len(range_index)) as stage:
+    selection = snapshot.select(
+        slider_ranges, PAGE_COLUMNS,
+        {"customer_id": customers, "product_id": products},
+    )
+    stage.rows_out = len(selection)
 
 # ---------------- KPI METRICS ----------------
 st.subheader("📊 Returns & Refund KPIs")
 
-col1, col2, col3, col4 = st.columns(4)
+# KPI tiles are answered from the pre-aggregated cube while no filter
+# narrows the data
+with profile.stage("kpi", rows_in=len(selection)):
+    if not selection.narrowed:
+        kpi = snapshot.cube.query()
+    else:
+        kpi = selection.summary()
 
-col1.metric("Total Orders Returned", filtered_df.shape[0])
-col2.metric("Total Refund Amount", f"₹ {filtered_df['refund_amount'].sum():,.0f}")
-col3.metric("Avg Refund Amount", f"₹ {filtered_df['refund_amount'].mean():,.0f}")
-col4.metric("Max Refund Amount", f"₹ {filtered_df['refund_amount'].max():,.0f}")
+    col1, col2, col3, col4 = st.columns(4)
+
+    col1.metric("Total Orders Returned", kpi.count)
+    col2.metric("Total Refund Amount", f"₹ {kpi.sum('refund_amount'):,.0f}")
+    col3.metric("Avg Refund Amount", f"₹ {kpi.mean('refund_amount'):,.0f}")
+    col4.metric("Max Refund Amount", f"₹ {kpi.max('refund_amount'):,.0f}")
 
 st.divider()
 
+# Flag high-risk refunds: top 25% by refund amount or return quantity
+with profile.stage("flag", rows_in=len(selection)) as stage:
+    return_risk = selection.flagged("returns_refunds", kpi)
+    stage.rows_out = len(return_risk)
+
 # ---------------- VISUALIZATIONS ----------------
 st.subheader("📈 Returns & Refund Patterns")
 
+# Rendered charts are cached per page, filter state and dataset version
+chart_key = (
+    "returns_refunds",
+    range_index.normalize(slider_ranges)
+    + (tuple(sorted(customers)), tuple(sorted(products))),
+    snapshot.version,
+)
+
 col1, col2 = st.columns(2)
 
 # Refund Amount vs Quantity Returned
-with col1:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.scatterplot(
-        data=filtered_df,
+def draw_quantity_vs_refund(ax):
+    scatter(
+        ax,
+        selection,
         x="quantity_sold",
         y="refund_amount",
         alpha=0.6,
-        ax=ax
+        highlight=return_risk
     )
     ax.set_title("Quantity Returned vs Refund Amount")
-    st.pyplot(fig)
+
+with col1, profile.stage("render:quantity_vs_refund", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("quantity_vs_refund",), draw_quantity_vs_refund,
+        lambda: scatter_spec(
+            selection, "quantity_sold", "refund_amount",
+            "Quantity Returned vs Refund Amount", highlight=return_risk
+        ),
+    )
 
 # Histogram of Refund Amount
-with col2:
-    fig, ax = plt.subplots(figsize=(6, 4))
-    sns.histplot(filtered_df["refund_amount"], bins=30, kde=True, color="red", ax=ax)
+def draw_refund_distribution(ax):
+    histogram(ax, selection, "refund_amount", bins=30, kde=True, color="red")
     ax.set_title("Refund Amount Distribution")
-    st.pyplot(fig)
+
+with col2, profile.stage("render:refund_distribution", rows_in=len(selection)):
+    chart(
+        figures, chart_key + ("refund_distribution",), draw_refund_distribution,
+        lambda: histogram_spec(
+            selection, "refund_amount", "Refund Amount Distribution",
+            color="red"
+        ),
+    )
 
 # ---------------- LEAKAGE IDENTIFICATION ----------------
 st.subheader("🚨 Refund & Returns Leakage Indicators")
 
-# Flag high-risk refunds: top 25% by refund amount or return quantity
-filtered_df["return_risk_flag"] = np.where(
-    (filtered_df["refund_amount"] > filtered_df["refund_amount"].quantile(0.75)) |
-    (filtered_df["quantity_sold"] > filtered_df["quantity_sold"].quantile(0.75)),
-    1, 0
-)
-
-risk_df = filtered_df[filtered_df["return_risk_flag"] == 1]
+st.write(f"⚠️ Potential Return & Refund Risk Records: **{len(return_risk)}**")
 
-st.write(f"⚠️ Potential Return & Refund Risk Records: **{len(risk_df)}**")
-
-st.dataframe(
-    risk_df[[
+result_table(
+    return_risk,
+    [
         "order_id",
         "customer_id",
         "product_id",
         "quantity_sold",
-        "refund_amount"
-    ]].head(10),
-    use_container_width=True
+        "refund_amount",
+    ],
+    key="returns_refunds_flagged",
+    file_name="returns_refunds_flagged",
+    results=results,
+    cache_key=chart_key,
+)
+
+# Entity ranking comes from the rollup maintained at ingest (all orders)
+st.subheader("📦 Worst Products by Leakage")
+
+st.dataframe(
+    snapshot.rollups["product_id"].top_k(10)[[
+        "product_id",
+        "orders",
+        "refunds",
+        "return_rate",
+        "margin_weighted_discount",
+        "leakage"
+    ]],
+    width="stretch"
 )
 
 st.divider()
@@ -156,3 +203,5 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+profile_panel(profile)
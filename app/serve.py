@@ -0,0 +1,28 @@
+"""Start the dashboard with a server that is warm before its first visitor.
+
+    python app/serve.py [streamlit run options]
+
+Same as ``streamlit run app/app.py``, but the dataset snapshot and every
+page's default view are loaded while the server boots (see
+:mod:`leakage.prewarm`), and the ``leakage`` loggers (prewarm timings,
+dataset refreshes) are shown on stderr.
+"""
+
+import logging
+import sys
+from pathlib import Path
+
+from streamlit.web import cli
+
+from leakage.prewarm import start_prewarm
+
+if __name__ == "__main__":
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s: %(message)s"))
+    logging.getLogger("leakage").addHandler(handler)
+    logging.getLogger("leakage").setLevel(logging.INFO)
+
+    start_prewarm()
+    sys.argv = ["streamlit", "run", str(Path(__file__).with_name("app.py")),
+                *sys.argv[1:]]
+    sys.exit(cli.main())
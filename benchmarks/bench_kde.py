@@ -0,0 +1,76 @@
+"""Accuracy check and speed benchmark for the binned FFT KDE.
+
+    python -m benchmarks.bench_kde --rows 1000000
+
+Compares ``leakage.kde.binned_kde`` with the exact Gaussian KDE on the
+dashboard's 30-bin histogram layout and exits non-zero if the largest
+deviation exceeds ``--max-error`` (relative to the peak density). The
+same bound is asserted at a fixed size by ``tests/test_kde.py``. The
+speedup is against the exact KDE on seaborn's 200-point grid, the
+evaluation the binned KDE replaced.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from app.leakage.kde import binned_kde, exact_kde, scott_bandwidth
+from app.leakage.plots import KDE_BINS_PER_BANDWIDTH
+
+# Points seaborn's KDE (``gridsize``), which the binned KDE replaced,
+# evaluates the exact kernel sum on.
+SEABORN_GRIDSIZE = 200
+
+
+def sample(rows, seed=0):
+    """Skewed, two-component sample shaped like ``profit_margin_percent``."""
+    rng = np.random.default_rng(seed)
+    tail = rows // 5
+    return np.concatenate([
+        rng.normal(25, 12, rows - tail),
+        -rng.exponential(150, tail),
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--bins", type=int, default=30)
+    parser.add_argument("--max-error", type=float, default=1e-3)
+    args = parser.parse_args(argv)
+
+    values = sample(args.rows)
+    low, high = values.min(), values.max()
+
+    start = time.perf_counter()
+    bandwidth = scott_bandwidth(len(values), values.std(ddof=1))
+    per_bin = (high - low) / args.bins / bandwidth
+    oversample = max(1, int(np.ceil(per_bin * KDE_BINS_PER_BANDWIDTH)))
+    counts, edges = np.histogram(values, bins=args.bins * oversample,
+                                 range=(low, high))
+    grid, binned = binned_kde(counts, edges, bandwidth)
+    binned_time = time.perf_counter() - start
+
+    # The exact KDE is timed on as many points as seaborn evaluated, taken
+    # from the binned grid so the two can also be compared there.
+    probe = np.unique(
+        np.linspace(0, len(grid) - 1, SEABORN_GRIDSIZE).round().astype(int)
+    )
+    start = time.perf_counter()
+    exact = exact_kde(values, grid[probe], bandwidth)
+    exact_time = time.perf_counter() - start
+
+    error = np.abs(binned[probe] - exact).max() / exact.max()
+    print(f"rows={args.rows:,} grid={len(grid)} bandwidth={bandwidth:.4g}")
+    print(f"binned FFT KDE ({len(grid)} points): {binned_time * 1000:.1f} ms")
+    print(f"exact KDE ({len(probe)} points, as seaborn): "
+          f"{exact_time * 1000:.1f} ms")
+    print(f"speedup: {exact_time / binned_time:.0f}x")
+    print(f"max relative error: {error:.2e} (limit {args.max_error:.0e})")
+    return 0 if error <= args.max_error else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,371 @@
+"""Scaling benchmark for the cleaning pipeline and every dashboard page.
+
+    python -m benchmarks.bench_scaling --rows 100000 1000000 --out bench.json
+
+At each scale a synthetic extract (:mod:`benchmarks.generate`) is cleaned
+with the pipeline and loaded the way the server loads it: ``export`` is
+the first process's column and index export (:func:`map_dataset`),
+``load`` the snapshot every later process builds by mapping it. Then,
+for each backend (``--backends``, ``memory`` and ``scan`` by default),
+each page's stages are timed the way the page runs them: filter (cold,
+and ``filter_cached`` for a rerun), KPI, leakage flag and chart render
+(matplotlib, and the Vega-Lite specs of ``LEAKAGE_CHARTS=vega`` as
+``render_vega``), plus the discount page's segment outlier ``score``
+and cap what-if ``simulate``. Pages are measured with their default
+filters (every slider open and the first ids preselected, as on a first
+visit) and with every slider narrowed to keep the middle 80% of its
+rows. Results are written as JSON, one record per ``(rows, backend,
+page, view, stage)``. Generated data is removed afterwards unless a
+``--workdir`` is given.
+
+With ``--baseline`` the run exits non-zero when any stage is more than
+``--max-slowdown`` times slower than in the baseline file (stages under
+``--min-seconds`` in both runs are ignored as noise).
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.leakage import pipeline
+from app.leakage.data import build_snapshot, dataset_version, map_dataset
+from app.leakage.figcache import FigureCache
+from app.leakage.plots import histogram, scatter
+from app.leakage.simulate import DEFAULT_CAPS, cap_grid
+from app.leakage.state import SelectionCache
+from app.leakage.vega import histogram_spec, scatter_spec
+from app.leakage.widgets import DEFAULT_SELECTED
+
+from .generate import generate
+
+DEFAULT_ROWS = [100_000, 1_000_000]
+BACKENDS = ["memory", "scan"]
+
+# What each page does on a rerun: its slider columns, the columns it reads
+# (its PAGE_COLUMNS), the id columns whose first ids it preselects, KPI
+# tiles, leakage module and charts (("scatter", x, y) or ("histogram",
+# column)), and for the discount page the columns scored against their
+# segment and the cap what-if.
+PAGES = {
+    "revenue_profit": {
+        "sliders": ["quantity_sold", "profit_margin_percent",
+                    "discount_percent", "revenue"],
+        "columns": ["order_id", "revenue", "cost", "discount_percent",
+                    "profit_margin_percent"],
+        "kpis": [("count",), ("sum", "revenue"), ("sum", "cost"),
+                 ("mean", "profit_margin_percent")],
+        "module": "revenue_profit",
+        "charts": [("scatter", "revenue", "cost"),
+                   ("histogram", "profit_margin_percent")],
+    },
+    "discount_leakage": {
+        "sliders": ["discount_percent", "quantity_sold",
+                    "profit_margin_percent"],
+        "columns": ["order_id", "discount_percent", "discount_amount",
+                    "revenue", "net_revenue", "profit", "quantity_sold",
+                    "profit_margin_percent", "product_category", "region",
+                    "sales_channel"],
+        "kpis": [("count",), ("mean", "discount_percent"),
+                 ("mean", "profit_margin_percent"), ("sum", "discount_amount")],
+        "module": "discount_leakage",
+        "charts": [("scatter", "discount_percent", "quantity_sold"),
+                   ("scatter", "discount_percent", "profit_margin_percent")],
+        "scores": ["discount_percent", "profit_margin_percent"],
+        "simulate": True,
+    },
+    "inventory_leakage": {
+        "sliders": ["inventory_level", "holding_cost", "supplier_delay_days"],
+        "columns": ["product_id", "inventory_level", "reorder_level",
+                    "holding_cost", "supplier_delay_days"],
+        "kpis": [("distinct", "product_id"), ("mean", "inventory_level"),
+                 ("mean", "holding_cost"), ("mean", "supplier_delay_days")],
+        "module": "inventory_leakage",
+        "charts": [("scatter", "inventory_level", "holding_cost"),
+                   ("scatter", "supplier_delay_days", "inventory_level")],
+    },
+    "payment_delays": {
+        "sliders": ["payment_delay_days", "outstanding_amount"],
+        "columns": ["order_id", "customer_id", "payment_delay_days",
+                    "outstanding_amount"],
+        "entities": ["customer_id"],
+        "kpis": [("distinct", "customer_id"), ("sum", "outstanding_amount"),
+                 ("mean", "payment_delay_days"), ("max", "payment_delay_days")],
+        "module": "payment_delays",
+        "charts": [("scatter", "payment_delay_days", "outstanding_amount"),
+                   ("histogram", "payment_delay_days")],
+    },
+    "returns_refunds": {
+        "sliders": ["refund_amount", "quantity_sold"],
+        "columns": ["order_id", "customer_id", "product_id", "quantity_sold",
+                    "refund_amount"],
+        "entities": ["customer_id", "product_id"],
+        "kpis": [("count",), ("sum", "refund_amount"),
+                 ("mean", "refund_amount"), ("max", "refund_amount")],
+        "module": "returns_refunds",
+        "charts": [("scatter", "quantity_sold", "refund_amount"),
+                   ("histogram", "refund_amount")],
+    },
+}
+
+
+def timed(fn, repeat, setup=None):
+    """Best wall time of ``repeat`` calls, and the last result.
+
+    ``setup``, when given, runs untimed before each call and its result
+    is passed to ``fn``.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def middle_ranges(frame, columns, share=0.8):
+    """Slider ranges keeping the middle ``share`` of each column's rows."""
+    tail = (1 - share) / 2
+    return {
+        col: tuple(frame[col].quantile([tail, 1 - tail]).tolist())
+        for col in columns
+    }
+
+
+def _kpis(summary, calls):
+    return [
+        getattr(summary, name) if name == "count"
+        else getattr(summary, name)(*args)
+        for name, *args in calls
+    ]
+
+
+def _draw(chart, rows, highlight):
+    kind, *cols = chart
+    if kind == "scatter":
+        return lambda ax: scatter(ax, rows, x=cols[0], y=cols[1],
+                                  highlight=highlight)
+    return lambda ax: histogram(ax, rows, cols[0], bins=30, kde=True)
+
+
+def _vega(chart, rows, highlight):
+    kind, *cols = chart
+    if kind == "scatter":
+        return scatter_spec(rows, cols[0], cols[1], kind, highlight=highlight)
+    return histogram_spec(rows, cols[0], kind, bins=30, kde=True)
+
+
+def bench_page(name, spec, snapshot, filtered_ranges, repeat):
+    """Stage timings of one page, for the default and the filtered view.
+
+    Both views go through :meth:`Snapshot.select` like the page, with its
+    columns and its preselected ids. Every stage but ``filter_cached``
+    starts from an empty selection cache, as the first visitor of a
+    filter set does.
+    """
+    index, cube = snapshot.range_index, snapshot.cube
+    entities = {
+        col: snapshot.entity_indexes[col].first(DEFAULT_SELECTED)
+        for col in spec.get("entities", [])
+    }
+    records = []
+    figures = FigureCache(max_bytes=0)  # always render, never serve a hit
+    for view in ["default", "filtered"]:
+        ranges = {col: index.bounds(col) for col in spec["sliders"]}
+        if view == "filtered":
+            ranges = filtered_ranges
+
+        def cold():
+            return replace(snapshot, selections=SelectionCache())
+
+        def select(snap):
+            selection = snap.select(ranges, spec["columns"], entities)
+            len(selection)
+            return selection
+
+        def summarize(selection):
+            summary = (selection.summary() if selection.narrowed
+                       else cube.query())
+            _kpis(summary, spec["kpis"])
+            return summary
+
+        filter_s, selection = timed(select, repeat, cold)
+        select(snapshot)  # a rerun finds the rows in the snapshot's cache
+        cached_s, _ = timed(lambda: select(snapshot), repeat)
+        kpi_s, summary = timed(summarize, repeat, lambda: select(cold()))
+
+        def flagged(selection):
+            flagged = selection.flagged(spec["module"], summary)
+            len(flagged)
+            return flagged
+
+        flag_s, highlight = timed(flagged, repeat, lambda: select(cold()))
+        render_s, _ = timed(lambda: [
+            figures.render((name, i), _draw(chart, selection, highlight))
+            for i, chart in enumerate(spec["charts"])
+        ], repeat)
+        vega_s, _ = timed(lambda: [
+            _vega(chart, selection, highlight) for chart in spec["charts"]
+        ], repeat)
+
+        stages = [("filter", filter_s), ("filter_cached", cached_s),
+                  ("kpi", kpi_s), ("flag", flag_s), ("render", render_s),
+                  ("render_vega", vega_s)]
+        if "scores" in spec:
+            seconds, _ = timed(lambda: snapshot.segment_scores.outliers(
+                selection.batches(), spec["scores"]
+            ), repeat)
+            stages.append(("score", seconds))
+        if spec.get("simulate"):
+            seconds, _ = timed(
+                lambda: cap_grid(selection.batches(), DEFAULT_CAPS), repeat
+            )
+            stages.append(("simulate", seconds))
+
+        for stage, seconds in stages:
+            records.append({
+                "page": name, "view": view, "stage": stage,
+                "seconds": seconds, "rows_in": len(index),
+                "rows_out": len(selection),
+            })
+    return records
+
+
+def bench_scale(rows, workdir, repeat, seed=0, backends=BACKENDS):
+    raw = workdir / f"raw_{rows}.csv"
+    if not raw.exists():
+        generate(rows, raw, seed)
+    dataset = workdir / f"cleaned_{rows}.parquet"
+
+    records = []
+
+    def record(stage, seconds, backend="*", rows_out=rows):
+        records.append({
+            "backend": backend, "page": "*", "view": "*", "stage": stage,
+            "seconds": seconds, "rows_in": rows, "rows_out": rows_out,
+        })
+
+    seconds, _ = timed(lambda: pipeline.run(raw, dataset), 1)
+    record("pipeline", seconds)
+
+    # A fresh column directory per run, so the first map is a cold export
+    version = dataset_version(dataset)
+    column_dir = Path(tempfile.mkdtemp(prefix="columns-", dir=workdir))
+    try:
+        seconds, (frame, _) = timed(
+            lambda: map_dataset(dataset, column_dir=column_dir, version=version),
+            1,
+        )
+        record("export", seconds, "memory")
+        # Same filtered view under every backend
+        filtered = {
+            name: middle_ranges(frame, spec["sliders"])
+            for name, spec in PAGES.items()
+        }
+        del frame
+
+        for backend in backends:
+            seconds, snapshot = timed(
+                lambda: build_snapshot(version, dataset, backend, column_dir),
+                repeat,
+            )
+            record("load", seconds, backend)
+            for name, spec in PAGES.items():
+                page = bench_page(name, spec, snapshot, filtered[name], repeat)
+                for item in page:
+                    item["backend"] = backend
+                records.extend(page)
+            del snapshot
+    finally:
+        shutil.rmtree(column_dir, ignore_errors=True)
+    for item in records:
+        item["rows"] = rows
+    return records
+
+
+def regressions(results, baseline, max_slowdown, min_seconds):
+    """Records that got slower than ``max_slowdown`` times their baseline."""
+    def key(item):
+        # Results from before backends were recorded are all in memory
+        backend = item.get("backend", "*" if item["page"] == "*" else "memory")
+        return (item["rows"], backend, item["page"], item["view"],
+                item["stage"])
+
+    before = {key(item): item["seconds"] for item in baseline["results"]}
+    slower = []
+    for item in results:
+        old = before.get(key(item))
+        if old is None or max(old, item["seconds"]) < min_seconds:
+            continue
+        if item["seconds"] > old * max_slowdown:
+            slower.append((key(item), old, item["seconds"]))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="dataset sizes to benchmark")
+    parser.add_argument("--out", type=Path, default=Path("bench_scaling.json"),
+                        help="JSON results file")
+    parser.add_argument("--workdir", type=Path, default=None,
+                        help="where generated data is kept (reused if present)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per stage; the best time is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS,
+                        default=BACKENDS, help="snapshot backends to time")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="earlier results file to compare against")
+    parser.add_argument("--max-slowdown", type=float, default=1.5)
+    parser.add_argument("--min-seconds", type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="leakage-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    results = []
+    try:
+        for rows in args.rows:
+            scale = bench_scale(rows, workdir, args.repeat, args.seed,
+                                args.backends)
+            results.extend(scale)
+            for item in scale:
+                print(f"{rows:>11,} {item['backend']:<6} {item['page']:<18} "
+                      f"{item['view']:<8} {item['stage']:<13} "
+                      f"{item['seconds'] * 1000:10.1f} ms")
+    finally:
+        # Generated data is only kept in a --workdir
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    args.out.write_text(json.dumps({
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+    }, indent=1))
+    print(f"results written to {args.out}")
+
+    if args.baseline is None:
+        return 0
+    slower = regressions(results, json.loads(args.baseline.read_text()),
+                         args.max_slowdown, args.min_seconds)
+    for (rows, backend, page, view, stage), old, new in slower:
+        print(f"REGRESSION rows={rows:,} {backend} {page}/{view}/{stage}: "
+              f"{old * 1000:.1f} ms -> {new * 1000:.1f} ms")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def slider_frame():
+    """Rounded float32 slider columns, like the cleaned dataset's, plus an int one."""
+    rng = np.random.default_rng(0)
+    rows = 20_000
+    return pd.DataFrame({
+        "profit_margin_percent": rng.normal(20, 15, rows).round(1)
+                                    .astype(np.float32),
+        "holding_cost": rng.uniform(0, 500, rows).round(1).astype(np.float32),
+        "quantity_sold": rng.integers(1, 50, rows),
+    })
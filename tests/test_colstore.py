@@ -0,0 +1,40 @@
+"""Retirement of superseded exports and dataset versions."""
+
+import os
+import time
+
+from app.leakage.colstore import prune_versions
+
+
+def make_versions(root, ages):
+    """Create one directory per ``{name: age in seconds}``."""
+    now = time.time()
+    for name, age in ages.items():
+        (root / name).mkdir()
+        os.utime(root / name, (now - age, now - age))
+
+
+def remaining(root):
+    return sorted(path.name for path in root.iterdir())
+
+
+def test_prune_keeps_recently_superseded(tmp_path):
+    # v3 replaced v2 ten seconds ago, v2 replaced v1 an hour ago.
+    ages = {"v0": 7200, "v1": 5400, "v2": 3600, "v3": 10}
+    (tmp_path / "short").mkdir()
+    make_versions(tmp_path / "short", ages)
+    prune_versions(tmp_path / "short", "v3", grace=60)
+    assert remaining(tmp_path / "short") == ["v2", "v3"]
+
+    # With a longer grace v1 was superseded recently enough to stay.
+    (tmp_path / "long").mkdir()
+    make_versions(tmp_path / "long", ages)
+    prune_versions(tmp_path / "long", "v3", grace=4000)
+    assert remaining(tmp_path / "long") == ["v1", "v2", "v3"]
+
+
+def test_prune_keeps_newer_than_current(tmp_path):
+    # A process still on v1 must not delete v2, published after it.
+    make_versions(tmp_path, {"v0": 7200, "v1": 3600, "v2": 10})
+    prune_versions(tmp_path, "v1", keep=0)
+    assert remaining(tmp_path) == ["v1", "v2"]
@@ -0,0 +1,28 @@
+"""Slider filters keep the same rows as ``Series.between``."""
+
+import numpy as np
+
+from app.leakage.filters import RangeIndex
+
+
+def expected(df, ranges):
+    keep = np.ones(len(df), dtype=bool)
+    for col, (low, high) in ranges.items():
+        keep &= df[col].between(low, high).to_numpy()
+    return np.flatnonzero(keep)
+
+
+def test_float32_bounds_between_neighbours(slider_frame):
+    df = slider_frame
+    index = RangeIndex(df, columns=list(df.columns))
+    # 23.7 and 100.1 are not float32 values: each lies between two float32
+    # neighbours, and rows rounded to one of them sit on the boundary.
+    for ranges in [
+        {"profit_margin_percent": (-50, 23.7)},
+        {"holding_cost": (100.1, 200.3)},
+        {"profit_margin_percent": (-50, 23.7), "holding_cost": (100.1, 200.3)},
+        {"profit_margin_percent": (10.1, 10.3), "holding_cost": (0.1, 499.9)},
+        {"profit_margin_percent": (-90.0, 90.0), "holding_cost": (250.3, 250.7)},
+        {"quantity_sold": (2.5, 10.5), "holding_cost": (100.1, 400.3)},
+    ]:
+        np.testing.assert_array_equal(index.select(ranges), expected(df, ranges))
@@ -0,0 +1,48 @@
+"""Accuracy of the binned FFT KDE against the exact Gaussian KDE.
+
+Timing lives in ``benchmarks/bench_kde.py``; this only pins the error on a
+fixed sample.
+"""
+
+import numpy as np
+
+from app.leakage.kde import binned_kde, exact_kde, scott_bandwidth
+from app.leakage.plots import KDE_BINS_PER_BANDWIDTH, histogram_bins
+from benchmarks.bench_kde import sample
+
+ROWS = 20_000
+# Largest deviation, relative to the peak density.
+MAX_ERROR = 1e-3
+
+
+def relative_error(approx, exact):
+    return np.abs(approx - exact).max() / exact.max()
+
+
+def test_binned_kde_matches_exact():
+    values = sample(ROWS)
+    bandwidth = scott_bandwidth(len(values), values.std(ddof=1))
+    bins = int(np.ceil(np.ptp(values) / bandwidth * KDE_BINS_PER_BANDWIDTH))
+    counts, edges = np.histogram(values, bins=bins)
+
+    grid, density = binned_kde(counts, edges, bandwidth)
+
+    assert relative_error(density, exact_kde(values, grid, bandwidth)) < MAX_ERROR
+    # Riemann sum over the grid; the tails beyond it are negligible.
+    assert abs(density.sum() * (edges[1] - edges[0]) - 1) < 1e-2
+
+
+def test_histogram_curve_matches_exact():
+    values = sample(ROWS)
+    edges, counts, centres, curve = histogram_bins(values, bins=30)
+
+    assert counts.sum() == len(values)
+    bandwidth = scott_bandwidth(len(values), values.std(ddof=1))
+    exact = exact_kde(values, centres, bandwidth) * len(values) * (edges[1] - edges[0])
+    assert relative_error(curve, exact) < MAX_ERROR
+
+
+def test_binned_kde_empty():
+    counts, edges = np.histogram([], bins=10, range=(0, 1))
+    grid, density = binned_kde(counts, edges, 0.1)
+    assert len(grid) == 10 and not density.any()
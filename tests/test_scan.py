@@ -0,0 +1,29 @@
+"""The scan backend selects the same rows as the in-memory range index."""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.leakage.filters import RangeIndex
+from app.leakage.scan import DatasetScanner
+
+
+def test_scan_matches_memory(tmp_path, slider_frame):
+    df = slider_frame
+    dataset = tmp_path / "dataset.parquet"
+    dataset.mkdir()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False),
+                   dataset / "part-0.parquet", row_group_size=4096)
+
+    index = RangeIndex(df, columns=list(df.columns))
+    scanner = DatasetScanner(dataset)
+    for ranges in [
+        {"profit_margin_percent": (-50, 23.7), "quantity_sold": (2.5, 30)},
+        {"profit_margin_percent": (10.1, 10.3), "holding_cost": (100.1, 200.3)},
+    ]:
+        rows = index.select(ranges)
+        assert scanner.count(scanner.predicate(ranges)) == len(rows)
+        np.testing.assert_array_equal(
+            scanner.read(ranges, ["holding_cost"])["holding_cost"].to_numpy(),
+            df["holding_cost"].to_numpy()[rows],
+        )